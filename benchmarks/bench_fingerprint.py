@@ -0,0 +1,67 @@
+"""
+Benchmark the discovery change check for a large set of containers.
+
+Compares a DeepDiff of the whole parsed object (previous change check) with the
+per-container fingerprints computed by ProcessorInterface.
+
+Usage:
+    uv run python benchmarks/bench_fingerprint.py [--containers 3000] [--cycles 5]
+"""
+
+import argparse
+import copy
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from deepdiff import DeepDiff  # noqa: E402
+
+from processor import ProcessorInterface  # noqa: E402
+
+
+def build_parsed_object(containers):
+    parsed_object = {}
+    for i in range(containers):
+        ip = f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"
+        parsed_object[ip] = {
+            "easyhaproxy.http.host": f"host{i}.example.org",
+            "easyhaproxy.http.port": "80",
+            "easyhaproxy.http.localport": "8080",
+            "com.docker.compose.project": "bench",
+            "com.docker.compose.service": f"service{i}",
+        }
+    return parsed_object
+
+
+def fingerprints(parsed_object):
+    return {key: ProcessorInterface.fingerprint(labels) for key, labels in parsed_object.items()}
+
+
+def measure(label, cycles, func):
+    timings = []
+    for _ in range(cycles):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    print(f"{label:<32} min {min(timings) * 1000:9.2f} ms   avg {sum(timings) / len(timings) * 1000:9.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--containers", type=int, default=3000)
+    parser.add_argument("--cycles", type=int, default=5)
+    args = parser.parse_args()
+
+    old_parsed = build_parsed_object(args.containers)
+    new_parsed = copy.deepcopy(old_parsed)
+    old_fingerprints = fingerprints(old_parsed)
+
+    print(f"Change check for {args.containers} unchanged containers, {args.cycles} cycles")
+    measure("before (DeepDiff)", args.cycles, lambda: DeepDiff(old_parsed, new_parsed) != {})
+    measure("after (fingerprints)", args.cycles, lambda: fingerprints(new_parsed) != old_fingerprints)
+
+
+if __name__ == "__main__":
+    main()
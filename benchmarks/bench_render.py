@@ -0,0 +1,82 @@
+"""
+Benchmark haproxy.cfg rendering for a large host mapping.
+
+Compares the previous behaviour (a new Jinja Environment, and therefore a full
+template compile, on every cycle) with the shared compiled environment used by
+HaproxyConfigGenerator.
+
+Usage:
+    uv run python benchmarks/bench_render.py [--hosts 5000] [--cycles 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from jinja2 import Environment, FileSystemLoader  # noqa: E402
+
+from easymapping import HaproxyConfigGenerator  # noqa: E402
+from easymapping.config_generator import TEMPLATES_DIR, get_template_environment  # noqa: E402
+from functions import Consts  # noqa: E402
+
+
+def build_container_metadata(hosts):
+    container_metadata = {}
+    for i in range(hosts):
+        ip = f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}"
+        container_metadata[ip] = {
+            "easyhaproxy.http.host": f"host{i}.example.org",
+            "easyhaproxy.http.port": "80",
+            "easyhaproxy.http.localport": "8080",
+        }
+    return container_metadata
+
+
+def uncached_environment():
+    env = Environment(loader=FileSystemLoader(TEMPLATES_DIR))
+    env.trim_blocks = True
+    env.lstrip_blocks = True
+    env.rstrip_blocks = True
+    return env
+
+
+def render(env, cfg):
+    return env.get_template("haproxy.cfg.j2").render(
+        data=cfg.mapping,
+        global_plugin_configs=cfg.global_plugin_configs,
+        defaults_plugin_configs=cfg.defaults_plugin_configs,
+        dashboard_server_port=Consts.DASHBOARD_SERVER_PORT
+    )
+
+
+def measure(label, cycles, func):
+    timings = []
+    for _ in range(cycles):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    print(f"{label:<32} min {min(timings) * 1000:9.2f} ms   avg {sum(timings) / len(timings) * 1000:9.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hosts", type=int, default=5000)
+    parser.add_argument("--cycles", type=int, default=5)
+    args = parser.parse_args()
+
+    cfg = HaproxyConfigGenerator({"customerrors": False, "stats": {"port": 0}})
+    cfg.mapping["easymapping"] = cfg.parse(build_container_metadata(args.hosts))
+
+    # Warm up the shared environment so the measurement reflects steady state
+    render(get_template_environment(), cfg)
+
+    print(f"Rendering haproxy.cfg for {args.hosts} hosts, {args.cycles} cycles")
+    measure("before (new Environment)", args.cycles, lambda: render(uncached_environment(), cfg))
+    measure("after (shared Environment)", args.cycles, lambda: render(get_template_environment(), cfg))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,50 +1,205 @@
 import argparse
+import base64
+import binascii
+import hmac
+import json
+import logging
 import os
 import shutil
 import sys
 import threading
-from http.server import BaseHTTPRequestHandler, HTTPServer
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
 
 from deepdiff import DeepDiff
 
 from functions import (
     Certbot,
     Consts,
+    ContainerEnv,
+    CycleProfiler,
     DaemonizeHAProxy,
     Functions,
+    HAProxyRuntime,
+    HAProxyStats,
+    ReloadScheduler,
+    StaticAsset,
     logger_easyhaproxy,
     logger_init,
+    metrics_registry,
+)
+from functions.metrics import (
+    DISCOVERED_BACKENDS,
+    DISCOVERED_CONTAINERS,
+    DISCOVERED_HOSTS,
+    RELOAD_CHANGES,
+    RELOADS,
+    RUNTIME_UPDATES,
 )
 from processor import ProcessorInterface
 
+# Phase timings of the discovery cycle, served by the dashboard server
+cycle_profiler = CycleProfiler()
+
 
 class DashboardHandler(BaseHTTPRequestHandler):
-    _content: bytes | None = None
+    protocol_version = "HTTP/1.1"
+    dashboard: StaticAsset | None = None
+    # HAProxy statistics shared by all the dashboard clients
+    stats: HAProxyStats | None = None
+    # Paths that expose HAProxy or controller data, protected like the HAProxy stats page
+    PROTECTED_PATHS = ("/api/stats", "/api/cycle", "/metrics")
+    # (username, password) of the HAProxy stats page, or None when it has no password
+    credentials: tuple | None = None
+    credentials_loaded = False
+
+    @classmethod
+    def get_dashboard(cls):
+        if cls.dashboard is None:
+            cls.dashboard = StaticAsset(os.path.join(Consts.www_path, "dashboard.html"), "text/html; charset=utf-8")
+        return cls.dashboard
+
+    @classmethod
+    def get_stats(cls):
+        if cls.stats is None:
+            cls.stats = HAProxyStats()
+        return cls.stats
+
+    @classmethod
+    def get_credentials(cls):
+        if not cls.credentials_loaded:
+            stats = ContainerEnv.read().get("stats") or {}
+            cls.credentials = (stats["username"], stats["password"]) if stats.get("password") else None
+            cls.credentials_loaded = True
+        return cls.credentials
+
+    def is_authorized(self):
+        """Check the Basic credentials of the request against the ones of the HAProxy stats page."""
+        credentials = self.get_credentials()
+        if credentials is None:
+            return True
+        scheme, _, encoded = (self.headers.get("Authorization") or "").partition(" ")
+        if scheme.lower() != "basic":
+            return False
+        try:
+            username, _, password = base64.b64decode(encoded.strip(), validate=True).decode().partition(":")
+        except (binascii.Error, UnicodeDecodeError):
+            return False
+        # Both compared, so the time taken doesn't tell which one is wrong
+        username_ok = hmac.compare_digest(username.encode(), credentials[0].encode())
+        password_ok = hmac.compare_digest(password.encode(), credentials[1].encode())
+        return username_ok and password_ok
+
+    def send_body(self, status, content_type, content, headers=None):
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-Type", content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(content)
+
+    def send_dashboard(self):
+        asset = self.get_dashboard()
+        content, etag, encoding = asset.select(self.headers.get("Accept-Encoding"))
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+        if StaticAsset.etag_matches(self.headers.get("If-None-Match"), etag):
+            self.send_body(304, None, b"", headers)
+            return
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        self.send_body(200, asset.content_type, content, headers)
+
+    def send_stats(self, query):
+        stats = self.get_stats()
+        snapshot = stats.snapshot()
+        etag = HAProxyStats.etag(snapshot)
+        since = parse_qs(query).get("since", [None])[0]
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if StaticAsset.etag_matches(self.headers.get("If-None-Match"), etag) or since == snapshot["version"]:
+            self.send_body(304, None, b"", headers)
+            return
+        content = stats.delta(since) if since else {**snapshot, "full": True}
+        self.send_body(200, "application/json", json.dumps(content).encode(), headers)
 
     def do_GET(self):
-        if self.path in ("/", "/index.html", "/dashboard.html"):
-            if DashboardHandler._content is None:
-                dashboard_path = os.path.join(Consts.www_path, "dashboard.html")
-                try:
-                    with open(dashboard_path, "rb") as f:
-                        DashboardHandler._content = f.read()
-                except OSError:
-                    DashboardHandler._content = b""
-            self.send_response(200)
-            self.send_header("Content-Type", "text/html; charset=utf-8")
-            self.send_header("Content-Length", str(len(DashboardHandler._content)))
-            self.end_headers()
-            self.wfile.write(DashboardHandler._content)
+        url = urlsplit(self.path)
+        if url.path in self.PROTECTED_PATHS and not self.is_authorized():
+            self.send_body(401, None, b"", {"WWW-Authenticate": 'Basic realm="Haproxy Statistics"'})
+        elif url.path == "/api/stats":
+            self.send_stats(url.query)
+        elif url.path == "/api/cycle":
+            self.send_body(200, "application/json", json.dumps(cycle_profiler.summary()).encode())
+        elif url.path == "/metrics":
+            self.send_body(200, "text/plain; version=0.0.4; charset=utf-8", metrics_registry.render().encode())
+        elif url.path in ("/", "/index.html", "/dashboard.html"):
+            self.send_dashboard()
         else:
-            self.send_response(404)
-            self.end_headers()
+            self.send_body(404, None, b"")
+
+    do_HEAD = do_GET  # noqa: N815
 
     def log_message(self, format, *args):
         pass
 
 
+def update_discovery_metrics(processor_obj):
+    DISCOVERED_CONTAINERS.set(len(processor_obj.get_parsed_object() or {}))
+    DISCOVERED_HOSTS.set(len(processor_obj.get_hosts() or []))
+    # One srv_* backend per host and port
+    easymapping = processor_obj.cfg.mapping.get("easymapping", [])
+    DISCOVERED_BACKENDS.set(sum(len(o["hosts"]) for o in easymapping))
+    DashboardHandler.get_stats().backend_hosts = {processor_obj.cfg.backend_name(host, o["port"]): host
+                                                  for o in easymapping for host in o["hosts"]}
+
+
+def apply_config_change(haproxy_conf, digest, applied_digest, runtime, scheduler):
+    """
+    Bring the running HAProxy to a newly rendered configuration: through the runtime API when only
+    the backend servers of haproxy.cfg changed, otherwise by requesting a reload.
+
+    Args:
+        digest: (haproxy.cfg, other files) digests of the new configuration, see get_config_digest()
+        applied_digest: the digests of what the running HAProxy has
+
+    Returns:
+        The digests of what the running HAProxy has now
+    """
+    if digest == applied_digest:
+        logger_easyhaproxy.debug('Configuration is back to the running one')
+        return applied_digest
+    if digest[1] != applied_digest[1]:
+        # Maps, certificates and custom config files are only read when HAProxy (re)starts;
+        # the reload writes them
+        scheduler.request("maps or certificates changed")
+        return applied_digest
+
+    with cycle_profiler.phase("runtime_api"):
+        applied = runtime.apply(haproxy_conf)
+    if not applied:
+        if applied is None:
+            logger_easyhaproxy.debug('No backend server change to apply through the runtime API')
+        scheduler.request("configuration changed")
+        return applied_digest
+
+    # Only backend servers changed; keep the file in sync for the next reload
+    logger_easyhaproxy.info('Backend servers changed. Applied through the runtime API without reload')
+    RUNTIME_UPDATES.inc()
+    with cycle_profiler.phase("save"):
+        Functions.save(Consts.haproxy_config, haproxy_conf)
+    return digest
+
+
 def start_dashboard_server():
-    server = HTTPServer(("127.0.0.1", Consts.DASHBOARD_SERVER_PORT), DashboardHandler)
+    # One thread per connection, so a slow client doesn't block the others
+    server = ThreadingHTTPServer(("127.0.0.1", Consts.DASHBOARD_SERVER_PORT), DashboardHandler)
     t = threading.Thread(target=server.serve_forever, daemon=True)
     t.start()
     logger_easyhaproxy.info(f"Dashboard server listening on 127.0.0.1:{Consts.DASHBOARD_SERVER_PORT}")
@@ -70,6 +225,36 @@ def _build_parser() -> argparse.ArgumentParser:
                         help="TLS policy: strict (TLS 1.3 only), default, or loose (all). Also set by EASYHAPROXY_SSL_MODE.")
     parser.add_argument("--refresh-conf", metavar="SECONDS", type=int,
                         help="Interval in seconds to poll for configuration changes. Also set by EASYHAPROXY_REFRESH_CONF.")
+    parser.add_argument("--watch-events", metavar="BOOL",
+                        choices=["true", "false"],
+                        help="Refresh as soon as the discovery source reports a change instead of waiting for the next poll. Also set by EASYHAPROXY_WATCH_EVENTS.")
+    parser.add_argument("--resync-interval", metavar="SECONDS", type=int,
+                        help="Interval in seconds of the full rescan of the containers kept up to date by the Docker events. Also set by EASYHAPROXY_RESYNC_INTERVAL.")
+    parser.add_argument("--docker-hosts", metavar="LIST",
+                        help="Comma-separated Docker endpoints discovered in parallel in Docker mode. Also set by EASYHAPROXY_DOCKER_HOSTS.")
+    parser.add_argument("--docker-timeout", metavar="SECONDS", type=float,
+                        help="Time a discovery cycle waits for the Docker endpoints. Also set by EASYHAPROXY_DOCKER_TIMEOUT.")
+    parser.add_argument("--docker-workers", metavar="N", type=int,
+                        help="Maximum number of Docker endpoints listed at the same time. Also set by EASYHAPROXY_DOCKER_WORKERS.")
+    parser.add_argument("--docker-network", metavar="NAME",
+                        help="HAProxy network the Docker containers are connected to and reached on, for every endpoint. Also set by EASYHAPROXY_DOCKER_NETWORK.")
+    parser.add_argument("--swarm-backends", metavar="MODE",
+                        choices=["vip", "tasks", "dns"],
+                        help="Swarm backend servers: the service virtual IP, one per running task, or resolved by HAProxy from Docker's DNS. Also set by EASYHAPROXY_SWARM_BACKENDS.")
+    parser.add_argument("--reload-quiet-period", metavar="SECONDS", type=int,
+                        help="Wait for this many seconds without changes before reloading. Also set by EASYHAPROXY_RELOAD_QUIET_PERIOD.")
+    parser.add_argument("--reload-min-interval", metavar="SECONDS", type=int,
+                        help="Minimum time between two reloads. Also set by EASYHAPROXY_RELOAD_MIN_INTERVAL.")
+    parser.add_argument("--reload-max-delay", metavar="SECONDS", type=int,
+                        help="Maximum time a change waits for its reload. Also set by EASYHAPROXY_RELOAD_MAX_DELAY.")
+    parser.add_argument("--host-map", metavar="BOOL",
+                        choices=["true", "false"],
+                        help="Route HTTP hosts through a HAProxy map file instead of per-host ACLs. Also set by EASYHAPROXY_HOST_MAP.")
+    parser.add_argument("--runtime-api", metavar="BOOL",
+                        choices=["true", "false"],
+                        help="Apply backend server changes through the HAProxy runtime API instead of reloading. Also set by EASYHAPROXY_RUNTIME_API.")
+    parser.add_argument("--server-slots", metavar="N", type=int,
+                        help="Server slots pre-allocated per backend for reload-free scaling. Also set by EASYHAPROXY_SERVER_SLOTS.")
     parser.add_argument("--customer-errors", metavar="BOOL",
                         choices=["true", "false"],
                         help="Enable custom HAProxy HTML error pages. Also set by HAPROXY_CUSTOMERRORS.")
@@ -92,6 +277,8 @@ def _build_parser() -> argparse.ArgumentParser:
                         help="HAProxy stats dashboard port. Also set by HAPROXY_STATS_PORT.")
     parser.add_argument("--haproxy-stats-cors-origin", metavar="ORIGIN",
                         help="Allowed CORS origin for the stats dashboard. Also set by HAPROXY_STATS_CORS_ORIGIN.")
+    parser.add_argument("--stats-interval", metavar="SECONDS", type=float,
+                        help="Minimum time between two HAProxy stats queries of the dashboard stats API. Also set by EASYHAPROXY_STATS_INTERVAL.")
 
     # ACME / Certbot
     parser.add_argument("--certbot-email", metavar="EMAIL",
@@ -127,10 +314,20 @@ def _build_parser() -> argparse.ArgumentParser:
     parser.add_argument("--deployment-mode", metavar="MODE",
                         choices=["auto", "single", "cluster"],
                         help="Kubernetes deployment mode. Also set by EASYHAPROXY_DEPLOYMENT_MODE.")
+    parser.add_argument("--kubernetes-backends", metavar="MODE",
+                        choices=["service", "endpoints"],
+                        help="Kubernetes backend servers: the Service ClusterIP or one per pod endpoint. Also set by EASYHAPROXY_KUBERNETES_BACKENDS.")
     parser.add_argument("--external-hostname", metavar="HOSTNAME",
                         help="External hostname reported in Ingress status. Also set by EASYHAPROXY_EXTERNAL_HOSTNAME.")
     parser.add_argument("--ingress-status-update-interval", metavar="SECONDS", type=int,
                         help="Interval in seconds to update Ingress status. Also set by EASYHAPROXY_STATUS_UPDATE_INTERVAL.")
+    parser.add_argument("--leader-election", metavar="BOOL",
+                        choices=["true", "false"],
+                        help="Only the replica holding a Lease writes the Ingress status. Also set by EASYHAPROXY_LEADER_ELECTION.")
+    parser.add_argument("--leader-election-lease", metavar="NAME",
+                        help="Lease of the Ingress status leader election. Also set by EASYHAPROXY_LEADER_ELECTION_LEASE.")
+    parser.add_argument("--status-workers", metavar="N", type=int,
+                        help="Ingress status patches sent at the same time. Also set by EASYHAPROXY_STATUS_WORKERS.")
 
     return parser
 
@@ -143,6 +340,19 @@ def _apply_args_to_env(args: argparse.Namespace) -> None:
         "label_prefix":                    "EASYHAPROXY_LABEL_PREFIX",
         "ssl_mode":                        "EASYHAPROXY_SSL_MODE",
         "refresh_conf":                    "EASYHAPROXY_REFRESH_CONF",
+        "watch_events":                    "EASYHAPROXY_WATCH_EVENTS",
+        "resync_interval":                 "EASYHAPROXY_RESYNC_INTERVAL",
+        "docker_hosts":                    "EASYHAPROXY_DOCKER_HOSTS",
+        "docker_timeout":                  "EASYHAPROXY_DOCKER_TIMEOUT",
+        "docker_workers":                  "EASYHAPROXY_DOCKER_WORKERS",
+        "docker_network":                  "EASYHAPROXY_DOCKER_NETWORK",
+        "swarm_backends":                  "EASYHAPROXY_SWARM_BACKENDS",
+        "reload_quiet_period":             "EASYHAPROXY_RELOAD_QUIET_PERIOD",
+        "reload_min_interval":             "EASYHAPROXY_RELOAD_MIN_INTERVAL",
+        "reload_max_delay":                "EASYHAPROXY_RELOAD_MAX_DELAY",
+        "host_map":                        "EASYHAPROXY_HOST_MAP",
+        "runtime_api":                     "EASYHAPROXY_RUNTIME_API",
+        "server_slots":                    "EASYHAPROXY_SERVER_SLOTS",
         "customer_errors":                 "HAPROXY_CUSTOMERRORS",
         "log_level":                       "EASYHAPROXY_LOG_LEVEL",
         "haproxy_log_level":               "HAPROXY_LOG_LEVEL",
@@ -151,6 +361,7 @@ def _apply_args_to_env(args: argparse.Namespace) -> None:
         "haproxy_username":                "HAPROXY_USERNAME",
         "haproxy_stats_port":              "HAPROXY_STATS_PORT",
         "haproxy_stats_cors_origin":       "HAPROXY_STATS_CORS_ORIGIN",
+        "stats_interval":                  "EASYHAPROXY_STATS_INTERVAL",
         "certbot_email":                   "EASYHAPROXY_CERTBOT_EMAIL",
         "certbot_autoconfig":              "EASYHAPROXY_CERTBOT_AUTOCONFIG",
         "certbot_server":                  "EASYHAPROXY_CERTBOT_SERVER",
@@ -163,8 +374,12 @@ def _apply_args_to_env(args: argparse.Namespace) -> None:
         "plugins_abort_on_error":          "EASYHAPROXY_PLUGINS_ABORT_ON_ERROR",
         "update_ingress_status":           "EASYHAPROXY_UPDATE_INGRESS_STATUS",
         "deployment_mode":                 "EASYHAPROXY_DEPLOYMENT_MODE",
+        "kubernetes_backends":             "EASYHAPROXY_KUBERNETES_BACKENDS",
         "external_hostname":               "EASYHAPROXY_EXTERNAL_HOSTNAME",
         "ingress_status_update_interval":  "EASYHAPROXY_STATUS_UPDATE_INTERVAL",
+        "status_workers":                  "EASYHAPROXY_STATUS_WORKERS",
+        "leader_election":                 "EASYHAPROXY_LEADER_ELECTION",
+        "leader_election_lease":           "EASYHAPROXY_LEADER_ELECTION_LEASE",
     }
     for arg_name, env_name in mapping.items():
         value = getattr(args, arg_name, None)
@@ -179,19 +394,33 @@ def start():
 
     os.makedirs(Consts.certs_certbot, exist_ok=True)
     os.makedirs(Consts.certs_haproxy, exist_ok=True)
+    os.makedirs(Consts.maps_haproxy, exist_ok=True)
 
+    metrics_registry.add_collector(Certbot.collect_certificate_expiry)
     start_dashboard_server()
 
-    processor_obj.save_config(Consts.haproxy_config)
+    haproxy_conf = processor_obj.save_config(Consts.haproxy_config)
+    processor_obj.save_maps(Consts.maps_haproxy)
     processor_obj.save_certs(Consts.certs_haproxy)
     certbot_certs_found = processor_obj.get_certbot_hosts()
+    update_discovery_metrics(processor_obj)
     logger_easyhaproxy.info(f'Found hosts: {", ".join(processor_obj.get_hosts())}')  # Needs to run after save_config
     logger_easyhaproxy.debug(f'Object Found: {processor_obj.get_parsed_object()}')
 
     old_haproxy = None
     haproxy = DaemonizeHAProxy()
-    current_custom_config_files = haproxy.get_custom_config_files()
+    runtime = HAProxyRuntime()
+    scheduler = ReloadScheduler()
     haproxy.haproxy(DaemonizeHAProxy.HAPROXY_START)
+    runtime.sync(haproxy_conf)
+    # Digest of what the running HAProxy loaded, and of the last rendered configuration
+    applied_digest = seen_digest = haproxy.get_config_digest(haproxy_conf, processor_obj.get_maps(), processor_obj.get_certs())
+
+    # Wake the loop on discovery events; EASYHAPROXY_REFRESH_CONF becomes the resync interval
+    changes = None
+    if os.getenv("EASYHAPROXY_WATCH_EVENTS", "true").lower() == "true":
+        processor_obj.watch()
+        changes = processor_obj.changes
     haproxy.sleep()
 
     certbot = Certbot(Consts.certs_certbot)
@@ -209,27 +438,67 @@ def start():
         if old_haproxy is not None:
             old_haproxy.kill()
             old_haproxy = None
+        cycle_profiler.start_cycle()
         try:
             old_parsed = processor_obj.get_parsed_object()
-            processor_obj.refresh()
-            if certbot.check_certificates(certbot_certs_found) or DeepDiff(old_parsed, processor_obj.get_parsed_object()) != {} or not haproxy.is_alive() or DeepDiff(current_custom_config_files, haproxy.get_custom_config_files()) != {}:
-                logger_easyhaproxy.info('New configuration found. Reloading...')
-                logger_easyhaproxy.debug(f'Object Found: {processor_obj.get_parsed_object()}')
-                processor_obj.save_config(Consts.haproxy_config)
-                processor_obj.save_certs(Consts.certs_haproxy)
+            old_fingerprints = processor_obj.get_fingerprints()
+            processor_obj.refresh(cycle_profiler)
+            with cycle_profiler.phase("fingerprint"):
+                added, removed, modified = processor_obj.get_changed_keys(old_fingerprints)
+            if added or removed or modified:
+                logger_easyhaproxy.info(f'Discovery changed: {len(added)} added, {len(removed)} removed, {len(modified)} modified')
+                if logger_easyhaproxy.isEnabledFor(logging.DEBUG):
+                    # DeepDiff only over the containers whose fingerprint changed
+                    parsed = processor_obj.get_parsed_object()
+                    changed = DeepDiff({key: old_parsed[key] for key in removed + modified},
+                                       {key: parsed[key] for key in added + modified})
+                    logger_easyhaproxy.debug(f'Discovery diff: {changed}')
+            if not haproxy.is_alive():
+                scheduler.request("HAProxy is not running", urgent=True)
+            # New or renewed certificates change the digest below
+            with cycle_profiler.phase("certbot"):
+                certbot.check_certificates(certbot_certs_found)
+
+            # Labels that don't affect the output (e.g. resource versions) render the same configuration
+            with cycle_profiler.phase("generate"):
+                haproxy_conf = processor_obj.get_haproxy_conf()
+            update_discovery_metrics(processor_obj)
+            with cycle_profiler.phase("digest"):
+                digest = haproxy.get_config_digest(haproxy_conf, processor_obj.get_maps(), processor_obj.get_certs())
+            if digest != seen_digest:
+                seen_digest = digest
+                applied_digest = apply_config_change(haproxy_conf, digest, applied_digest, runtime, scheduler)
+
+            if scheduler.due() and digest == applied_digest and not scheduler.urgent:
+                logger_easyhaproxy.debug(f'Skipping reload, configuration unchanged after {scheduler.pending} change(s)')
+                scheduler.cancel()
+            elif scheduler.due():
+                merged = scheduler.reloaded()
+                RELOADS.inc()
+                for reason in merged:
+                    RELOAD_CHANGES.inc(reason=reason)
+                logger_easyhaproxy.info(f'New configuration found. Reloading... ({len(merged)} change(s) merged: {", ".join(sorted(set(merged)))})')
+                with cycle_profiler.phase("save"):
+                    Functions.save(Consts.haproxy_config, haproxy_conf)
+                    processor_obj.save_maps(Consts.maps_haproxy)
+                    processor_obj.save_certs(Consts.certs_haproxy)
                 certbot_certs_found = processor_obj.get_certbot_hosts()
                 logger_easyhaproxy.info(f'Found hosts: {", ".join(processor_obj.get_hosts())}')  # Needs to after save_config
-                old_haproxy = haproxy
-                haproxy = DaemonizeHAProxy()
-                current_custom_config_files = haproxy.get_custom_config_files()
-                haproxy.haproxy(DaemonizeHAProxy.HAPROXY_RELOAD)
-                old_haproxy.terminate()
+                with cycle_profiler.phase("reload"):
+                    old_haproxy = haproxy
+                    haproxy = DaemonizeHAProxy()
+                    haproxy.haproxy(DaemonizeHAProxy.HAPROXY_RELOAD)
+                    runtime.sync(haproxy_conf)
+                    old_haproxy.terminate()
+                # Certificates were just rewritten, so the digest is taken again
+                applied_digest = seen_digest = haproxy.get_config_digest(haproxy_conf, processor_obj.get_maps(), processor_obj.get_certs())
 
         except Exception as e:
             logger_easyhaproxy.fatal(f"Err: {e}")
 
+        cycle_profiler.end_cycle()
         logger_easyhaproxy.info('Heartbeat')
-        haproxy.sleep()
+        haproxy.sleep(changes, scheduler.wait_time())
 
 
 def main():
@@ -1,16 +1,60 @@
 import base64
+import copy
 import os
 import re
 
-from jinja2 import Environment, FileSystemLoader
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 
 from functions import Functions, logger_easyhaproxy, Consts
 
 from .label_handler import DockerLabelHandler
 
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'templates')
+
+_template_environment = None
+
+
+def get_template_environment():
+    """
+    Return the Jinja environment shared by every generator in this process.
+
+    Compiled templates are kept in memory and in an on-disk bytecode cache; with
+    auto_reload a template is only recompiled when its file mtime changes.
+    """
+    global _template_environment
+    if _template_environment is None:
+        try:
+            bytecode_cache = FileSystemBytecodeCache()
+        except Exception as e:
+            logger_easyhaproxy.warning(f"Template bytecode cache disabled: {e}")
+            bytecode_cache = None
+
+        env = Environment(loader=FileSystemLoader(TEMPLATES_DIR), bytecode_cache=bytecode_cache, auto_reload=True)
+        env.trim_blocks = True
+        env.lstrip_blocks = True
+        env.rstrip_blocks = True
+        _template_environment = env
+    return _template_environment
+
 
 class HaproxyConfigGenerator:
+    # Name servers of the `resolvers` sections that backends resolved at runtime can use
+    NAMESERVERS = {"docker": "127.0.0.11:53"}
+    # Servers of a `server-template` when neither the `slots` label nor EASYHAPROXY_SERVER_SLOTS is set
+    DEFAULT_TEMPLATE_SLOTS = 10
+
     def __init__(self, mapping):
+        self.plugin_manager = None
+        self._plugins_config = None
+        self.reset(mapping)
+
+    def reset(self, mapping):
+        """
+        Prepare the generator for a new discovery cycle.
+
+        Per-cycle state (hosts, certificates and plugin config snippets) is cleared,
+        while the plugin manager is kept and only reloaded when a plugin file changes.
+        """
         self.mapping = mapping
         self.mapping.setdefault("ssl_mode", 'default')
         self.mapping.setdefault("certbot", {"email": "", "server": False, "eab_kid": False, "eab_hmac_key": False})
@@ -19,29 +63,58 @@ class HaproxyConfigGenerator:
         self.certbot_hosts = []
         self.serving_hosts = []
         self.certs = {}
+        self.maps = {}
+        self.resolvers = {}
         self.defaults_plugin_configs = []
+        self.global_plugin_configs = []
 
         # Initialize plugin system
         try:
-            from plugins import PluginManager
-            self.plugin_manager = PluginManager(
-                abort_on_error=self.mapping.get("plugins", {}).get("abort_on_error", False)
-            )
-            self.plugin_manager.load_plugins()
-            self.plugin_manager.configure_plugins(self.mapping.get("plugins", {}))
-            self.plugin_manager.initialize_plugins()
-            self.global_plugin_configs = []
+            self._setup_plugins()
         except Exception as e:
             # If plugin system fails to initialize, log but continue
             logger_easyhaproxy.warning(f"Failed to initialize plugin system: {e}")
             self.plugin_manager = None
-            self.global_plugin_configs = []
+            self._plugins_config = None
+
+    def _setup_plugins(self):
+        from plugins import PluginManager
 
-    def generate(self, container_metadata={}):
+        plugins_config = self.mapping.get("plugins", {})
+        abort_on_error = plugins_config.get("abort_on_error", False)
+
+        if self.plugin_manager is None:
+            self.plugin_manager = PluginManager(abort_on_error=abort_on_error)
+            self.plugin_manager.load_plugins()
+            reloaded = True
+        else:
+            self.plugin_manager.abort_on_error = abort_on_error
+            reloaded = self.plugin_manager.reload_if_changed()
+            if not reloaded:
+                # Drop the label configuration applied to the plugins in the previous cycle
+                self.plugin_manager.reset_plugins()
+
+        # configure_plugins() may update the nested dicts, so compare against a copy taken before it
+        config_snapshot = copy.deepcopy(plugins_config)
+        self.plugin_manager.configure_plugins(plugins_config)
+        if reloaded or config_snapshot != self._plugins_config:
+            self.plugin_manager.initialize_plugins()
+            self._plugins_config = config_snapshot
+
+    def generate(self, container_metadata={}, server_states=None, resolvers=None):
+        """
+        Args:
+            container_metadata: dict {container address: labels}
+            server_states: dict {container address: "drain" | "maint"} of the containers that must not
+                receive new traffic yet (e.g. starting or unhealthy); the others are ready
+            resolvers: dict {container address: resolvers name} of the addresses that are DNS names
+                HAProxy resolves itself (e.g. "tasks.<service>" on Docker's DNS)
+        """
         self.mapping.setdefault("easymapping", [])
 
         if container_metadata != {}:
-            self.mapping["easymapping"] = self.parse(container_metadata)
+            self.mapping["easymapping"] = self.parse(container_metadata, server_states, resolvers)
+        self.mapping["resolvers"] = self.resolvers
 
         # Execute global plugins
         if self.plugin_manager:
@@ -82,22 +155,69 @@ class HaproxyConfigGenerator:
             except Exception as e:
                 logger_easyhaproxy.warning(f"Failed to execute global plugins: {e}")
 
-        templates_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'templates')
-        file_loader = FileSystemLoader(templates_dir)
-        env = Environment(loader=file_loader)
-        env.trim_blocks = True
-        env.lstrip_blocks = True
-        env.rstrip_blocks = True
-        template = env.get_template('haproxy.cfg.j2')
+        if self.mapping.get("host_map", False):
+            self.build_host_maps()
+
+        template = get_template_environment().get_template('haproxy.cfg.j2')
         return template.render(
             data=self.mapping,
             global_plugin_configs=self.global_plugin_configs,
             defaults_plugin_configs=self.defaults_plugin_configs,
-            dashboard_server_port=Consts.DASHBOARD_SERVER_PORT
+            dashboard_server_port=Consts.DASHBOARD_SERVER_PORT,
+            maps_path=Consts.maps_haproxy
         )
 
-    def parse(self, container_metadata):
+    @staticmethod
+    def backend_name(hostname, port):
+        """Backend name generated by haproxy.cfg.j2 for a host and listening port."""
+        return "srv_" + hostname.replace(".", "_") + f"_{port}"
+
+    def build_host_maps(self):
+        """
+        Create the map files used by HTTP frontends to route by Host header.
+
+        For each HTTP port a `hosts_<port>.map` (host -> backend) replaces the per-host
+        ACL chain with a single tree-indexed lookup. Hosts with certbot or redirect_ssl
+        are also written to pattern files used by the frontend ACLs.
+        """
+        for o in self.mapping["easymapping"]:
+            if (o["mode"] or "http") != "http":
+                continue
+
+            port = o["port"]
+            host_map = []
+            certbot_hosts = []
+            redirect_ssl_hosts = []
+            for hostname, host_config in o["hosts"].items():
+                keys = [hostname.lower(), f"{hostname.lower()}:{port}"]
+                if host_config.get("certbot"):
+                    certbot_hosts += keys
+                if host_config.get("redirect_ssl"):
+                    redirect_ssl_hosts += keys
+                else:
+                    host_map += [f"{key} {self.backend_name(hostname, port)}" for key in keys]
+
+            o["host_map"] = {
+                "hosts": f"hosts_{port}.map",
+                "certbot": f"certbot_{port}.lst" if certbot_hosts else "",
+                "redirect_ssl": f"redirect_ssl_{port}.lst" if redirect_ssl_hosts else "",
+            }
+            self.maps[o["host_map"]["hosts"]] = "".join(f"{line}\n" for line in host_map)
+            if certbot_hosts:
+                self.maps[o["host_map"]["certbot"]] = "".join(f"{line}\n" for line in certbot_hosts)
+            if redirect_ssl_hosts:
+                self.maps[o["host_map"]["redirect_ssl"]] = "".join(f"{line}\n" for line in redirect_ssl_hosts)
+
+    def resolvers_section(self, name, hold):
+        """Name of the `resolvers` section for the name server `name` that keeps gone records for `hold`."""
+        section = name if not hold else f"{name}_hold_" + re.sub(r"\W", "_", hold)
+        self.resolvers[section] = {"nameserver": self.NAMESERVERS[name], "hold": hold}
+        return section
+
+    def parse(self, container_metadata, server_states=None, resolvers=None):
         easymapping = dict()
+        server_states = server_states or {}
+        resolvers = resolvers or {}
 
         for container in container_metadata:
             d = container_metadata[container]
@@ -183,6 +303,25 @@ class HaproxyConfigGenerator:
                     ""
                 )
 
+                # Pre-allocated server slots, filled and emptied at runtime without a reload
+                slots = self.label.get(
+                    self.label.create([definition, "slots"]),
+                    self.mapping.get("server_slots", 0)
+                )
+                try:
+                    slots = 0 if socket_path else int(slots)
+                except ValueError:
+                    logger_easyhaproxy.warning(f"Invalid slots value '{slots}' for '{definition}', ignoring")
+                    slots = 0
+
+                # DNS names resolved by HAProxy: one server-template of `slots` servers follows the records
+                template_section = None
+                if container in resolvers and not socket_path:
+                    template_section = self.resolvers_section(resolvers[container], self.label.get(
+                        self.label.create([definition, "resolve_hold"]),
+                        ""
+                    ))
+
                 for hostname in sorted(d[host_label].split(",")):
                     hostname = hostname.strip()
                     self.serving_hosts.append(f"{hostname}:{port}")
@@ -198,6 +337,19 @@ class HaproxyConfigGenerator:
                         server_address = f"{container}:{ct_port}"
 
                     easymapping[port]["hosts"][hostname]["containers"] += [server_address]
+                    if template_section:
+                        easymapping[port]["hosts"][hostname].setdefault("server_templates", {})
+                        easymapping[port]["hosts"][hostname]["server_templates"][server_address] = {
+                            "resolvers": template_section,
+                            "slots": slots or self.DEFAULT_TEMPLATE_SLOTS,
+                        }
+                    elif container in server_states and not socket_path:
+                        easymapping[port]["hosts"][hostname].setdefault("server_states", {})
+                        easymapping[port]["hosts"][hostname]["server_states"][server_address] = server_states[container]
+                    if slots > 0 and not template_section:
+                        host_slots = easymapping[port]["hosts"][hostname].get("slots", 0)
+                        easymapping[port]["hosts"][hostname]["slots"] = max(host_slots, slots)
+                        easymapping[port]["hosts"][hostname]["slot_address"] = f"127.0.0.1:{ct_port}"
                     easymapping[port]["hosts"][hostname]["certbot"] = certbot
                     easymapping[port]["hosts"][hostname]["redirect_ssl"] = self.label.get_bool(
                         self.label.create([definition, "redirect_ssl"])
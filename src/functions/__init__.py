@@ -1,21 +1,35 @@
 from .certbot import Certbot
 from .consts import Consts, classproperty
 from .container_env import ContainerEnv
+from .cycle_profiler import CycleProfiler
 from .filter import SingleLineNonEmptyFilter
 from .functions import Functions
 from .haproxy import DaemonizeHAProxy
+from .haproxy_runtime import HAProxyRuntime, HAProxyRuntimeError
+from .haproxy_stats import HAProxyStats
 from .loggers import logger_certbot, logger_easyhaproxy, logger_haproxy, logger_init
+from .metrics import ApiCallCounter, metrics_registry
+from .reload_scheduler import ReloadScheduler
+from .static_asset import StaticAsset
 
 __all__ = [
+    "ApiCallCounter",
     "Certbot",
     "classproperty",
     "Consts",
     "ContainerEnv",
+    "CycleProfiler",
     "DaemonizeHAProxy",
     "Functions",
+    "HAProxyRuntime",
+    "HAProxyRuntimeError",
+    "HAProxyStats",
+    "ReloadScheduler",
     "SingleLineNonEmptyFilter",
+    "StaticAsset",
     "logger_certbot",
     "logger_easyhaproxy",
     "logger_haproxy",
     "logger_init",
+    "metrics_registry",
 ]
\ No newline at end of file
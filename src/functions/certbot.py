@@ -1,7 +1,7 @@
 import logging
 import os
 import time
-from datetime import datetime
+from datetime import UTC, datetime
 
 import requests
 from OpenSSL import crypto
@@ -10,9 +10,12 @@ from .consts import Consts
 from .container_env import ContainerEnv
 from .functions import Functions
 from .loggers import logger_certbot
+from .metrics import CERTBOT_RUNS, CERTIFICATE_EXPIRY
 
 
 class Certbot:
+    _expiry_cache = {}  # filename -> (mtime, expiry) for collect_certificate_expiry()
+
     def __init__(self, certs):
         env = ContainerEnv.read()
 
@@ -153,11 +156,13 @@ class Certbot:
             return_code_renew = 0
             if len(request_certs) > 0:
                 return_code_issue, output = Functions.run_bash(logger_certbot, certbot_certonly, return_result=False)
+                CERTBOT_RUNS.inc(command="certonly", result="success" if return_code_issue == 0 else "failure")
                 ret_reload = True
 
             if len(renew_certs) > 0:
                 certbot_renew = f"/usr/bin/certbot renew --config-dir {Consts.base_path}/certs --work-dir {Consts.base_path}/certs/work --logs-dir {Consts.base_path}/certs/logs"
                 return_code_renew, output = Functions.run_bash(logger_certbot, certbot_renew, return_result=False)
+                CERTBOT_RUNS.inc(command="renew", result="success" if return_code_renew == 0 else "failure")
                 ret_reload = True
 
             if ret_reload:
@@ -196,10 +201,7 @@ class Certbot:
             return "not_found"
 
         try:
-            with open(filename, 'rb') as file:
-                certificate_str = file.read()
-            certificate = crypto.load_certificate(crypto.FILETYPE_PEM, certificate_str)
-            expiration_after = datetime.strptime(certificate.get_notAfter().decode()[:-1], '%Y%m%d%H%M%S').timestamp()
+            expiration_after = Certbot.get_certificate_expiry(filename)
             if current_time >= expiration_after:
                 return "expired"
             elif (expiration_after - current_time) // (24 * 3600) <= 15:
@@ -210,6 +212,40 @@ class Certbot:
 
         return "ok"
 
+    @staticmethod
+    def get_certificate_expiry(filename):
+        """Return the expiration time (seconds since epoch) of the first certificate in a PEM file."""
+        with open(filename, 'rb') as file:
+            certificate_str = file.read()
+        certificate = crypto.load_certificate(crypto.FILETYPE_PEM, certificate_str)
+        return datetime.strptime(certificate.get_notAfter().decode()[:-1], '%Y%m%d%H%M%S').replace(
+            tzinfo=UTC).timestamp()
+
+    @staticmethod
+    def collect_certificate_expiry():
+        """Refresh the certificate expiry gauge from the certificate folders; files are parsed again only when modified."""
+        # Built first and swapped in at once: scrapes run concurrently
+        samples = []
+        for folder in (Consts.certs_haproxy, Consts.certs_certbot):
+            if not os.path.isdir(folder):
+                continue
+            for item in sorted(os.listdir(folder)):
+                filename = os.path.join(folder, item)
+                if not item.endswith(".pem") or not os.path.isfile(filename):
+                    continue
+                mtime = os.path.getmtime(filename)
+                cached = Certbot._expiry_cache.get(filename)
+                if cached is None or cached[0] != mtime:
+                    try:
+                        cached = (mtime, Certbot.get_certificate_expiry(filename))
+                    except Exception as e:
+                        logger_certbot.debug(f"Certificate {filename} error {e}")
+                        cached = (mtime, None)
+                    Certbot._expiry_cache[filename] = cached
+                if cached[1] is not None:
+                    samples.append((cached[1], {"certificate": item[:-4]}))
+        CERTIFICATE_EXPIRY.replace(samples)
+
     def find_missing_certificates(self, hosts):
         for host in hosts:
             if host.startswith("-d "):
@@ -48,6 +48,11 @@ class Consts:
         """Path to custom HAProxy config snippets directory."""
         return f"{cls.base_path}/haproxy/conf.d"
 
+    @classproperty
+    def maps_haproxy(cls):
+        """Path to generated HAProxy map files (host routing)."""
+        return f"{cls.base_path}/haproxy/maps"
+
     @classproperty
     def certs_certbot(cls):
         """Path to Certbot/ACME certificates directory."""
@@ -35,6 +35,9 @@ class ContainerEnv:
                 "cors_origin": os.getenv("HAPROXY_STATS_CORS_ORIGIN", ""),
             }
 
+        env_vars["host_map"] = os.getenv("EASYHAPROXY_HOST_MAP", "false").lower() == "true"
+        env_vars["server_slots"] = int(os.getenv("EASYHAPROXY_SERVER_SLOTS", "0"))
+
         env_vars["lookup_label"] = os.getenv("EASYHAPROXY_LABEL_PREFIX") if os.getenv(
             "EASYHAPROXY_LABEL_PREFIX") else "easyhaproxy"
 
@@ -134,6 +137,14 @@ class ContainerEnv:
         if 'ssl_mode' in yaml_config:
             os.environ['EASYHAPROXY_SSL_MODE'] = str(yaml_config['ssl_mode'])
 
+        # Convert host_map
+        if 'host_map' in yaml_config:
+            os.environ['EASYHAPROXY_HOST_MAP'] = 'true' if yaml_config['host_map'] else 'false'
+
+        # Convert server_slots
+        if 'server_slots' in yaml_config:
+            os.environ['EASYHAPROXY_SERVER_SLOTS'] = str(yaml_config['server_slots'])
+
         # Convert stats
         if 'stats' in yaml_config:
             stats = yaml_config['stats']
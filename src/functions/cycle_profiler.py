@@ -0,0 +1,81 @@
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from .loggers import logger_easyhaproxy
+from .metrics import CYCLE_DURATION
+
+
+class CycleProfiler:
+    """
+    Measure the phases of the discovery cycle.
+
+    The durations of the last `window` cycles are kept per phase, so the p50/p95/max reported
+    by summary() are rolling values. A "cycle" phase holds the total time of each cycle.
+    """
+
+    def __init__(self, window=200):
+        self.window = window
+        self.samples = {}  # phase -> deque of durations in seconds
+        self.current = {}
+        self.cycle_start = None
+        self.cycles = 0
+        self.lock = threading.Lock()
+
+    def start_cycle(self):
+        self.current = {}
+        self.cycle_start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.current[name] = self.current.get(name, 0) + time.perf_counter() - start
+
+    def end_cycle(self):
+        """Record the phases of the current cycle and log them in one line."""
+        if self.cycle_start is None:
+            return
+        self.current["cycle"] = time.perf_counter() - self.cycle_start
+        self.cycle_start = None
+
+        with self.lock:
+            for name, duration in self.current.items():
+                self.samples.setdefault(name, deque(maxlen=self.window)).append(duration)
+                CYCLE_DURATION.observe(duration, phase=name)
+            self.cycles += 1
+
+        phases = ", ".join(f"{name} {duration * 1000:.1f}ms" for name, duration in self.current.items() if name != "cycle")
+        logger_easyhaproxy.debug(f"Cycle took {self.current['cycle'] * 1000:.1f}ms ({phases})")
+
+    @staticmethod
+    def percentile(values, q):
+        """Nearest-rank percentile of a sorted list."""
+        if not values:
+            return 0
+        return values[max(0, math.ceil(q / 100 * len(values)) - 1)]
+
+    def summary(self):
+        """
+        Returns:
+            dict {"cycles": int, "phases": {phase: {"count", "last", "p50", "p95", "max"}}}, durations in seconds
+        """
+        with self.lock:
+            samples = {name: list(values) for name, values in self.samples.items()}
+            cycles = self.cycles
+
+        phases = {}
+        for name, values in samples.items():
+            ordered = sorted(values)
+            phases[name] = {
+                "count": len(values),
+                "last": values[-1],
+                "p50": self.percentile(ordered, 50),
+                "p95": self.percentile(ordered, 95),
+                "max": ordered[-1],
+            }
+        return {"cycles": cycles, "phases": phases}
@@ -1,3 +1,4 @@
+import hashlib
 import os
 import shlex
 import shutil
@@ -50,7 +51,7 @@ class DaemonizeHAProxy:
             return_code, output = Functions().run_bash(logger_haproxy, f"cat {pid_file}", log_output=False)
             pid = "".join(output).rstrip()
             if psutil.pid_exists(int(pid)):
-                return f"{haproxy_bin} -W -f {Consts.haproxy_config} {custom_config_files} -p {pid_file} -x /var/run/haproxy.sock -sf {pid}"
+                return f"{haproxy_bin} -W -f {Consts.haproxy_config} {custom_config_files} -p {pid_file} -x /var/run/haproxy.sock -S /var/run/haproxy.sock -sf {pid}"
             else:
                 os.unlink(pid_file)
                 logger_haproxy.warning(
@@ -132,14 +133,33 @@ class DaemonizeHAProxy:
         self.process.terminate()
         self.thread.terminate()
 
-    def sleep(self):
+    def sleep(self, changes=None, timeout=None):
+        """
+        Wait for the next discovery cycle.
+
+        Args:
+            changes: Optional threading.Event set when the discovery source changed. The wait ends
+                as soon as it is set; EASYHAPROXY_REFRESH_CONF is then only the resync interval.
+            timeout: Optional shorter wait, e.g. until a pending reload is due
+
+        Returns:
+            True if the wait was ended by a change notification
+        """
         if self.sleep_secs is None:
             try:
                 self.sleep_secs = int(os.getenv("EASYHAPROXY_REFRESH_CONF", "10"))
             except ValueError:
                 self.sleep_secs = 10
 
-        time.sleep(self.sleep_secs)
+        sleep_secs = self.sleep_secs if timeout is None else min(self.sleep_secs, timeout)
+        if changes is None:
+            time.sleep(sleep_secs)
+            return False
+
+        changed = changes.wait(sleep_secs)
+        # Cleared before the cycle runs, so changes that happen during the cycle trigger the next one
+        changes.clear()
+        return changed
 
     def get_custom_config_files(self):
         if not os.path.exists(self.custom_config_folder):
@@ -149,4 +169,33 @@ class DaemonizeHAProxy:
         for file in os.listdir(self.custom_config_folder):
             if file.endswith(".cfg"):
                 files[os.path.join(self.custom_config_folder, file)] = os.path.getmtime(os.path.join(self.custom_config_folder, file))
-        return dict(sorted(files.items(), key=lambda t: t[0]))
\ No newline at end of file
+        return dict(sorted(files.items(), key=lambda t: t[0]))
+
+    def get_config_digest(self, haproxy_conf, maps, certs):
+        """
+        Hash everything HAProxy loads: the rendered configuration, the map files, the certificates
+        and the custom config files. HAProxy needs a reload only when this digest changes.
+
+        The rendered content is hashed; files written by others (certbot, Kubernetes secrets,
+        custom config files) are tracked by size and modification time.
+
+        Returns:
+            tuple (digest of haproxy.cfg, digest of the other files). The runtime API can only
+            apply changes to haproxy.cfg; HAProxy reads the other files when it (re)starts.
+        """
+        config_digest = hashlib.sha256(haproxy_conf.encode()).hexdigest()
+        digest = hashlib.sha256()
+        for name, content in sorted(maps.items()):
+            digest.update(f"\0map:{name}\0{content}".encode())
+        for name, content in sorted(certs.items()):
+            digest.update(f"\0cert:{name}\0{content}".encode())
+        for path, mtime in self.get_custom_config_files().items():
+            digest.update(f"\0cfg:{path}:{mtime}".encode())
+        for folder in (Consts.certs_haproxy, Consts.certs_certbot):
+            if not os.path.isdir(folder):
+                continue
+            for entry in sorted(os.scandir(folder), key=lambda e: e.name):
+                if entry.is_file():
+                    stat = entry.stat()
+                    digest.update(f"\0file:{entry.path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+        return config_digest, digest.hexdigest()
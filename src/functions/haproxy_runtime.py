@@ -0,0 +1,269 @@
+import os
+import re
+import socket
+from typing import Final
+
+from .loggers import logger_haproxy
+
+
+class HAProxyRuntimeError(Exception):
+    """Raised when the HAProxy runtime API rejects a command."""
+
+
+class HAProxyRuntime:
+    """
+    Apply backend server membership changes to a running HAProxy through the master CLI.
+
+    Only changes restricted to the `server srv-N` lines of existing backends are applied
+    live (add server / del server / set server addr, enabling/disabling pre-allocated
+    `disabled` slots, or the ready/drain/maint state of a server). Any other difference in
+    the rendered configuration is a structural change and requires a reload.
+    """
+    MASTER_SOCKET: Final[str] = "/var/run/haproxy.sock"
+
+    # Balance algorithms that support adding servers at runtime
+    DYNAMIC_BALANCE: Final[tuple] = ("roundrobin", "leastconn", "first", "random")
+    # States of a server holding a container. A drained server is rendered and set with `weight 0`
+    # rather than the DRAIN admin state: a reload has no way to start a server in DRAIN.
+    SERVER_STATES: Final[tuple] = ("ready", "drain", "maint")
+
+    _SECTION_RE = re.compile(r"^(\S+)\s*(\S*)")
+    _SERVER_RE = re.compile(r"^\s+server\s+(srv-\d+)\s+(\S+)\s*(.*?)\s*$")
+    _BALANCE_RE = re.compile(r"^\s+balance\s+(\S+)")
+
+    def __init__(self, socket_path=None, timeout=5):
+        self.socket_path = socket_path if socket_path is not None else HAProxyRuntime.MASTER_SOCKET
+        self.timeout = timeout
+        self.enabled = os.getenv("EASYHAPROXY_RUNTIME_API", "true").lower() == "true"
+        self.structure = None
+        self.balance = {}
+        self.servers = {}  # backend -> {server_name: (address, options, state)}
+
+    @staticmethod
+    def split_config(config):
+        """
+        Split a rendered haproxy.cfg into its structure and its dynamic servers.
+
+        Returns:
+            tuple (structure: str, servers: dict, balance: dict) where structure is the
+            configuration without the `server srv-N` lines, servers maps each backend
+            to {server_name: (address, options, state)} and balance maps each backend to its algorithm.
+            The state is "ready", "maint" (servers rendered `disabled # maint`), "drain" (rendered
+            `weight 0 # drain`), or "slot" for the empty slots (rendered `disabled`). The options
+            of a drained server are recorded with the weight of the ready ones.
+        """
+        structure = []
+        servers = {}
+        balance = {}
+        backend = None
+        for line in config.splitlines():
+            if line and not line[0].isspace():
+                section = HAProxyRuntime._SECTION_RE.match(line)
+                backend = section.group(2) if section.group(1) == "backend" and section.group(2).startswith("srv_") else None
+                if backend:
+                    servers.setdefault(backend, {})
+            elif backend:
+                server = HAProxyRuntime._SERVER_RE.match(line)
+                if server:
+                    options, _, comment = server.group(3).partition("#")
+                    options = options.split()
+                    state = "ready"
+                    if "disabled" in options:
+                        state = comment.strip() if comment.strip() in HAProxyRuntime.SERVER_STATES else "slot"
+                    elif comment.strip() == "drain":
+                        state = "drain"
+                        options = " ".join(options).replace("weight 0", "weight 1").split()
+                    options = " ".join(option for option in options if option != "disabled")
+                    servers[backend][server.group(1)] = (server.group(2), options, state)
+                    continue
+                algorithm = HAProxyRuntime._BALANCE_RE.match(line)
+                if algorithm:
+                    balance[backend] = algorithm.group(1)
+            structure.append(line)
+        return "\n".join(structure), servers, balance
+
+    def sync(self, config):
+        """Record the configuration HAProxy was just (re)started with as the live state."""
+        self.structure, self.servers, self.balance = self.split_config(config)
+
+    def apply(self, config):
+        """
+        Try to bring the running HAProxy to `config` without a reload.
+
+        Returns:
+            True if servers were changed and the running HAProxy now matches `config`; False if a
+            reload is required; None if there is no server change to apply, so the difference
+            (if any) is not something the runtime API can handle.
+        """
+        if not self.enabled or self.structure is None or not os.path.exists(self.socket_path):
+            return False
+
+        structure, servers, _ = self.split_config(config)
+        if structure != self.structure:
+            return False
+
+        plan = self.plan(servers)
+        if plan is None:
+            return False
+
+        commands, live_servers = plan
+        if not commands:
+            return None
+        try:
+            for command, expected in commands:
+                self.execute(command, expected)
+        except (OSError, HAProxyRuntimeError) as e:
+            logger_haproxy.warning(f"Runtime API update failed, falling back to reload: {e}")
+            # The live state is now unknown; force a reload until the next sync()
+            self.structure = None
+            return False
+
+        self.servers = live_servers
+        logger_haproxy.debug(f"Applied {len(commands)} runtime API command(s)")
+        return True
+
+    def plan(self, servers):
+        """
+        Compute the runtime commands that turn the live servers into `servers`.
+
+        New addresses reuse, in order: a server whose address went away (set server addr),
+        an empty slot (set server addr + enable), or a new dynamic server (add server).
+        Servers that went away become empty slots when the backend has slots, otherwise
+        they are deleted. Servers whose state changed get `set server ... state`.
+
+        Returns:
+            tuple (commands, live_servers) or None if the change cannot be done at runtime.
+            Each command is a tuple (command, expected response fragment or "" for no output).
+        """
+        commands = []
+        live_servers = {}
+        for backend, desired in servers.items():
+            if backend not in self.servers:
+                return None
+            live = self.servers[backend]
+
+            desired_states = {address: state for address, _, state in desired.values() if state != "slot"}
+            desired_addresses = [address for address, _, state in desired.values() if state != "slot"]
+            desired_options = set(options for _, options, _ in desired.values())
+            if len(desired_options) > 1 or len(set(desired_addresses)) != len(desired_addresses):
+                return None
+            options = next(iter(desired_options), None)
+            if options is not None and any(live_options != options for _, live_options, _ in live.values()):
+                return None
+
+            has_slots = any(state == "slot" for _, _, state in list(live.values()) + list(desired.values()))
+            servers_state = dict(live)
+            active = {name: address for name, (address, _, state) in live.items() if state != "slot"}
+            removed = [name for name, address in active.items() if address not in desired_addresses]
+            added = [address for address in desired_addresses if address not in active.values()]
+            free_slots = [name for name, (_, _, state) in live.items() if state == "slot"]
+
+            if any(address.startswith("/") for address in added):
+                return None
+
+            # Servers that keep their address
+            for name, address in active.items():
+                if name not in removed:
+                    commands.extend(self._state_commands(backend, name, live[name][2], desired_states[address], options))
+                    servers_state[name] = (address, options, desired_states[address])
+
+            # Reuse servers whose address went away for the new addresses
+            while removed and added:
+                name = removed.pop(0)
+                address = added.pop(0)
+                commands.append(self._set_address_command(backend, name, address))
+                commands.extend(self._state_commands(backend, name, live[name][2], desired_states[address], options))
+                servers_state[name] = (address, options, desired_states[address])
+
+            # Fill empty slots
+            while free_slots and added:
+                name = free_slots.pop(0)
+                address = added.pop(0)
+                commands.append(self._set_address_command(backend, name, address))
+                commands.extend(self._state_commands(backend, name, "slot", desired_states[address], options))
+                servers_state[name] = (address, options, desired_states[address])
+
+            for name in removed:
+                commands.append((f"disable server {backend}/{name}", ""))
+                commands.append((f"shutdown sessions server {backend}/{name}", ""))
+                if has_slots:
+                    # Keep the server as an empty slot
+                    servers_state[name] = (servers_state[name][0], servers_state[name][1], "slot")
+                else:
+                    commands.append((f"del server {backend}/{name}", "Server deleted."))
+                    del servers_state[name]
+
+            if added and self.balance.get(backend, "roundrobin") not in HAProxyRuntime.DYNAMIC_BALANCE:
+                return None
+
+            index = 0
+            for address in added:
+                while f"srv-{index}" in servers_state:
+                    index += 1
+                name = f"srv-{index}"
+                commands.append((f"add server {backend}/{name} {address} {options}".rstrip(), "New server registered."))
+                # Servers are added in maintenance, like an empty slot
+                commands.extend(self._state_commands(backend, name, "slot", desired_states[address], options))
+                servers_state[name] = (address, options, desired_states[address])
+
+            live_servers[backend] = servers_state
+        return commands, live_servers
+
+    @staticmethod
+    def _set_address_command(backend, name, address):
+        ip, port = address.rsplit(":", 1)
+        return f"set server {backend}/{name} addr {ip} port {port}", "change"
+
+    @staticmethod
+    def _state_commands(backend, name, live_state, state, options):
+        """
+        Commands that move a server from `live_state` (or an empty slot) to `state`.
+
+        "drain" is a ready server with no weight, the way it is rendered, so that the
+        runtime state and the one HAProxy starts with after a reload are the same.
+        """
+        if live_state == state:
+            return []
+        commands = []
+        if live_state == "slot" and "check" in options.split():
+            commands.append((f"enable health {backend}/{name}", ""))
+        if state == "drain":
+            # Before enabling the server, so that it doesn't get new sessions in between
+            commands.append((f"set server {backend}/{name} weight 0", ""))
+        enabled = state != "maint"
+        if enabled and live_state == "slot":
+            commands.append((f"enable server {backend}/{name}", ""))
+        elif enabled != (live_state not in ("maint", "slot")):
+            commands.append((f"set server {backend}/{name} state {'ready' if enabled else 'maint'}", ""))
+        if live_state == "drain":
+            options = options.split()
+            weight = options[options.index("weight") + 1] if "weight" in options[:-1] else "1"
+            commands.append((f"set server {backend}/{name} weight {weight}", ""))
+        return commands
+
+    def execute(self, command, expected=""):
+        """
+        Send a command to the current worker through the master CLI.
+
+        Args:
+            command: Runtime API command
+            expected: Fragment the response must contain; "" means the command must not return output
+        """
+        logger_haproxy.debug(f"Runtime API: {command}")
+        response = self.send(f"@1 {command}")
+        if (expected and expected not in response) or (not expected and response.strip() != ""):
+            raise HAProxyRuntimeError(f"'{command}' returned '{response.strip()}'")
+        return response
+
+    def send(self, command):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            sock.sendall(f"{command}\n".encode())
+            chunks = []
+            while True:
+                chunk = sock.recv(4096)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        return b"".join(chunks).decode(errors="replace")
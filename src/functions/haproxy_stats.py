@@ -0,0 +1,201 @@
+import csv
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from .haproxy_runtime import HAProxyRuntime
+from .loggers import logger_haproxy
+
+
+class HAProxyStats:
+    """
+    Compact HAProxy statistics for the dashboard, read from the runtime API.
+
+    `show stat` and `show info` are queried at most once per `interval` seconds, however many
+    clients poll, and the parsed snapshot is shared by all of them. Every snapshot whose content
+    changed gets a new version; clients send it back (`since`) to receive only what changed.
+    Versions start with the controller start time, so they are not reused after a restart.
+    """
+    # Columns of `show stat` kept per proxy and per server, the ones shown by dashboard.html
+    PROXY_FIELDS = ("status", "mode", "scur", "smax", "stot", "rate", "bin", "bout", "ereq", "econ", "eresp",
+                    "hrsp_2xx", "hrsp_3xx", "hrsp_4xx", "hrsp_5xx", "req_rate", "req_tot", "rtime", "qcur")
+    SERVER_FIELDS = ("status", "addr", "scur", "smax", "stot", "rate", "bin", "bout", "weight", "check_status",
+                     "lastchg", "econ", "eresp", "hrsp_2xx", "hrsp_4xx", "hrsp_5xx", "rtime")
+    # Summed per host over its backends
+    HOST_FIELDS = ("scur", "stot", "rate", "bin", "bout", "econ", "eresp", "hrsp_2xx", "hrsp_3xx", "hrsp_4xx",
+                   "hrsp_5xx", "qcur")
+    INFO_FIELDS = ("Version", "Uptime_sec", "Nbthread", "CurrConns", "MaxConn", "CumConns", "CumReq", "ConnRate",
+                   "SessRate", "SslRate", "Idle_pct", "Run_queue")
+
+    _BACKEND_RE = re.compile(r"^srv_(.+)_(\d+)$")
+
+    def __init__(self, runtime=None, interval=None, history=16, clock=time.monotonic):
+        self.runtime = runtime if runtime is not None else HAProxyRuntime()
+        if interval is None:
+            try:
+                interval = float(os.getenv("EASYHAPROXY_STATS_INTERVAL", "2"))
+            except ValueError:
+                interval = 2
+        self.interval = interval
+        self.clock = clock
+        self.backend_hosts = {}  # backend name -> host, from the current configuration
+        self.snapshots = OrderedDict()  # version -> snapshot, the last `history` ones
+        self.history = history
+        self.epoch = format(int(time.time()), "x")
+        self.generation = 0
+        self.version = None
+        self.digest = None
+        self.refreshed_at = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _number(value):
+        if value is None or value == "":
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            return value
+
+    @staticmethod
+    def parse_stat(output):
+        """
+        Returns:
+            list of dict, one per line of the `show stat` CSV
+        """
+        lines = output.strip().splitlines()
+        if not lines or not lines[0].startswith("# "):
+            raise ValueError(f"Unexpected 'show stat' output: {output[:100]!r}")
+        reader = csv.DictReader([lines[0][2:]] + lines[1:])
+        return [row for row in reader if row.get("pxname")]
+
+    @staticmethod
+    def parse_info(output):
+        info = {}
+        for line in output.splitlines():
+            name, separator, value = line.partition(":")
+            if separator:
+                info[name.strip()] = value.strip()
+        return info
+
+    def host_of(self, backend):
+        """
+        Host of a `srv_<host>_<port>` backend generated by haproxy.cfg.j2.
+
+        Returns:
+            tuple (host, port) or None for the other proxies
+        """
+        match = self._BACKEND_RE.match(backend)
+        if not match:
+            return None
+        host = self.backend_hosts.get(backend, match.group(1).replace("_", "."))
+        return host, int(match.group(2))
+
+    def build(self, stat_rows, info):
+        """Compact snapshot content from the parsed `show stat` and `show info` outputs."""
+        frontends = {}
+        backends = {}
+        for row in stat_rows:
+            name, svname = row["pxname"], row["svname"]
+            if svname == "FRONTEND":
+                frontends[name] = {field: self._number(row.get(field)) for field in self.PROXY_FIELDS}
+            elif svname == "BACKEND":
+                backend = backends.setdefault(name, {"servers": {}})
+                backend.update({field: self._number(row.get(field)) for field in self.PROXY_FIELDS})
+            else:
+                backend = backends.setdefault(name, {"servers": {}})
+                backend["servers"][svname] = {field: self._number(row.get(field)) for field in self.SERVER_FIELDS}
+
+        hosts = {}
+        for name, backend in backends.items():
+            host_port = self.host_of(name)
+            if host_port is None:
+                continue
+            host, port = host_port
+            entry = hosts.setdefault(host, {"backends": [], "ports": [], "servers_up": 0, "servers_total": 0,
+                                            **{field: 0 for field in self.HOST_FIELDS}})
+            entry["backends"].append(name)
+            entry["ports"].append(port)
+            for server in backend["servers"].values():
+                # Empty slots are in maintenance; they are not servers of the host
+                if server["status"] == "MAINT":
+                    continue
+                entry["servers_total"] += 1
+                entry["servers_up"] += 1 if str(server["status"]).startswith("UP") else 0
+            for field in self.HOST_FIELDS:
+                if isinstance(backend.get(field), int):
+                    entry[field] += backend[field]
+
+        return {
+            "info": {field: self._number(info.get(field)) for field in self.INFO_FIELDS if field in info},
+            "frontends": frontends,
+            "backends": backends,
+            "hosts": hosts,
+        }
+
+    def query(self):
+        stat = self.runtime.send("@1 show stat")
+        info = self.runtime.send("@1 show info")
+        return self.build(self.parse_stat(stat), self.parse_info(info))
+
+    def snapshot(self):
+        """
+        Returns:
+            The latest snapshot {"version", "time", "error", "info", "frontends", "backends", "hosts"},
+            querying HAProxy when the cached one is older than `interval`.
+        """
+        with self.lock:
+            now = self.clock()
+            if self.refreshed_at is not None and now - self.refreshed_at < self.interval:
+                return self.snapshots[self.version]
+            self.refreshed_at = now
+
+            try:
+                content = self.query()
+                content["error"] = None
+            except (OSError, ValueError) as e:
+                logger_haproxy.debug(f"Failed to read HAProxy stats: {e}")
+                content = {"error": str(e), "info": {}, "frontends": {}, "backends": {}, "hosts": {}}
+
+            digest = hashlib.sha1(json.dumps(content, sort_keys=True).encode(), usedforsecurity=False).hexdigest()
+            if digest != self.digest:
+                self.digest = digest
+                self.generation += 1
+                self.version = f"{self.epoch}-{self.generation}"
+                self.snapshots[self.version] = {"version": self.version, **content}
+                while len(self.snapshots) > self.history:
+                    self.snapshots.popitem(last=False)
+            self.snapshots[self.version]["time"] = int(time.time())
+            return self.snapshots[self.version]
+
+    @staticmethod
+    def etag(snapshot):
+        return f'"{snapshot["version"]}"'
+
+    def delta(self, since):
+        """
+        Changes since the snapshot `since`.
+
+        Returns:
+            The full snapshot with "full": True when `since` is no longer (or was never) known,
+            otherwise {"version", "since", "full": False, "time", "error", "info", "frontends",
+            "backends", "hosts", "removed"} with only the entries that changed.
+        """
+        current = self.snapshot()
+        with self.lock:
+            previous = self.snapshots.get(since)
+        if previous is None:
+            return {**current, "full": True}
+
+        result = {"version": current["version"], "since": since, "full": False, "time": current["time"],
+                  "error": current["error"], "removed": {}}
+        result["info"] = {name: value for name, value in current["info"].items() if previous["info"].get(name) != value}
+        for section in ("frontends", "backends", "hosts"):
+            result[section] = {name: value for name, value in current[section].items()
+                               if previous[section].get(name) != value}
+            result["removed"][section] = sorted(set(previous[section]) - set(current[section]))
+        return result
@@ -0,0 +1,220 @@
+import functools
+import inspect
+import math
+import threading
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+class Metric:
+    """Base class of the metrics; each one holds a value (or state) per label set."""
+    TYPE = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        self.clear()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        with self.lock:
+            # Metrics without labels are exposed from the start
+            self.values = {} if self.labelnames or self.TYPE == "histogram" else {(): 0}
+
+    def samples(self):
+        """Returns: list of (suffix, labels, value)"""
+        with self.lock:
+            return [("", key, value) for key, value in sorted(self.values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self.values.get(self._key(labels), 0)
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def replace(self, samples):
+        """
+        Swap in the values of every label set at once, dropping the label sets not in `samples`.
+        Collectors running on concurrent scrapes use it so a render never sees a partial gauge.
+
+        Args:
+            samples: iterable of (value, labels dict)
+        """
+        values = {self._key(labels): value for value, labels in samples}
+        with self.lock:
+            self.values = values
+
+    def get(self, **labels):
+        return self.values.get(self._key(labels))
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0, "count": 0})
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][index] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    def get(self, **labels):
+        return self.values.get(self._key(labels))
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, state in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, state["buckets"]):
+                    samples.append(("_bucket", key + (("le", _format_value(bound)),), count))
+                samples.append(("_sum", key, state["sum"]))
+                samples.append(("_count", key, state["count"]))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Minimal Prometheus registry for the controller metrics, rendered in the text exposition format.
+
+    Collectors registered with add_collector() run before each render, to refresh gauges
+    that are cheaper to compute on scrape than on every cycle.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=Histogram.DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        for collector in self.collectors:
+            collector()
+        return "\n".join(metric.render() for metric in self.metrics.values()) + "\n"
+
+
+class ApiCallCounter:
+    """
+    Proxy around a discovery API client that counts the calls per processor and method.
+
+    Methods are counted by their attribute path, e.g. `containers.list` for the Docker client.
+    Objects reached from the client (e.g. `client.containers`) are proxied one level deep.
+    """
+
+    def __init__(self, client, processor, path="", depth=0):
+        self._client = client
+        self._processor = processor
+        self._path = path
+        self._depth = depth
+
+    def __getattr__(self, name):
+        value = getattr(self._client, name)
+        path = f"{self._path}.{name}" if self._path else name
+        if inspect.isroutine(value) or (self._depth > 0 and callable(value)):
+            @functools.wraps(value)
+            def call(*args, **kwargs):
+                API_CALLS.inc(processor=self._processor, call=path)
+                return value(*args, **kwargs)
+            return call
+        if self._depth == 0 and (callable(value) or hasattr(value, "__dict__")):
+            return ApiCallCounter(value, self._processor, path, self._depth + 1)
+        return value
+
+    def __call__(self, *args, **kwargs):
+        API_CALLS.inc(processor=self._processor, call=self._path)
+        return self._client(*args, **kwargs)
+
+
+metrics_registry = MetricsRegistry()
+
+CYCLE_DURATION = metrics_registry.histogram(
+    "easyhaproxy_cycle_duration_seconds", "Duration of the discovery cycle phases.", ["phase"])
+RELOADS = metrics_registry.counter(
+    "easyhaproxy_reloads_total", "HAProxy reloads.")
+RELOAD_CHANGES = metrics_registry.counter(
+    "easyhaproxy_reload_changes_total", "Changes applied by HAProxy reloads, by reason.", ["reason"])
+RUNTIME_UPDATES = metrics_registry.counter(
+    "easyhaproxy_runtime_updates_total", "Backend server changes applied through the runtime API without reload.")
+DISCOVERED_CONTAINERS = metrics_registry.gauge(
+    "easyhaproxy_discovered_containers", "Containers, services or ingresses discovered in the last cycle.")
+DISCOVERED_HOSTS = metrics_registry.gauge(
+    "easyhaproxy_discovered_hosts", "Hosts (host:port) served by the current configuration.")
+DISCOVERED_BACKENDS = metrics_registry.gauge(
+    "easyhaproxy_discovered_backends", "Backends in the current configuration.")
+PLUGIN_DURATION = metrics_registry.histogram(
+    "easyhaproxy_plugin_duration_seconds", "Plugin execution time.", ["plugin", "type"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5))
+CERTIFICATE_EXPIRY = metrics_registry.gauge(
+    "easyhaproxy_certificate_expiry_timestamp_seconds", "Expiration time of the certificates, in seconds since epoch.",
+    ["certificate"])
+CERTBOT_RUNS = metrics_registry.counter(
+    "easyhaproxy_certbot_runs_total", "Certbot executions by command and result.", ["command", "result"])
+API_CALLS = metrics_registry.counter(
+    "easyhaproxy_api_calls_total", "Discovery API calls by processor and method.", ["processor", "call"])
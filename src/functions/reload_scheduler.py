@@ -0,0 +1,89 @@
+import os
+import time
+
+from .loggers import logger_haproxy
+
+
+class ReloadScheduler:
+    """
+    Coalesce the changes that require an HAProxy reload.
+
+    Every reload leaves the previous worker running until its connections drain, so a burst
+    of changes (e.g. a rolling deploy) is merged into a single reload. A reload is due when:
+    - no new change arrived for `quiet_period` seconds, and
+    - at least `min_interval` seconds passed since the previous reload;
+    or when the oldest pending change waited `max_delay` seconds, or an urgent change was requested.
+    """
+
+    def __init__(self, quiet_period=None, min_interval=None, max_delay=None, clock=time.monotonic):
+        self.quiet_period = self._setting("EASYHAPROXY_RELOAD_QUIET_PERIOD", 2, quiet_period)
+        self.min_interval = self._setting("EASYHAPROXY_RELOAD_MIN_INTERVAL", 5, min_interval)
+        self.max_delay = self._setting("EASYHAPROXY_RELOAD_MAX_DELAY", 30, max_delay)
+        self.clock = clock
+        self.reasons = []
+        self.urgent = False
+        self.first_change = None
+        self.last_change = None
+        self.last_reload = None
+
+    @staticmethod
+    def _setting(env_name, default, value):
+        if value is not None:
+            return value
+        try:
+            return int(os.getenv(env_name, str(default)))
+        except ValueError:
+            return default
+
+    @property
+    def pending(self):
+        return len(self.reasons)
+
+    def request(self, reason, urgent=False):
+        """Record a change that requires a reload. Urgent changes (e.g. HAProxy is down) are not delayed."""
+        now = self.clock()
+        if self.first_change is None:
+            self.first_change = now
+        self.last_change = now
+        self.urgent = self.urgent or urgent
+        self.reasons.append(reason)
+        logger_haproxy.debug(f"Reload requested: {reason} ({self.pending} pending)")
+
+    def wait_time(self):
+        """
+        Returns:
+            Seconds until the pending reload is due; 0 if it is due now; None if nothing is pending.
+        """
+        if not self.reasons:
+            return None
+        if self.urgent:
+            return 0
+
+        now = self.clock()
+        ready_at = self.last_change + self.quiet_period
+        if self.last_reload is not None:
+            ready_at = max(ready_at, self.last_reload + self.min_interval)
+        ready_at = min(ready_at, self.first_change + self.max_delay)
+        return max(ready_at - now, 0)
+
+    def due(self):
+        return self.wait_time() == 0
+
+    def cancel(self):
+        """Drop the pending changes without a reload, e.g. when they were reverted."""
+        self.reasons = []
+        self.urgent = False
+        self.first_change = None
+        self.last_change = None
+
+    def reloaded(self):
+        """
+        Mark the pending changes as applied by a reload.
+
+        Returns:
+            The reasons of the changes merged into this reload
+        """
+        reasons = self.reasons
+        self.cancel()
+        self.last_reload = self.clock()
+        return reasons
@@ -0,0 +1,99 @@
+import gzip
+import hashlib
+import os
+import threading
+
+try:
+    import brotli
+except ImportError:  # optional: gzip is always available
+    brotli = None
+
+
+class StaticAsset:
+    """
+    A file served by the dashboard server, with its compressed variants.
+
+    The file is read again only when its mtime or size changes, and the gzip (and brotli,
+    when the module is installed) bodies are compressed once per version. Each variant has
+    its own strong ETag, so a cached response is revalidated with a 304.
+    """
+
+    def __init__(self, path, content_type):
+        self.path = path
+        self.content_type = content_type
+        self.version = None
+        self.variants = {}  # encoding ("identity", "gzip", "br") -> (body, etag)
+        self.lock = threading.Lock()
+
+    def _load(self):
+        try:
+            stat = os.stat(self.path)
+            version = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            version = None
+        if version == self.version and self.variants:
+            return self.variants
+
+        with self.lock:
+            if version == self.version and self.variants:
+                return self.variants
+            try:
+                with open(self.path, "rb") as f:
+                    body = f.read()
+            except OSError:
+                body = b""
+            digest = hashlib.sha256(body).hexdigest()[:32]
+            variants = {"identity": (body, f'"{digest}"')}
+            # mtime=0 keeps the compressed body (and so its ETag) deterministic
+            variants["gzip"] = (gzip.compress(body, compresslevel=9, mtime=0), f'"{digest}-gzip"')
+            if brotli is not None:
+                variants["br"] = (brotli.compress(body), f'"{digest}-br"')
+            self.variants = variants
+            self.version = version
+            return variants
+
+    @staticmethod
+    def accepted_encodings(accept_encoding):
+        """
+        Returns:
+            set of the encodings with q > 0 in an Accept-Encoding header
+        """
+        accepted = set()
+        for item in (accept_encoding or "").split(","):
+            coding, _, params = item.strip().partition(";")
+            quality = 1.0
+            for param in params.split(";"):
+                name, _, value = param.strip().partition("=")
+                if name.lower() == "q":
+                    try:
+                        quality = float(value)
+                    except ValueError:
+                        quality = 0.0
+            if coding and quality > 0:
+                accepted.add(coding.lower())
+        return accepted
+
+    @staticmethod
+    def etag_matches(if_none_match, etag):
+        """Weak comparison of an If-None-Match header against an ETag (RFC 9110, 13.1.2)."""
+        if not if_none_match:
+            return False
+        for candidate in if_none_match.split(","):
+            candidate = candidate.strip()
+            if candidate == "*" or candidate.removeprefix("W/") == etag:
+                return True
+        return False
+
+    def select(self, accept_encoding):
+        """
+        Returns:
+            tuple (body, etag, encoding) of the best variant for the client; encoding is None for identity
+        """
+        variants = self._load()
+        accepted = self.accepted_encodings(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in variants and (encoding in accepted or "*" in accepted):
+                body, etag = variants[encoding]
+                return body, etag, encoding
+        body, etag = variants["identity"]
+        return body, etag, None
@@ -1,8 +1,10 @@
 import importlib.util
 import os
 import sys
+import time
 
 from functions import Consts, logger_easyhaproxy
+from functions.metrics import PLUGIN_DURATION
 
 from .interface import PluginInterface
 from .types import PluginContext, PluginResult, PluginType
@@ -28,15 +30,22 @@ class PluginManager:
         self.global_plugins: list[PluginInterface] = []
         self.domain_plugins: list[PluginInterface] = []
         self.logger = logger_easyhaproxy
+        self._plugin_classes: list[type] = []  # Plugin classes in load order
+        self._plugin_files: dict[str, float] = {}  # filepath -> mtime at load time
 
     def load_plugins(self) -> None:
         """
         Discover and load plugins from the plugins directory
         Loads both builtin plugins and external plugins
         """
+        self.plugins = {}
+        self.global_plugins = []
+        self.domain_plugins = []
+        self._plugin_classes = []
+        self._plugin_files = {}
+
         # Load builtin plugins first
-        builtin_dir = os.path.join(os.path.dirname(__file__), "builtin")
-        self._load_plugins_from_directory(builtin_dir, "builtin")
+        self._load_plugins_from_directory(self._builtin_dir(), "builtin")
 
         # Load external plugins from /etc/easyhaproxy/plugins
         if os.path.exists(self.plugins_dir):
@@ -44,6 +53,67 @@ class PluginManager:
         else:
             self.logger.debug(f"Plugin directory {self.plugins_dir} does not exist, skipping external plugins")
 
+    def reload_if_changed(self) -> bool:
+        """
+        Reload all plugins if any plugin file was added, removed or modified since the last load
+
+        Returns:
+            True if the plugins were reloaded
+        """
+        if self._scan_plugin_files() == self._plugin_files:
+            return False
+
+        self.logger.info("Plugin files changed, reloading plugins")
+        self.load_plugins()
+        return True
+
+    def reset_plugins(self) -> None:
+        """
+        Replace every plugin with a fresh instance of its already loaded class
+
+        Plugins keep the configuration applied from labels in their instance state,
+        so a long-lived manager needs new instances at the start of each discovery cycle.
+        """
+        self.plugins = {}
+        self.global_plugins = []
+        self.domain_plugins = []
+        for plugin_class in self._plugin_classes:
+            self._register_plugin(plugin_class())
+
+    @staticmethod
+    def _builtin_dir() -> str:
+        return os.path.join(os.path.dirname(__file__), "builtin")
+
+    @staticmethod
+    def _list_plugin_files(directory: str) -> list[str]:
+        if not os.path.exists(directory):
+            return []
+        return [
+            os.path.join(directory, filename)
+            for filename in os.listdir(directory)
+            if filename.endswith(".py") and not filename.startswith("__")
+        ]
+
+    def _scan_plugin_files(self) -> dict[str, float]:
+        """Return the current mtime of every plugin file, keyed by path"""
+        files = {}
+        for directory in (self._builtin_dir(), self.plugins_dir):
+            for filepath in self._list_plugin_files(directory):
+                try:
+                    files[filepath] = os.path.getmtime(filepath)
+                except OSError:
+                    continue
+        return files
+
+    def _register_plugin(self, plugin: PluginInterface) -> None:
+        self.plugins[plugin.name] = plugin
+
+        # Categorize by type
+        if plugin.plugin_type == PluginType.GLOBAL:
+            self.global_plugins.append(plugin)
+        elif plugin.plugin_type == PluginType.DOMAIN:
+            self.domain_plugins.append(plugin)
+
     def _load_plugins_from_directory(self, directory: str, source: str) -> None:
         """
         Load plugins from a specific directory
@@ -52,42 +122,35 @@ class PluginManager:
             directory: Path to directory containing plugins
             source: Source identifier ("builtin" or "external")
         """
-        if not os.path.exists(directory):
-            return
+        for filepath in self._list_plugin_files(directory):
+            filename = os.path.basename(filepath)
+            module_name = f"plugins.{source}.{filename[:-3]}"
 
-        for filename in os.listdir(directory):
-            if filename.endswith(".py") and not filename.startswith("__"):
-                filepath = os.path.join(directory, filename)
-                module_name = f"plugins.{source}.{filename[:-3]}"
+            try:
+                self._plugin_files[filepath] = os.path.getmtime(filepath)
+
+                # Load module from file
+                spec = importlib.util.spec_from_file_location(module_name, filepath)
+                if spec and spec.loader:
+                    module = importlib.util.module_from_spec(spec)
+                    sys.modules[module_name] = module
+                    spec.loader.exec_module(module)
+
+                    # Find plugin classes in module
+                    for item_name in dir(module):
+                        item = getattr(module, item_name)
+                        if (isinstance(item, type) and
+                            issubclass(item, PluginInterface) and
+                            item is not PluginInterface):
+                            # Instantiate plugin
+                            plugin = item()
+                            self._plugin_classes.append(item)
+                            self._register_plugin(plugin)
+
+                            self.logger.debug(f"Loaded {source} plugin: {plugin.name} ({plugin.plugin_type.value})")
 
-                try:
-                    # Load module from file
-                    spec = importlib.util.spec_from_file_location(module_name, filepath)
-                    if spec and spec.loader:
-                        module = importlib.util.module_from_spec(spec)
-                        sys.modules[module_name] = module
-                        spec.loader.exec_module(module)
-
-                        # Find plugin classes in module
-                        for item_name in dir(module):
-                            item = getattr(module, item_name)
-                            if (isinstance(item, type) and
-                                issubclass(item, PluginInterface) and
-                                item is not PluginInterface):
-                                # Instantiate plugin
-                                plugin = item()
-                                self.plugins[plugin.name] = plugin
-
-                                # Categorize by type
-                                if plugin.plugin_type == PluginType.GLOBAL:
-                                    self.global_plugins.append(plugin)
-                                elif plugin.plugin_type == PluginType.DOMAIN:
-                                    self.domain_plugins.append(plugin)
-
-                                self.logger.debug(f"Loaded {source} plugin: {plugin.name} ({plugin.plugin_type.value})")
-
-                except Exception as e:
-                    self._handle_error(f"Failed to load plugin from {filepath}: {str(e)}")
+            except Exception as e:
+                self._handle_error(f"Failed to load plugin from {filepath}: {str(e)}")
 
     def configure_plugins(self, plugins_config: dict) -> None:
         """
@@ -160,7 +223,11 @@ class PluginManager:
 
             try:
                 self.logger.debug(f"Executing global plugin: {plugin.name}")
-                result = plugin.process(context)
+                start = time.perf_counter()
+                try:
+                    result = plugin.process(context)
+                finally:
+                    PLUGIN_DURATION.observe(time.perf_counter() - start, plugin=plugin.name, type="global")
                 results.append(result)
 
                 if result.metadata:
@@ -191,7 +258,11 @@ class PluginManager:
 
             try:
                 self.logger.debug(f"Executing domain plugin: {plugin.name} for domain: {context.domain}")
-                result = plugin.process(context)
+                start = time.perf_counter()
+                try:
+                    result = plugin.process(context)
+                finally:
+                    PLUGIN_DURATION.observe(time.perf_counter() - start, plugin=plugin.name, type="domain")
                 results.append(result)
 
                 if result.metadata:
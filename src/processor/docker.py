@@ -1,35 +1,107 @@
-import socket
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
 
-import docker
+from functions import ContainerEnv, logger_easyhaproxy
 
+from .docker_endpoint import DockerEndpoint
 from .interface import ProcessorInterface
 
 
 class Docker(ProcessorInterface):
+    """
+    Discover the labeled containers of one or more Docker endpoints.
+
+    Each endpoint keeps its own container index (see DockerEndpoint). With several endpoints
+    (EASYHAPROXY_DOCKER_HOSTS) the due resyncs run in parallel in a bounded thread pool, and
+    a cycle waits at most `timeout` seconds for them: an endpoint that is slower than that keeps
+    its resync running in the background and contributes its last index to this cycle.
+
+    Remote endpoints use the HAProxy network EASYHAPROXY_DOCKER_NETWORK, otherwise the network
+    of the HAProxy container found on a local endpoint.
+    """
+
     def __init__(self, filename=None):
         self.parsed_object = None
-        self.client = docker.from_env()
+        hosts = [host.strip() for host in os.getenv("EASYHAPROXY_DOCKER_HOSTS", "").split(",") if host.strip()]
+        try:
+            self.timeout = float(os.getenv("EASYHAPROXY_DOCKER_TIMEOUT", "10"))
+        except ValueError:
+            self.timeout = 10
+        label = ContainerEnv.read()['lookup_label']
+        network_name = os.getenv("EASYHAPROXY_DOCKER_NETWORK", "").strip() or None
+        if not hosts:
+            self.endpoints = [DockerEndpoint(label, self.notify_change, network_name=network_name)]
+        else:
+            self.endpoints = [DockerEndpoint(label, self.notify_change, base_url=host, timeout=self.timeout,
+                                             name=f"docker-{index}", network_name=network_name)
+                              for index, host in enumerate(hosts)]
+        self.network_warned = False
+        self.pool = None
+        self.resyncs = {}  # endpoint name -> Future of the resync still running
+        if len(self.endpoints) > 1:
+            try:
+                workers = int(os.getenv("EASYHAPROXY_DOCKER_WORKERS", "8"))
+            except ValueError:
+                workers = 8
+            self.pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(self.endpoints))),
+                                           thread_name_prefix="docker-discovery")
         super().__init__()
 
     def inspect_network(self):
-        try:
-            ha_proxy_network_name = next(
-                iter(self.client.containers.get(socket.gethostname()).attrs["NetworkSettings"]["Networks"]))
-        except Exception:
-            # HAProxy is not running in a container, get first container network
-            if len(self.client.containers.list()) == 0:
-                return
-            ha_proxy_network_name = next(iter(
-                self.client.containers.get(self.client.containers.list()[0].name).attrs["NetworkSettings"]["Networks"]))
-
-        ha_proxy_network = self.client.networks.get(ha_proxy_network_name)
+        if self.pool is None:
+            endpoint = self.endpoints[0]
+            if endpoint.resync_due():
+                endpoint.resync()
+        else:
+            self.resync_endpoints()
+        self.share_network()
 
         self.parsed_object = {}
-        for container in self.client.containers.list():
-            # Issue 32 - Docker container cannot connect to containers in different network.
-            if ha_proxy_network_name not in container.attrs["NetworkSettings"]["Networks"].keys():
-                ha_proxy_network.connect(container.name)
-                container = self.client.containers.get(container.name)  # refresh object
-
-            ip_address = container.attrs["NetworkSettings"]["Networks"][ha_proxy_network_name]["IPAddress"]
-            self.parsed_object[ip_address] = container.labels
\ No newline at end of file
+        for endpoint in self.endpoints:
+            endpoint.collect(self.parsed_object, self.server_states)
+
+    def share_network(self):
+        """Give the remote endpoints without a network the one of the HAProxy container."""
+        remote = [endpoint for endpoint in self.endpoints if endpoint.remote and endpoint.configured_network is None]
+        if not remote:
+            return
+        network_name = next((endpoint.network_name for endpoint in self.endpoints
+                             if endpoint.runs_haproxy and endpoint.network_name is not None), None)
+        if network_name is None:
+            if not self.network_warned:
+                self.network_warned = True
+                logger_easyhaproxy.warning("The HAProxy network is unknown: the containers of the remote Docker "
+                                           "endpoints are not discovered. Set EASYHAPROXY_DOCKER_NETWORK")
+            return
+        for endpoint in remote:
+            endpoint.use_network(network_name)
+
+    def resync_endpoints(self):
+        """Resync the endpoints that are due in parallel, waiting at most `timeout` seconds for them."""
+        submitted = []
+        for endpoint in self.endpoints:
+            if endpoint.name not in self.resyncs and endpoint.resync_due():
+                self.resyncs[endpoint.name] = self.pool.submit(endpoint.resync)
+                submitted.append(self.resyncs[endpoint.name])
+
+        # A resync still running from an earlier cycle has already cost its timeout once
+        wait(submitted, timeout=self.timeout)
+        for endpoint in self.endpoints:
+            future = self.resyncs.get(endpoint.name)
+            if future is None:
+                continue
+            if not future.done():
+                if future in submitted:
+                    logger_easyhaproxy.warning(f"Docker endpoint {endpoint.base_url} did not answer within "
+                                               f"{self.timeout}s; using its last known containers")
+                    # Picked up by the next cycle, without waiting for the next poll
+                    future.add_done_callback(lambda _, name=endpoint.name: self.notify_change(f"{name} listed"))
+                continue
+            del self.resyncs[endpoint.name]
+            if future.exception() is not None:
+                logger_easyhaproxy.warning(f"Failed to list the containers of the Docker endpoint "
+                                           f"{endpoint.base_url}: {future.exception()}")
+
+    def watch(self):
+        for endpoint in self.endpoints:
+            self._start_watcher(f"{endpoint.name}-events", endpoint.watch_events)
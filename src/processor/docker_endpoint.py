@@ -0,0 +1,278 @@
+import os
+import socket
+import threading
+import time
+from typing import Final
+
+import docker
+
+from functions import ApiCallCounter, logger_easyhaproxy
+
+from .network_attacher import NetworkAttacher
+
+
+class DockerEndpoint:
+    """
+    Index of the labeled containers of one Docker endpoint (a unix socket or a tcp:// daemon).
+
+    The index is rebuilt by resync() and kept up to date by the events stream in between.
+    The client is created on first use, so an endpoint that is down doesn't block the others
+    from being set up.
+
+    The HAProxy network is the configured `network_name`, otherwise the network of the HAProxy
+    container on this endpoint. HAProxy doesn't run on a remote (e.g. tcp://) endpoint, so a
+    remote endpoint only gets a network through use_network(), and indexes nothing until then.
+    """
+    # Container events that can change the discovered backends
+    WATCH_ACTIONS: Final[tuple] = ("start", "stop", "die", "destroy", "pause", "unpause", "rename", "update",
+                                   "health_status")
+    # Container events after which the container is gone
+    REMOVE_ACTIONS: Final[tuple] = ("stop", "die", "destroy")
+    # Network events that can change the IP address of a container on the HAProxy network
+    NETWORK_ACTIONS: Final[tuple] = ("connect", "disconnect")
+    # Server state of the containers whose healthcheck doesn't pass (yet): no traffic while starting,
+    # and the running sessions finish when it becomes unhealthy
+    HEALTH_STATES: Final[dict] = {"starting": "maint", "unhealthy": "drain"}
+
+    def __init__(self, label, notify, base_url=None, timeout=None, name="docker", network_name=None):
+        self.label = label
+        self.notify = notify
+        # None: the local daemon, from the DOCKER_HOST environment or the default socket
+        self.base_url = base_url
+        self.timeout = timeout
+        self.name = name
+        self._client = None
+        # Running labeled containers by id: {"name", "labels", "health", "networks": {network name: IP address}}
+        self.containers = {}
+        # HAProxy's network, configured or looked up once
+        self.configured_network = network_name
+        self.network_name = network_name
+        self.network = None
+        self.remote = base_url is not None and not base_url.startswith("unix://")
+        # True once the HAProxy container was found on this endpoint
+        self.runs_haproxy = False
+        self.index_lock = threading.Lock()
+        # While a resync lists the containers: {container id: index entry or None} of the events applied
+        # meanwhile, replayed onto the listing so it doesn't bring back an older state
+        self.resync_events = None
+        # Connects the labeled containers to the HAProxy network outside of the discovery pass
+        self.attacher = NetworkAttacher(name, self.connect_container,
+                                        lambda container_id: notify(f"container {container_id} attached"))
+        self.events_active = False
+        self.last_resync = None
+        try:
+            self.resync_interval = int(os.getenv("EASYHAPROXY_RESYNC_INTERVAL", "300"))
+        except ValueError:
+            self.resync_interval = 300
+
+    @property
+    def client(self):
+        if self._client is None:
+            if self.base_url is None:
+                client = docker.from_env()
+            else:
+                client = docker.DockerClient(base_url=self.base_url, timeout=self.timeout)
+            self._client = ApiCallCounter(client, "docker")
+        return self._client
+
+    def resync_due(self):
+        """Without the events stream the index is rebuilt every cycle, otherwise every `resync_interval` seconds."""
+        return (not self.events_active
+                or self.last_resync is None
+                or time.monotonic() - self.last_resync >= self.resync_interval)
+
+    def collect(self, parsed_object, server_states):
+        """Add the indexed containers on the HAProxy network to `parsed_object` and `server_states`."""
+        with self.index_lock:
+            if self.network_name is None:
+                return
+            for container in self.containers.values():
+                if self.network_name not in container["networks"]:
+                    continue
+                ip_address = container["networks"][self.network_name]
+                if ip_address in parsed_object:
+                    # Only addresses reachable from HAProxy (e.g. on an overlay network) are unique across endpoints
+                    logger_easyhaproxy.warning(f"Container {container['name']} on {self.name} has the address "
+                                               f"{ip_address} of another container; ignoring it")
+                    continue
+                parsed_object[ip_address] = container["labels"]
+                if container["health"] in DockerEndpoint.HEALTH_STATES:
+                    server_states[ip_address] = DockerEndpoint.HEALTH_STATES[container["health"]]
+
+    @staticmethod
+    def index_entry(container):
+        """Index entry from the attributes of containers.get() or of containers.list(sparse=True)."""
+        attrs = container.attrs
+        name = attrs.get("Name") or attrs.get("Names", [""])[0]
+        if "Config" in attrs:
+            labels = attrs["Config"].get("Labels")
+            health = (attrs.get("State", {}).get("Health") or {}).get("Status")
+        else:
+            # The listing only has the health in the status text, e.g. "Up 5 seconds (health: starting)"
+            labels = attrs.get("Labels")
+            health = next((state for state in ("starting", "unhealthy", "healthy") if f"{state})" in attrs.get("Status", "")),
+                          None)
+        return {
+            "name": name.lstrip("/"),
+            "labels": labels or {},
+            "health": health,
+            "networks": {network: settings["IPAddress"]
+                         for network, settings in attrs["NetworkSettings"]["Networks"].items()},
+        }
+
+    def find_network_name(self, containers):
+        """Network of the HAProxy container, or of the first container when HAProxy doesn't run in a container."""
+        if self.remote:
+            # The first container's network would be a guess that HAProxy can't reach
+            return None
+        try:
+            network_name = next(iter(self.client.containers.get(socket.gethostname()).attrs["NetworkSettings"]["Networks"]))
+            self.runs_haproxy = True
+            return network_name
+        except Exception:
+            # HAProxy is not running in a container, get first container network
+            if len(containers) == 0:
+                return None
+            return next(iter(containers[0].attrs["NetworkSettings"]["Networks"]))
+
+    def attach(self, container):
+        """Request the connection of the container to the HAProxy network when it is not on it yet."""
+        # Issue 32 - Docker container cannot connect to containers in different network.
+        if self.network_name in container.attrs["NetworkSettings"]["Networks"].keys():
+            return False
+        self.attacher.request(container.id, container.id)
+        return True
+
+    def connect_container(self, container_id):
+        """Connect a container to the HAProxy network. Runs in the NetworkAttacher worker."""
+        try:
+            if self.network is None:
+                self.network = self.client.networks.get(self.network_name)
+        except docker.errors.NotFound:
+            if self.configured_network is None and not self.remote:
+                # The HAProxy network is gone; look it up again on the next resync
+                self.network_name = None
+            raise
+        self.network.connect(container_id)
+
+    def use_network(self, network_name):
+        """Use the HAProxy network found on another endpoint. The next cycle lists the containers again."""
+        with self.index_lock:
+            if network_name == self.network_name:
+                return
+            self.network_name = network_name
+            self.network = None
+        self.last_resync = None
+
+    def resync(self):
+        """Rebuild the container index from a single listing of the running containers."""
+        self.last_resync = time.monotonic()
+        with self.index_lock:
+            self.resync_events = {}
+        # Sparse: the labels and networks come with the listing, without one inspect call per container.
+        # The API calls run outside of the lock, so collect() never waits for a slow endpoint.
+        try:
+            containers = self.client.containers.list(sparse=True)
+        except Exception:
+            # Retried on the next cycle
+            self.last_resync = None
+            with self.index_lock:
+                self.resync_events = None
+            raise
+        network_name = self.network_name
+        if network_name is None:
+            network_name = self.find_network_name(containers)
+
+        # The Docker API only filters on exact label keys, so the prefix is matched here,
+        # before any per-container call
+        index = {}
+        detached = set()
+        with self.index_lock:
+            if self.network_name is not None:
+                # Set by use_network() during the listing
+                network_name = self.network_name
+            self.network_name = network_name
+            if network_name is not None:
+                for container in containers:
+                    entry = self.index_entry(container)
+                    if not self.is_labeled(entry["labels"]):
+                        continue
+                    # Containers not on the HAProxy network yet are indexed, and discovered once connected
+                    if self.attach(container):
+                        detached.add(container.id)
+                    index[container.id] = entry
+            # The events handled during the listing are newer than it
+            for container_id, entry in self.resync_events.items():
+                index.pop(container_id, None)
+                detached.discard(container_id)
+                if entry is not None:
+                    index[container_id] = entry
+                    if network_name not in entry["networks"]:
+                        detached.add(container_id)
+            self.resync_events = None
+            self.containers = index
+        self.attacher.retain(detached)
+
+    def is_labeled(self, labels):
+        return any(key.startswith(f"{self.label}.") for key in labels)
+
+    def apply_event(self, event):
+        """
+        Update the container index from one Docker event.
+
+        Returns:
+            The reason to notify when a labeled container changed, otherwise None
+        """
+        event_type = event.get("Type")
+        # Health events are "health_status: <status>"
+        action = event.get("Action", "").split(":")[0]
+        actor = event.get("Actor", {})
+        attributes = actor.get("Attributes", {})
+        if event_type == "network":
+            if action not in DockerEndpoint.NETWORK_ACTIONS or attributes.get("name") != self.network_name:
+                return None
+            container_id = attributes.get("container")
+        elif event_type == "container" and action in DockerEndpoint.WATCH_ACTIONS:
+            container_id = actor.get("ID") or event.get("id")
+        else:
+            return None
+
+        new = None
+        container = None
+        if event_type == "network" or action not in DockerEndpoint.REMOVE_ACTIONS:
+            try:
+                container = self.client.containers.get(container_id)
+                if container.status in ("running", "paused") and self.is_labeled(container.labels):
+                    new = self.index_entry(container)
+            except docker.errors.NotFound:
+                pass
+
+        with self.index_lock:
+            old = self.containers.pop(container_id, None)
+            if new is not None:
+                self.containers[container_id] = new
+                self.attach(container)
+            else:
+                self.attacher.discard(container_id)
+            if self.resync_events is not None:
+                self.resync_events[container_id] = new
+
+        # Only labeled containers are indexed
+        if old == new:
+            return None
+        name = (new or old or {}).get("name") or attributes.get("name", container_id)
+        return f"container {name} {action}"
+
+    def watch_events(self):
+        """Keep the container index up to date from the Docker events stream and notify the changes."""
+        events = self.client.events(decode=True, filters={"type": ["container", "network"]})
+        # Events sent before the subscription were missed: rebuild the index on the next cycle
+        self.last_resync = None
+        self.events_active = True
+        try:
+            for event in events:
+                reason = self.apply_event(event)
+                if reason:
+                    self.notify(reason)
+        finally:
+            self.events_active = False
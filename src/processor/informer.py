@@ -0,0 +1,115 @@
+import threading
+
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+
+from functions import logger_easyhaproxy
+
+
+class Informer:
+    """
+    Local cache of one kind of Kubernetes object, kept up to date with list+watch.
+
+    The objects are listed once, in pages of `page_size`, then followed by a watch that resumes
+    from the last resourceVersion seen. Bookmarks only move that resourceVersion forward; when it
+    is too old (410 Gone) the objects are listed again. Readers never call the API server.
+    """
+
+    def __init__(self, name, list_function, on_change=None, fingerprint=None, page_size=500, **list_kwargs):
+        self.name = name
+        self.list_function = list_function
+        self.list_kwargs = list_kwargs
+        self.on_change = on_change
+        # Changes that leave the fingerprint as it was (e.g. a status update) are stored but not notified
+        self.fingerprint = fingerprint or (lambda obj: obj.metadata.resource_version)
+        self.page_size = page_size
+        self.objects = {}  # "namespace/name", or "name" for cluster-scoped objects -> object
+        self.fingerprints = {}
+        self.resource_version = None
+        self.synced = False
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(obj):
+        return Informer.object_key(obj.metadata.namespace, obj.metadata.name)
+
+    @staticmethod
+    def object_key(namespace, name):
+        return f"{namespace}/{name}" if namespace else name
+
+    def get(self, namespace, name):
+        with self.lock:
+            return self.objects.get(self.object_key(namespace, name))
+
+    def list(self):
+        with self.lock:
+            return list(self.objects.values())
+
+    def relist(self):
+        """
+        Replace the cache with a paginated list of the objects.
+
+        Returns:
+            True if the objects differ from the cached ones
+        """
+        objects = {}
+        page = None
+        while True:
+            kwargs = {"limit": self.page_size, **self.list_kwargs}
+            if page is not None:
+                kwargs["_continue"] = page.metadata._continue
+            page = self.list_function(**kwargs)
+            for obj in page.items:
+                objects[self.key(obj)] = obj
+            if not page.metadata._continue:
+                break
+
+        fingerprints = {key: self.fingerprint(obj) for key, obj in objects.items()}
+        with self.lock:
+            changed = fingerprints != self.fingerprints
+            self.objects = objects
+            self.fingerprints = fingerprints
+            self.resource_version = page.metadata.resource_version
+            self.synced = True
+        return changed
+
+    def run(self, timeout_seconds=300):
+        """List the objects when needed, then watch them until the watch times out or expires."""
+        if self.resource_version is None:
+            if self.relist() and self.on_change is not None:
+                self.on_change(f"{self.name} listed")
+
+        try:
+            for event in watch.Watch().stream(self.list_function, resource_version=self.resource_version,
+                                              timeout_seconds=timeout_seconds, allow_watch_bookmarks=True,
+                                              **self.list_kwargs):
+                self.apply(event)
+        except ApiException as e:
+            if e.status != 410:
+                raise
+            logger_easyhaproxy.debug(f"Watch of the {self.name} expired. Listing them again")
+            self.resource_version = None
+
+    def apply(self, event):
+        """Update the cache from one watch event and notify when an object changed."""
+        if event["type"] == "BOOKMARK":
+            # Bookmarks are not deserialized: the object is the raw dict of the event
+            self.resource_version = event["raw_object"]["metadata"]["resourceVersion"]
+            return
+
+        obj = event["object"]
+        key = self.key(obj)
+        with self.lock:
+            self.resource_version = obj.metadata.resource_version
+            if event["type"] == "DELETED":
+                changed = key in self.fingerprints
+                self.objects.pop(key, None)
+                self.fingerprints.pop(key, None)
+            else:
+                fingerprint = self.fingerprint(obj)
+                changed = self.fingerprints.get(key) != fingerprint
+                self.objects[key] = obj
+                self.fingerprints[key] = fingerprint
+
+        if changed and self.on_change is not None:
+            self.on_change(f"{self.name} {key} {event['type'].lower()}")
@@ -0,0 +1,170 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from kubernetes.client.rest import ApiException
+
+from functions import logger_easyhaproxy
+
+
+class IngressStatusWriter:
+    """
+    Patch the status.loadBalancer of the Ingresses from background threads.
+
+    The discovery pass only calls update(), which compares the addresses with the ones already
+    in the Ingress status and queues a patch when they differ, without waiting for it. At most
+    `workers` patches run at the same time; a failed patch is retried with an exponential
+    backoff. Each Ingress has one record: "pending" or "running" while a patch is queued or in
+    flight, and "failed" while it waits for its retry. After a success the patched addresses
+    are remembered until the Ingress is seen with a newer resourceVersion, so a cached object
+    that doesn't carry the new status yet is not patched twice.
+    """
+    background = True
+
+    def __init__(self, patch, workers=4, backoff=5, max_backoff=300, clock=time.monotonic):
+        self.patch = patch
+        self.workers = max(1, workers)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        # "namespace/name" -> {"namespace", "name", "addresses", "resource_version", "state", "failures",
+        #                     "next_attempt", "error"}
+        self.updates = {}
+        self.written = {}  # "namespace/name" -> (resourceVersion the patch was computed from, addresses)
+        self.condition = threading.Condition()
+        self.pool = None
+        self.thread = None
+
+    @staticmethod
+    def current_addresses(ingress):
+        """Addresses of the Ingress status, as the list of dicts update() takes."""
+        status = getattr(ingress, "status", None)
+        load_balancer = getattr(status, "load_balancer", None)
+        addresses = []
+        for entry in getattr(load_balancer, "ingress", None) or []:
+            if entry.ip:
+                addresses.append({"ip": entry.ip})
+            if entry.hostname:
+                addresses.append({"hostname": entry.hostname})
+        return addresses
+
+    @staticmethod
+    def _normalize(addresses):
+        return sorted((address.get("ip") or "", address.get("hostname") or "") for address in addresses)
+
+    def update(self, ingress, addresses):
+        """
+        Queue the patch of the Ingress status when `addresses` differ from it.
+
+        Returns:
+            True if a patch was queued
+        """
+        namespace = ingress.metadata.namespace
+        name = ingress.metadata.name
+        key = f"{namespace}/{name}"
+        resource_version = ingress.metadata.resource_version
+        wanted = self._normalize(addresses)
+        with self.condition:
+            written = self.written.get(key)
+            if written is not None and written[0] != resource_version:
+                # The Ingress was seen again after the patch: its status is authoritative again
+                del self.written[key]
+                written = None
+            if wanted == self._normalize(self.current_addresses(ingress)) or \
+                    (written is not None and written[1] == wanted):
+                if key in self.updates and self.updates[key]["state"] != "running":
+                    del self.updates[key]
+                return False
+            queued = self.updates.get(key)
+            if queued is not None and self._normalize(queued["addresses"]) == wanted:
+                return False
+            self.updates[key] = {"namespace": namespace, "name": name, "addresses": addresses,
+                                 "resource_version": resource_version, "state": "pending", "failures": 0,
+                                 "next_attempt": self.clock(), "error": None}
+            if self.background and self.thread is None:
+                self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingress-status")
+                self.thread = threading.Thread(target=self._run, name="ingress-status", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+            return True
+
+    def retain(self, keys):
+        """Forget the Ingresses that are not in `keys`, the ones still served by the last discovery."""
+        with self.condition:
+            for key in [key for key in self.updates if key not in keys]:
+                del self.updates[key]
+            for key in [key for key in self.written if key not in keys]:
+                del self.written[key]
+
+    def get_status(self):
+        """
+        Returns:
+            dict {"namespace/name": {"state", "failures", "error"}} of the patches not done yet
+        """
+        with self.condition:
+            return {key: {"state": update["state"], "failures": update["failures"], "error": update["error"]}
+                    for key, update in self.updates.items()}
+
+    def _due(self):
+        """Returns: tuple (keys due now, seconds until the next retry or None)"""
+        now = self.clock()
+        due = []
+        wait = None
+        for key, update in self.updates.items():
+            if update["state"] not in ("pending", "failed"):
+                continue
+            if update["next_attempt"] <= now:
+                due.append(key)
+            else:
+                wait = update["next_attempt"] - now if wait is None else min(wait, update["next_attempt"] - now)
+        return due, wait
+
+    def _attempt(self, key, update):
+        body = {"status": {"loadBalancer": {"ingress": update["addresses"]}}}
+        try:
+            self.patch(name=update["name"], namespace=update["namespace"], body=body, field_manager="easyhaproxy")
+        except Exception as e:
+            with self.condition:
+                if self.updates.get(key) is not update:
+                    # Replaced or forgotten while in flight
+                    return
+                if isinstance(e, ApiException) and e.status == 404:
+                    del self.updates[key]
+                    return
+                update["failures"] += 1
+                delay = min(self.backoff * 2 ** (update["failures"] - 1), self.max_backoff)
+                update.update(state="failed", next_attempt=self.clock() + delay, error=str(e))
+                self.condition.notify()
+            logger_easyhaproxy.warning(f"Failed to update status for ingress {key} "
+                                       f"({update['failures']} attempt(s)): {e}. Retrying in {delay}s")
+            return
+
+        with self.condition:
+            self.written[key] = (update["resource_version"], self._normalize(update["addresses"]))
+            if self.updates.get(key) is update:
+                del self.updates[key]
+        logger_easyhaproxy.debug(f"Updated ingress {key} status with {len(update['addresses'])} address(es)")
+
+    def run_pending(self):
+        """Run the patches that are due now, in the calling thread."""
+        while True:
+            with self.condition:
+                due, _ = self._due()
+                if not due:
+                    return
+                update = self.updates[due[0]]
+                update["state"] = "running"
+            self._attempt(due[0], update)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                due, wait = self._due()
+                while not due:
+                    self.condition.wait(wait)
+                    due, wait = self._due()
+                updates = [(key, self.updates[key]) for key in due]
+                for _, update in updates:
+                    update["state"] = "running"
+            for key, update in updates:
+                self.pool.submit(self._attempt, key, update)
@@ -1,3 +1,9 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
 from typing import Final
 
 from easymapping import HaproxyConfigGenerator
@@ -9,12 +15,17 @@ class ProcessorInterface:
     DOCKER: Final[str] = "docker"
     SWARM: Final[str] = "swarm"
     KUBERNETES: Final[str] = "kubernetes"
+    # Longest wait before a watcher is restarted, in seconds
+    WATCHER_MAX_BACKOFF: Final[int] = 60
 
     static_file = Consts.easyhaproxy_config
 
     def __init__(self, filename=None):
         self.certbot_hosts = None
         self.parsed_object = None
+        self.server_states = {}
+        self.resolvers = {}
+        self.fingerprints = None
         self.cfg = None
         self.hosts = None
         self.cfg = None
@@ -22,6 +33,9 @@ class ProcessorInterface:
         self.hosts = None
         self.filename = filename
         self.label = ContainerEnv.read()['lookup_label']
+        # Set by the watchers when the discovery source changes; the main loop waits on it
+        self.changes = threading.Event()
+        self.watchers = []
         self.refresh()
 
     @staticmethod
@@ -43,20 +57,80 @@ class ProcessorInterface:
             logger_easyhaproxy.fatal(f"Expected mode to be 'static', 'docker', 'swarm' or 'kubernetes'. I got '{mode}'")
             return None
 
-    def refresh(self):
+    def refresh(self, profiler=None):
+        # self.cfg is kept across cycles so the plugins are loaded only once; parse() resets it
         self.certbot_hosts = None
         self.parsed_object = None
-        self.cfg = None
+        self.server_states = {}
+        self.resolvers = {}
+        self.fingerprints = None
         self.hosts = None
-        self.inspect_network()
-        self.parse()
+        with profiler.phase("inspect_network") if profiler else nullcontext():
+            self.inspect_network()
+        with profiler.phase("parse") if profiler else nullcontext():
+            self.parse()
 
     def inspect_network(self):
         # Abstract
         pass
 
+    def watch(self):
+        """
+        Start the background watchers that call notify_change() when the discovery source changes.
+
+        Processors without a change feed don't override this and rely on polling only.
+        """
+        pass
+
+    def notify_change(self, reason):
+        logger_easyhaproxy.debug(f"Change detected: {reason}")
+        self.changes.set()
+
+    def _start_watcher(self, name, stream):
+        """
+        Run `stream` in a daemon thread. It is restarted when it ends, and after an error
+        with an exponential backoff. A stream that ends on its own before it ran for
+        WATCHER_MAX_BACKOFF seconds gets the same backoff, so a source that closes every
+        connection right away is not reconnected in a tight loop; the backoff starts over once
+        a stream ran that long. Events may have been missed while it was down, so every restart
+        after an error also requests a resync.
+        """
+        def run():
+            delay = 1
+            while True:
+                started = time.monotonic()
+                error = None
+                try:
+                    stream()
+                except Exception as e:
+                    error = e
+                elapsed = time.monotonic() - started
+                if elapsed >= ProcessorInterface.WATCHER_MAX_BACKOFF:
+                    delay = 1
+                    if error is None:
+                        # A long-lived stream that timed out: reconnect now
+                        continue
+                if error is None:
+                    logger_easyhaproxy.warning(f"Watcher '{name}' ended after {elapsed:.1f}s. Restarting in {delay}s")
+                else:
+                    logger_easyhaproxy.warning(f"Watcher '{name}' failed: {error}. Retrying in {delay}s")
+                time.sleep(delay)
+                delay = min(delay * 2, ProcessorInterface.WATCHER_MAX_BACKOFF)
+                if error is not None:
+                    self.notify_change(f"watcher '{name}' restarted")
+
+        thread = threading.Thread(target=run, name=f"watch-{name}", daemon=True)
+        thread.start()
+        self.watchers.append(thread)
+
     def parse(self):
-        self.cfg = HaproxyConfigGenerator(ContainerEnv.read())
+        self._prepare_generator(ContainerEnv.read())
+
+    def _prepare_generator(self, mapping):
+        if self.cfg is None:
+            self.cfg = HaproxyConfigGenerator(mapping)
+        else:
+            self.cfg.reset(mapping)
 
     def get_certbot_hosts(self):
         return self.certbot_hosts
@@ -67,6 +141,50 @@ class ProcessorInterface:
     def get_parsed_object(self):
         return self.parsed_object
 
+    def get_server_states(self):
+        """
+        Returns:
+            dict {container address: "drain" | "maint"} of the discovered containers that are not ready
+        """
+        return self.server_states
+
+    def get_resolvers(self):
+        """
+        Returns:
+            dict {container address: resolvers name} of the addresses HAProxy resolves itself
+        """
+        return self.resolvers
+
+    @staticmethod
+    def fingerprint(labels):
+        """Hash of the canonical (key-sorted) serialization of one container's labels."""
+        canonical = json.dumps(labels, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha1(canonical.encode(), usedforsecurity=False).hexdigest()
+
+    def get_fingerprints(self):
+        """
+        Returns:
+            dict {container key: fingerprint} of the parsed object, computed once per refresh
+        """
+        if self.fingerprints is None:
+            self.fingerprints = {key: self.fingerprint(labels) for key, labels in (self.parsed_object or {}).items()}
+        return self.fingerprints
+
+    def get_changed_keys(self, old_fingerprints):
+        """
+        Compare the current fingerprints with the ones of a previous refresh.
+
+        Returns:
+            tuple (added, removed, modified) of sorted container key lists
+        """
+        fingerprints = self.get_fingerprints()
+        old_fingerprints = old_fingerprints or {}
+        added = sorted(key for key in fingerprints if key not in old_fingerprints)
+        removed = sorted(key for key in old_fingerprints if key not in fingerprints)
+        modified = sorted(key for key in fingerprints
+                          if key in old_fingerprints and fingerprints[key] != old_fingerprints[key])
+        return added, removed, modified
+
     def get_certs(self, key=None):
         if key is None:
             return self.cfg.certs
@@ -74,13 +192,28 @@ class ProcessorInterface:
             return None if key not in self.cfg.certs else self.cfg.certs[key]
 
     def get_haproxy_conf(self):
-        conf = self.cfg.generate(self.parsed_object)
+        conf = self.cfg.generate(self.parsed_object, self.server_states, self.resolvers)
         self.certbot_hosts = self.cfg.certbot_hosts
         self.hosts = self.cfg.serving_hosts
         return conf
 
     def save_config(self, filename):
-        Functions.save(filename, self.get_haproxy_conf())
+        conf = self.get_haproxy_conf()
+        Functions.save(filename, conf)
+        return conf
+
+    def get_maps(self):
+        return self.cfg.maps
+
+    def save_maps(self, path):
+        # Maps are produced by get_haproxy_conf(), so this needs to run after save_config
+        maps = self.get_maps()
+        for filename, content in maps.items():
+            Functions.save(f"{path}/{filename}", content)
+        # Remove the maps of the ports and lists that are gone
+        for entry in os.scandir(path):
+            if entry.is_file() and entry.name.endswith((".map", ".lst")) and entry.name not in maps:
+                os.remove(entry.path)
 
     def save_certs(self, path):
         for cert in self.get_certs():
@@ -2,17 +2,29 @@ import base64
 import os
 import socket
 import time
+from typing import Final
 
 from kubernetes import client, config
 from kubernetes.client.rest import ApiException
 
-from functions import Consts, ContainerEnv, Functions, logger_easyhaproxy
+from functions import ApiCallCounter, Consts, ContainerEnv, Functions, logger_easyhaproxy
 
+from .informer import Informer
+from .ingress_status import IngressStatusWriter
 from .interface import ProcessorInterface
+from .leader_election import LeaderElector
 
 
 class Kubernetes(ProcessorInterface):
-    def __init__(self, filename=None, api_instance=None, v1=None):
+    # Backend servers of an Ingress rule: the ClusterIP of its Service (balanced again by kube-proxy),
+    # or one server per pod endpoint of the Service, from its EndpointSlices
+    BACKENDS_SERVICE: Final[str] = "service"
+    BACKENDS_ENDPOINTS: Final[str] = "endpoints"
+    SERVICE_NAME_LABEL: Final[str] = "kubernetes.io/service-name"
+    # Node label set to the node name by the kubelet, used to list the nodes of the EasyHAProxy pods at once
+    HOSTNAME_LABEL: Final[str] = "kubernetes.io/hostname"
+
+    def __init__(self, filename=None, api_instance=None, v1=None, discovery=None, coordination=None):
         self.parsed_object = None
 
         # Only load config if API clients are not provided (allows dependency injection for testing)
@@ -21,12 +33,48 @@ class Kubernetes(ProcessorInterface):
             config.verify_ssl = False
 
         # Use injected clients or create new ones (dependency injection pattern)
-        self.api_instance = api_instance or client.CoreV1Api()
-        self.v1 = v1 or client.NetworkingV1Api()
+        self.api_instance = ApiCallCounter(api_instance or client.CoreV1Api(), "kubernetes")
+        self.v1 = ApiCallCounter(v1 or client.NetworkingV1Api(), "kubernetes")
+        self.discovery = ApiCallCounter(discovery or client.DiscoveryV1Api(), "kubernetes")
+        self.coordination = ApiCallCounter(coordination or client.CoordinationV1Api(), "kubernetes")
+        self.backends = os.getenv("EASYHAPROXY_KUBERNETES_BACKENDS", Kubernetes.BACKENDS_SERVICE).lower()
         self.cert_cache = {}
         self.deployment_mode_cache = None
         self.ingress_addresses_cache = None
         self.addresses_cache_time = 0
+        try:
+            status_workers = int(os.getenv("EASYHAPROXY_STATUS_WORKERS", "4"))
+        except ValueError:
+            status_workers = 4
+        # Patches the Ingress status off the discovery pass, only when the addresses changed
+        self.status_writer = IngressStatusWriter(self.v1.patch_namespaced_ingress_status, status_workers)
+        # Every replica discovers, but only the leader computes and writes the Ingress status.
+        # Off by default: it needs RBAC on leases, which older manifests don't grant
+        self.leader = None
+        if os.getenv("EASYHAPROXY_LEADER_ELECTION", "false").lower() == "true":
+            self.leader = LeaderElector(self.coordination,
+                                        os.getenv("EASYHAPROXY_LEADER_ELECTION_LEASE", "easyhaproxy-ingress-status"),
+                                        os.getenv('POD_NAMESPACE', 'easyhaproxy'), socket.gethostname(),
+                                        self.notify_change)
+        # Local caches fed by list+watch; until they are synced the cycle reads from the API server
+        self.ingresses = Informer("ingresses", self.v1.list_ingress_for_all_namespaces, self.notify_change,
+                                  self._ingress_fingerprint)
+        self.services = Informer("services", self.api_instance.list_service_for_all_namespaces, self.notify_change,
+                                 lambda service: service.spec.cluster_ip)
+        # Helm stores its releases in secrets: they are never referenced by an Ingress
+        self.secrets = Informer("secrets", self.api_instance.list_secret_for_all_namespaces, self.notify_change,
+                                lambda secret: secret.data, field_selector="type!=helm.sh/release.v1")
+        # Watched once an Ingress routes to the pod endpoints
+        self.endpoint_slices = Informer("endpointslices", self.discovery.list_endpoint_slice_for_all_namespaces,
+                                        self.notify_change)
+        self.endpoint_slices_index = None
+        # Slices of another address type than IPv4, logged once
+        self.skipped_endpoint_slices = set()
+        # Watched once the Ingress status reports node addresses; an address change expires the addresses cache
+        self.nodes = Informer("nodes", self.api_instance.list_node, self._nodes_changed, self._node_address)
+        self.watching = False
+        self.endpoint_slices_watched = False
+        self.nodes_watched = False
         super().__init__()
 
     def _detect_deployment_mode(self):
@@ -129,33 +177,17 @@ class Kubernetes(ProcessorInterface):
                 node_names = set(pod.spec.node_name for pod in pods.items if pod.spec.node_name)
 
                 # Get external IPs from these nodes
-                for node_name in node_names:
-                    node = self.api_instance.read_node(node_name)
-                    for addr in node.status.addresses:
-                        if addr.type == 'ExternalIP':
-                            addresses.append({"ip": addr.address})
-                            break
-                    else:
-                        # Fallback to InternalIP if no ExternalIP
-                        for addr in node.status.addresses:
-                            if addr.type == 'InternalIP':
-                                addresses.append({"ip": addr.address})
-                                break
+                for node in self._list_nodes(node_names):
+                    address = self._node_address(node)
+                    if address is not None:
+                        addresses.append(address)
 
             elif mode == 'nodeport':
                 # Get all node IPs (traffic can reach any node via NodePort)
-                nodes = self.api_instance.list_node()
-                for node in nodes.items:
-                    for addr in node.status.addresses:
-                        if addr.type == 'ExternalIP':
-                            addresses.append({"ip": addr.address})
-                            break
-                    else:
-                        # Fallback to InternalIP
-                        for addr in node.status.addresses:
-                            if addr.type == 'InternalIP':
-                                addresses.append({"ip": addr.address})
-                                break
+                for node in self._list_nodes():
+                    address = self._node_address(node)
+                    if address is not None:
+                        addresses.append(address)
 
             elif mode == 'clusterip':
                 # Check if LoadBalancer status is available
@@ -184,9 +216,60 @@ class Kubernetes(ProcessorInterface):
 
         return addresses
 
+    def _leads_ingress_status(self):
+        """Whether this replica writes the Ingress status. The election starts with the first cycle that needs it."""
+        if self.leader is None:
+            return True
+        self.leader.start()
+        return self.leader.is_leader()
+
+    @staticmethod
+    def _node_address(node):
+        """The ExternalIP of the node, or its InternalIP when it has none."""
+        node_addresses = (node.status.addresses or []) if node.status else []
+        for address_type in ('ExternalIP', 'InternalIP'):
+            for addr in node_addresses:
+                if addr.type == address_type:
+                    return {"ip": addr.address}
+        return None
+
+    def _nodes_changed(self, reason):
+        self.ingress_addresses_cache = None
+        self.notify_change(reason)
+
+    def _list_nodes(self, names=None):
+        """
+        The nodes named `names` (all of them when None), sorted by name.
+
+        Served from the node informer once it is synced. Before that, the nodes of `names` are
+        listed with one call selecting them by their hostname label; the nodes whose hostname
+        label is not their name are read one by one.
+        """
+        if self.watching and not self.nodes_watched:
+            self.nodes_watched = True
+            self._start_watcher("kubernetes-nodes", self.nodes.run)
+
+        if self.nodes.synced:
+            nodes = [node for node in self.nodes.list() if names is None or node.metadata.name in names]
+        elif names is None:
+            nodes = self.api_instance.list_node().items
+        elif not names:
+            nodes = []
+        else:
+            nodes = []
+            # Label values are at most 63 characters long
+            if all(len(name) <= 63 for name in names):
+                selector = f"{Kubernetes.HOSTNAME_LABEL} in ({','.join(sorted(names))})"
+                nodes = [node for node in self.api_instance.list_node(label_selector=selector).items
+                         if node.metadata.name in names]
+            found = {node.metadata.name for node in nodes}
+            for name in sorted(names - found):
+                nodes.append(self.api_instance.read_node(name))
+        return sorted(nodes, key=lambda node: node.metadata.name)
+
     def _update_ingress_status(self, ingress, addresses):
         """
-        Update the status of an ingress resource.
+        Queue the update of the status of an ingress resource when its addresses changed.
 
         Args:
             ingress: V1Ingress object
@@ -194,35 +277,105 @@ class Kubernetes(ProcessorInterface):
         """
         if not addresses:
             return
+        self.status_writer.update(ingress, addresses)
+
+    def watch(self):
+        for informer in (self.ingresses, self.services, self.secrets):
+            self._start_watcher(f"kubernetes-{informer.name}", informer.run)
+        self.watching = True
+        if self.backends == Kubernetes.BACKENDS_ENDPOINTS:
+            self._watch_endpoint_slices()
+
+    def _watch_endpoint_slices(self):
+        if self.watching and not self.endpoint_slices_watched:
+            self.endpoint_slices_watched = True
+            self._start_watcher(f"kubernetes-{self.endpoint_slices.name}", self.endpoint_slices.run)
+
+    @staticmethod
+    def _ingress_fingerprint(ingress):
+        # The status is left out: patching it on every cycle would otherwise wake the loop again
+        return ingress.metadata.generation, ingress.metadata.annotations, ingress.metadata.labels
+
+    def _list_ingresses(self):
+        if self.ingresses.synced:
+            return self.ingresses.list()
+        return self.v1.list_ingress_for_all_namespaces(watch=False).items
+
+    @staticmethod
+    def _cached(informer, namespace, name):
+        obj = informer.get(namespace, name)
+        if obj is None:
+            raise ApiException(status=404, reason=f"{informer.name} {namespace}/{name} not found")
+        return obj
+
+    def _read_service(self, name, namespace):
+        if self.services.synced:
+            return self._cached(self.services, namespace, name)
+        return self.api_instance.read_namespaced_service(name, namespace)
+
+    def _read_secret(self, name, namespace):
+        if self.secrets.synced:
+            return self._cached(self.secrets, namespace, name)
+        return self.api_instance.read_namespaced_secret(name, namespace)
+
+    def _list_endpoint_slices(self, service_name, namespace):
+        if not self.endpoint_slices.synced:
+            return self.discovery.list_namespaced_endpoint_slice(
+                namespace, label_selector=f"{Kubernetes.SERVICE_NAME_LABEL}={service_name}").items
+        # Indexed by Service once per cycle
+        if self.endpoint_slices_index is None:
+            self.endpoint_slices_index = {}
+            for endpoint_slice in self.endpoint_slices.list():
+                owner = (endpoint_slice.metadata.labels or {}).get(Kubernetes.SERVICE_NAME_LABEL)
+                self.endpoint_slices_index.setdefault((endpoint_slice.metadata.namespace, owner), []).append(endpoint_slice)
+        return self.endpoint_slices_index.get((namespace, service_name), [])
+
+    @staticmethod
+    def _endpoint_state(conditions):
+        """
+        Server state of a pod endpoint from its EndpointSlice conditions.
 
-        try:
-            # Create status patch
-            status_body = {
-                "status": {
-                    "loadBalancer": {
-                        "ingress": addresses
-                    }
-                }
-            }
-
-            # Update status using patch (not replace)
-            self.v1.patch_namespaced_ingress_status(
-                name=ingress.metadata.name,
-                namespace=ingress.metadata.namespace,
-                body=status_body,
-                field_manager="easyhaproxy"
-            )
-
-            logger_easyhaproxy.debug(
-                f"Updated ingress {ingress.metadata.namespace}/{ingress.metadata.name} "
-                f"status with {len(addresses)} address(es)"
-            )
+        Returns:
+            None for a ready endpoint, "drain" while it terminates but still serves (its sessions
+            finish, no new ones), and "maint" while it doesn't serve: not ready yet, or terminating
+            and no longer serving
+        """
+        if conditions is None:
+            return None
+        if conditions.terminating:
+            # Clusters without the serving condition only report the readiness
+            serving = conditions.serving if conditions.serving is not None else conditions.ready
+            return "maint" if serving is False else "drain"
+        # An unknown readiness is to be read as ready
+        if conditions.ready is False:
+            return "maint"
+        return None
+
+    def _pod_endpoints(self, service, port_number):
+        """
+        Pod endpoints of a Service port.
 
-        except Exception as e:
-            logger_easyhaproxy.warn(
-                f"Failed to update status for ingress "
-                f"{ingress.metadata.namespace}/{ingress.metadata.name}: {e}"
-            )
+        Returns:
+            dict {pod IP: (target port, server state or None)}
+        """
+        port_name = next((port.name for port in service.spec.ports or [] if port.port == port_number), None)
+        endpoints = {}
+        for endpoint_slice in self._list_endpoint_slices(service.metadata.name, service.metadata.namespace):
+            if endpoint_slice.address_type != "IPv4":
+                key = f"{endpoint_slice.metadata.namespace}/{endpoint_slice.metadata.name}"
+                if key not in self.skipped_endpoint_slices:
+                    self.skipped_endpoint_slices.add(key)
+                    logger_easyhaproxy.info(f"EndpointSlice {key} - Skipping its {endpoint_slice.address_type} "
+                                            f"addresses: only IPv4 pod endpoints are routed")
+                continue
+            target_port = next((port.port for port in endpoint_slice.ports or []
+                                if (port.name or None) == (port_name or None)), None)
+            if target_port is None:
+                continue
+            for endpoint in endpoint_slice.endpoints or []:
+                if endpoint.addresses:
+                    endpoints[endpoint.addresses[0]] = (target_port, self._endpoint_state(endpoint.conditions))
+        return endpoints
 
     def _check_annotation(self, annotations, key, default=None):
         if key not in annotations:
@@ -231,18 +384,20 @@ class Kubernetes(ProcessorInterface):
 
     def inspect_network(self):
 
-        ret = self.v1.list_ingress_for_all_namespaces(watch=False)
+        ingresses = self._list_ingresses()
+        self.endpoint_slices_index = None
 
         # Detect deployment mode once per cycle for ingress status updates
         env_config = ContainerEnv.read()
-        if env_config['update_ingress_status']:
+        if env_config['update_ingress_status'] and self._leads_ingress_status():
             deployment_mode, service = self._detect_deployment_mode()
             ingress_addresses = self._get_ingress_addresses(deployment_mode, service)
         else:
             ingress_addresses = []
 
         self.parsed_object = {}
-        for ingress in ret.items:
+        status_keys = set()
+        for ingress in ingresses:
             # Support both new spec.ingressClassName and deprecated annotation for backward compatibility
             ingress_class = None
             is_match = False
@@ -272,6 +427,9 @@ class Kubernetes(ProcessorInterface):
             proto = self._check_annotation(annotations, "easyhaproxy.proto")
             listen_port = self._check_annotation(annotations, "easyhaproxy.listen_port", 80)
             plugins = self._check_annotation(annotations, "easyhaproxy.plugins")
+            backends = self._check_annotation(annotations, "easyhaproxy.backends", self.backends).lower()
+            if backends == Kubernetes.BACKENDS_ENDPOINTS:
+                self._watch_endpoint_slices()
 
             # Extract plugin-specific configurations
             plugin_annotations = {}
@@ -313,7 +471,7 @@ class Kubernetes(ProcessorInterface):
                             use_explicit_key = False
 
                         # Read the secret
-                        secret = self.api_instance.read_namespaced_secret(
+                        secret = self._read_secret(
                             secret_name,
                             ingress.metadata.namespace
                         )
@@ -398,7 +556,7 @@ class Kubernetes(ProcessorInterface):
             if ingress.spec.tls is not None:
                 for tls in ingress.spec.tls:
                     try:
-                        secret = self.api_instance.read_namespaced_secret(tls.secret_name, ingress.metadata.namespace)
+                        secret = self._read_secret(tls.secret_name, ingress.metadata.namespace)
                         if "tls.crt" not in secret.data or "tls.key" not in secret.data:
                             continue
 
@@ -449,17 +607,34 @@ class Kubernetes(ProcessorInterface):
 
                 service_name = rule.http.paths[0].backend.service.name
                 try:
-                    api_response = self.api_instance.read_namespaced_service(service_name, ingress.metadata.namespace)
+                    api_response = self._read_service(service_name, ingress.metadata.namespace)
                     cluster_ip = api_response.spec.cluster_ip
                 except ApiException as e:
+                    api_response = None
                     cluster_ip = None
                     logger_easyhaproxy.warn(f"Ingress {ingress_name} - Service {service_name} - Failed: '{e}'")
 
-                if cluster_ip is not None:
+                if api_response is not None and backends == Kubernetes.BACKENDS_ENDPOINTS:
+                    try:
+                        endpoints = self._pod_endpoints(api_response, port_number)
+                    except ApiException as e:
+                        endpoints = {}
+                        logger_easyhaproxy.warn(f"Ingress {ingress_name} - Service {service_name} - "
+                                                f"Failed to list the endpoints: '{e}'")
+                    for pod_ip, (target_port, state) in endpoints.items():
+                        self.parsed_object.setdefault(pod_ip, dict(data))
+                        self.parsed_object[pod_ip].update(rule_data)
+                        self.parsed_object[pod_ip][f"{definition}.localport"] = target_port
+                        if state is not None:
+                            self.server_states[pod_ip] = state
+                elif cluster_ip is not None:
                     if cluster_ip not in self.parsed_object.keys():
                         self.parsed_object[cluster_ip] = data
                     self.parsed_object[cluster_ip].update(rule_data)
 
             # Update ingress status if enabled
             if env_config['update_ingress_status'] and ingress_addresses:
-                self._update_ingress_status(ingress, ingress_addresses)
\ No newline at end of file
+                status_keys.add(f"{ingress.metadata.namespace}/{ingress.metadata.name}")
+                self._update_ingress_status(ingress, ingress_addresses)
+
+        self.status_writer.retain(status_keys)
\ No newline at end of file
@@ -0,0 +1,150 @@
+import datetime
+import threading
+import time
+
+from kubernetes import client
+from kubernetes.client.rest import ApiException
+
+from functions import logger_easyhaproxy
+
+
+class LeaderElector:
+    """
+    Elect one replica with a coordination.k8s.io Lease, e.g. to write the Ingress status.
+
+    The leader renews the Lease every `retry_period` seconds; the other replicas take it over
+    once it was not renewed for `lease_duration` seconds. Like client-go, the expiry is measured
+    with the local clock from the moment a replica saw the Lease record change, so it doesn't
+    depend on the clocks of the replicas being in sync. Updates carry the resourceVersion that
+    was read, so when two replicas race for the Lease only one wins, the other gets a conflict.
+    A leader that could not renew for `renew_deadline` seconds steps down before the Lease
+    expires for the others.
+    """
+    background = True
+
+    def __init__(self, coordination, name, namespace, identity, on_change=None, lease_duration=15,
+                 renew_deadline=10, retry_period=2, clock=time.monotonic):
+        self.coordination = coordination
+        self.name = name
+        self.namespace = namespace
+        self.identity = identity
+        self.on_change = on_change
+        self.lease_duration = lease_duration
+        self.renew_deadline = renew_deadline
+        self.retry_period = retry_period
+        self.clock = clock
+        self.renewed_at = None  # local time of the last renewal, while leading
+        self.observed_record = None  # (holder, renew time, transitions) of the Lease last read
+        self.observed_at = None
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        """Run the election in a daemon thread, once."""
+        with self.lock:
+            if not self.background or self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._run, name="leader-election", daemon=True)
+            self.thread.start()
+
+    def is_leader(self):
+        with self.lock:
+            return self.renewed_at is not None and self.clock() - self.renewed_at < self.renew_deadline
+
+    @staticmethod
+    def _now():
+        return datetime.datetime.now(datetime.UTC)
+
+    def _spec(self, acquire_time, transitions):
+        return client.V1LeaseSpec(holder_identity=self.identity, lease_duration_seconds=self.lease_duration,
+                                  acquire_time=acquire_time, renew_time=self._now(),
+                                  lease_transitions=transitions)
+
+    def try_acquire_or_renew(self):
+        """
+        Create, renew or take over the Lease.
+
+        Returns:
+            True if this replica holds the Lease
+        """
+        try:
+            lease = self.coordination.read_namespaced_lease(self.name, self.namespace)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+            lease = None
+
+        now = self.clock()
+        if lease is None:
+            body = client.V1Lease(metadata=client.V1ObjectMeta(name=self.name, namespace=self.namespace),
+                                  spec=self._spec(self._now(), 0))
+            try:
+                self.coordination.create_namespaced_lease(self.namespace, body)
+            except ApiException as e:
+                if e.status != 409:
+                    raise
+                # Created by another replica in the meantime
+                return False
+            return self._renewed(now)
+
+        spec = lease.spec or client.V1LeaseSpec()
+        record = (spec.holder_identity, spec.renew_time, spec.lease_transitions)
+        if record != self.observed_record:
+            self.observed_record = record
+            self.observed_at = now
+        duration = spec.lease_duration_seconds or self.lease_duration
+        if spec.holder_identity and spec.holder_identity != self.identity \
+                and now - self.observed_at < duration:
+            return False
+
+        if spec.holder_identity == self.identity:
+            lease.spec = self._spec(spec.acquire_time, spec.lease_transitions or 0)
+        else:
+            lease.spec = self._spec(self._now(), (spec.lease_transitions or 0) + 1)
+        try:
+            # The resourceVersion in the metadata makes the update fail when the Lease changed since it was read
+            self.coordination.replace_namespaced_lease(self.name, self.namespace, lease)
+        except ApiException as e:
+            if e.status != 409:
+                raise
+            return False
+        return self._renewed(now)
+
+    def _renewed(self, now):
+        with self.lock:
+            was_leader = self.renewed_at is not None
+            self.renewed_at = now
+        if not was_leader:
+            logger_easyhaproxy.info(f"Became the leader of the lease {self.namespace}/{self.name}")
+            if self.on_change is not None:
+                self.on_change(f"leader of the lease {self.name}")
+        return True
+
+    def check(self):
+        """
+        One election round.
+
+        Returns:
+            True while this replica leads
+        """
+        try:
+            leading = self.try_acquire_or_renew()
+        except Exception as e:
+            logger_easyhaproxy.warning(f"Leader election on the lease {self.namespace}/{self.name} failed: {e}")
+            leading = None
+        with self.lock:
+            if self.renewed_at is None:
+                return False
+            # Step down when another replica holds the Lease, or when it could not be renewed in time
+            if leading is not False and self.clock() - self.renewed_at < self.renew_deadline:
+                return True
+            self.renewed_at = None
+        logger_easyhaproxy.warning(f"Lost the lease {self.namespace}/{self.name}")
+        if self.on_change is not None:
+            self.on_change(f"lost the lease {self.name}")
+        return False
+
+    def _run(self):
+        while True:
+            self.check()
+            time.sleep(self.retry_period)
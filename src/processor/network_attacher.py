@@ -0,0 +1,123 @@
+import threading
+import time
+
+from functions import logger_easyhaproxy
+
+
+class NetworkAttacher:
+    """
+    Attach containers or services to the HAProxy network from a background thread.
+
+    The discovery pass only calls request(), which never blocks: the network mutation (a
+    network connect, or a service update that starts a rolling update) runs in the worker.
+    Each key has one record: "pending" or "running" while an attempt is queued or in flight,
+    "failed" while it waits for its retry with an exponential backoff, and "attached" for
+    `settle_time` seconds after a success, so a change the discovery doesn't see yet is
+    not applied twice.
+    """
+    background = True
+
+    def __init__(self, name, attach, on_attached=None, backoff=5, max_backoff=300, settle_time=60,
+                 clock=time.monotonic):
+        self.name = name
+        self.attach = attach
+        self.on_attached = on_attached
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.settle_time = settle_time
+        self.clock = clock
+        self.attempts = {}  # key -> {"args", "state", "failures", "next_attempt", "error"}
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def request(self, key, *args):
+        """
+        Queue the attachment of `key`, done by calling attach(*args).
+
+        Returns:
+            False if `key` is already pending, failed (and retried by the worker) or just attached
+        """
+        with self.condition:
+            attempt = self.attempts.get(key)
+            now = self.clock()
+            if attempt is not None and (attempt["state"] != "attached" or now < attempt["next_attempt"]):
+                return False
+            self.attempts[key] = {"args": args, "state": "pending", "failures": 0, "next_attempt": now, "error": None}
+            if self.background and self.thread is None:
+                self.thread = threading.Thread(target=self._run, name=f"attach-{self.name}", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+            return True
+
+    def discard(self, key):
+        """Forget `key`, e.g. when its container is gone."""
+        with self.condition:
+            self.attempts.pop(key, None)
+
+    def retain(self, keys):
+        """Forget the keys that are not in `keys`, the ones the last full discovery still needs to attach."""
+        with self.condition:
+            for key in [key for key, attempt in self.attempts.items()
+                        if key not in keys and attempt["state"] != "attached"]:
+                del self.attempts[key]
+
+    def get_status(self):
+        """
+        Returns:
+            dict {key: {"state", "failures", "error"}} of the attachments not attached yet
+        """
+        with self.condition:
+            return {key: {"state": attempt["state"], "failures": attempt["failures"], "error": attempt["error"]}
+                    for key, attempt in self.attempts.items() if attempt["state"] != "attached"}
+
+    def _next_due(self):
+        """Returns: tuple (key or None, seconds until the next retry or None)"""
+        now = self.clock()
+        wait = None
+        for key, attempt in self.attempts.items():
+            if attempt["state"] not in ("pending", "failed"):
+                continue
+            if attempt["next_attempt"] <= now:
+                return key, 0
+            wait = attempt["next_attempt"] - now if wait is None else min(wait, attempt["next_attempt"] - now)
+        return None, wait
+
+    def _attempt(self, key, attempt):
+        try:
+            self.attach(*attempt["args"])
+        except Exception as e:
+            with self.condition:
+                attempt["failures"] += 1
+                delay = min(self.backoff * 2 ** (attempt["failures"] - 1), self.max_backoff)
+                attempt.update(state="failed", next_attempt=self.clock() + delay, error=str(e))
+            logger_easyhaproxy.warning(f"Failed to attach {key} to the HAProxy network "
+                                       f"({attempt['failures']} attempt(s)): {e}. Retrying in {delay}s")
+            return
+
+        with self.condition:
+            attempt.update(state="attached", next_attempt=self.clock() + self.settle_time, error=None)
+        logger_easyhaproxy.info(f"Attached {key} to the HAProxy network")
+        if self.on_attached is not None:
+            self.on_attached(key)
+
+    def run_pending(self):
+        """Run the attempts that are due now, in the calling thread."""
+        while True:
+            with self.condition:
+                key, _ = self._next_due()
+                if key is None:
+                    return
+                attempt = self.attempts[key]
+                attempt["state"] = "running"
+            self._attempt(key, attempt)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                key, wait = self._next_due()
+                while key is None:
+                    self.condition.wait(wait)
+                    key, wait = self._next_due()
+                attempt = self.attempts[key]
+                attempt["state"] = "running"
+            self._attempt(key, attempt)
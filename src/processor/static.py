@@ -2,7 +2,6 @@ import json
 
 import yaml
 
-from easymapping import HaproxyConfigGenerator
 from functions import ContainerEnv, Functions
 
 from .interface import ProcessorInterface
@@ -140,4 +139,4 @@ class Static(ProcessorInterface):
 
     def parse(self):
         """Create HaproxyConfigGenerator with YAML config merged into env vars"""
-        self.cfg = HaproxyConfigGenerator(ContainerEnv.read(self.static_content))
\ No newline at end of file
+        self._prepare_generator(ContainerEnv.read(self.static_content))
\ No newline at end of file
@@ -1,14 +1,33 @@
+import os
 import socket
+from typing import Final
 
 import docker
 
+from functions import ApiCallCounter
+
 from .interface import ProcessorInterface
+from .network_attacher import NetworkAttacher
 
 
 class Swarm(ProcessorInterface):
+    # Service events that can change the discovered backends
+    WATCH_ACTIONS: Final[tuple] = ("create", "update", "remove")
+    # Backend servers of a service: its virtual IP (balanced again by IPVS), one server per running task,
+    # or a server-template HAProxy fills from Docker's DNS (tasks.<service>)
+    BACKENDS_VIP: Final[str] = "vip"
+    BACKENDS_TASKS: Final[str] = "tasks"
+    BACKENDS_DNS: Final[str] = "dns"
+
     def __init__(self, filename=None):
         self.parsed_object = None
-        self.client = docker.from_env()
+        self.client = ApiCallCounter(docker.from_env(), "swarm")
+        self.backends = os.getenv("EASYHAPROXY_SWARM_BACKENDS", Swarm.BACKENDS_VIP).lower()
+        self.ha_proxy_network_id = None
+        self.swarm_ingress_id = None
+        # Attaching a service updates it (rolling update), so it runs outside of the discovery pass
+        self.attacher = NetworkAttacher("swarm", self.attach_service,
+                                        lambda service_id: self.notify_change(f"service {service_id} attached"))
         super().__init__()
 
     def inspect_network(self):
@@ -26,25 +45,81 @@ class Swarm(ProcessorInterface):
             if ha_proxy_network_id is not None and swarm_ingress_id is not None:
                 break
 
+        self.ha_proxy_network_id = ha_proxy_network_id
+        self.swarm_ingress_id = swarm_ingress_id
+
         # Check if the service is attached to the HAProxy network
         self.parsed_object = {}
+        detached = set()
+        services = {}
         for service in self.client.services.list():
             if not any(self.label in key for key in service.attrs["Spec"]["Labels"]):
                 continue
 
             ip_address = None
-            network_list = []
             for endpoint in service.attrs["Endpoint"]["VirtualIPs"]:
                 if ha_proxy_network_id == endpoint["NetworkID"]:
                     ip_address = endpoint["Addr"].split("/")[0]
                     break
-                elif swarm_ingress_id != endpoint["NetworkID"]:
-                    network_list.append(endpoint["NetworkID"])
 
             # Attach the service to the HAProxy network
             if ip_address is None:
-                network_list.append(ha_proxy_network_id)
-                service.update(networks=network_list)
-                continue  # skip to the next service to give time to update the network
+                detached.add(service.id)
+                self.attacher.request(service.id, service.id)
+                continue  # discovered once the update gave it an address on the network
+
+            if self.backends == Swarm.BACKENDS_TASKS:
+                services[service.id] = service.attrs["Spec"]["Labels"]
+            elif self.backends == Swarm.BACKENDS_DNS:
+                # HAProxy follows the replicas itself: scaling changes neither the configuration nor the runtime state
+                dns_name = f"tasks.{service.attrs['Spec']['Name']}"
+                self.parsed_object[dns_name] = service.attrs["Spec"]["Labels"]
+                self.resolvers[dns_name] = "docker"
+            else:
+                self.parsed_object[ip_address] = service.attrs["Spec"]["Labels"]
+        self.attacher.retain(detached)
+
+        if services:
+            self.parsed_object.update(self.task_addresses(services, ha_proxy_network_id))
+
+    def task_addresses(self, services, network_id):
+        """
+        Address of every running task of the services on the HAProxy network, so HAProxy balances,
+        checks and tracks each task itself instead of going through the IPVS virtual IP.
 
-            self.parsed_object[ip_address] = service.attrs["Spec"]["Labels"]
\ No newline at end of file
+        Args:
+            services: dict {service id: labels}
+        Returns:
+            dict {task address: labels of its service}
+        """
+        addresses = {}
+        # One call for the tasks of all the services
+        for task in self.client.api.tasks(filters={"desired-state": "running"}):
+            if task.get("ServiceID") not in services or task.get("Status", {}).get("State") != "running":
+                continue
+            for attachment in task.get("NetworksAttachments") or []:
+                if attachment["Network"]["ID"] == network_id and attachment.get("Addresses"):
+                    addresses[attachment["Addresses"][0].split("/")[0]] = services[task["ServiceID"]]
+                    break
+        return addresses
+
+    def attach_service(self, service_id):
+        """Add the HAProxy network to a service. Runs in the NetworkAttacher worker."""
+        service = self.client.services.get(service_id)
+        networks = [endpoint["NetworkID"] for endpoint in service.attrs["Endpoint"].get("VirtualIPs", [])
+                    if endpoint["NetworkID"] != self.swarm_ingress_id]
+        if self.ha_proxy_network_id in networks:
+            return
+        service.update(networks=networks + [self.ha_proxy_network_id])
+
+    def watch(self):
+        self._start_watcher("swarm-events", self.watch_events)
+
+    def watch_events(self):
+        """Block on the Docker events stream and notify the Swarm service changes."""
+        for event in self.client.events(decode=True, filters={"type": "service"}):
+            action = event.get("Action", "")
+            if action not in Swarm.WATCH_ACTIONS:
+                continue
+            attributes = event.get("Actor", {}).get("Attributes", {})
+            self.notify_change(f"service {attributes.get('name', event.get('id', ''))} {action}")
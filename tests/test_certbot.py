@@ -18,7 +18,8 @@ from OpenSSL import crypto
 # Add src to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from functions import Certbot, ContainerEnv, Functions
+from functions import Certbot, Consts, ContainerEnv, Functions
+from functions.metrics import CERTIFICATE_EXPIRY
 
 
 class TestCertbotStaticMethods:
@@ -359,6 +360,23 @@ class TestCertbotCertificateStatus:
         finally:
             os.unlink(cert_file)
 
+    def test_collect_certificate_expiry(self):
+        """Test the certificate expiry gauge is filled from the certificate folders"""
+        os.makedirs(Consts.certs_certbot, exist_ok=True)
+        cert_file = os.path.join(Consts.certs_certbot, "expiry.example.com.pem")
+        with open(cert_file, 'w') as f:
+            f.write(self.create_test_certificate(days_valid=30))
+
+        try:
+            Certbot.collect_certificate_expiry()
+            expiry = CERTIFICATE_EXPIRY.get(certificate="expiry.example.com")
+            assert abs(expiry - (time.time() + 30 * 24 * 60 * 60)) < 60
+        finally:
+            os.unlink(cert_file)
+
+        Certbot.collect_certificate_expiry()
+        assert CERTIFICATE_EXPIRY.get(certificate="expiry.example.com") is None
+
 
 class TestCertbotMergeCertificate:
     """Test certificate merging functionality"""
@@ -8,6 +8,8 @@ def test_container_env_empty():
                "customerrors": False,
                "ssl_mode": "default",
                "lookup_label": "easyhaproxy",
+               "host_map": False,
+               "server_slots": 0,
                "logLevel": {
                    "easyhaproxy": Functions.DEBUG,
                    "haproxy": Functions.INFO,
@@ -42,6 +44,8 @@ def test_container_env_customerrors():
                    "customerrors": True,
                    "ssl_mode": "default",
                    "lookup_label": "easyhaproxy",
+                   "host_map": False,
+                   "server_slots": 0,
                    "logLevel": {
                        "easyhaproxy": Functions.DEBUG,
                        "haproxy": Functions.INFO,
@@ -76,6 +80,8 @@ def test_container_env_sslmode():
                    "customerrors": False,
                    "ssl_mode": "strict",
                    "lookup_label": "easyhaproxy",
+                   "host_map": False,
+                   "server_slots": 0,
                    "logLevel": {
                        "easyhaproxy": Functions.DEBUG,
                        "haproxy": Functions.INFO,
@@ -111,6 +117,8 @@ def test_container_env_stats():
                    "customerrors": False,
                    "ssl_mode": "default",
                    "lookup_label": "easyhaproxy",
+                   "host_map": False,
+                   "server_slots": 0,
                    "logLevel": {
                        "easyhaproxy": Functions.DEBUG,
                        "haproxy": Functions.INFO,
@@ -146,6 +154,8 @@ def test_container_env_stats_password():
                    "customerrors": False,
                    "ssl_mode": "default",
                    "lookup_label": "easyhaproxy",
+                   "host_map": False,
+                   "server_slots": 0,
                    "stats": {
                        "username": "admin",
                        "password": "xyz",
@@ -188,6 +198,8 @@ def test_container_env_stats_password_2():
                    "customerrors": False,
                    "ssl_mode": "default",
                    "lookup_label": "easyhaproxy",
+                   "host_map": False,
+                   "server_slots": 0,
                    "stats": {
                        "username": "abc",
                        "password": "xyz",
@@ -230,6 +242,8 @@ def test_container_env_certbot_email():
                    "customerrors": False,
                    "ssl_mode": "default",
                    "lookup_label": "easyhaproxy",
+                   "host_map": False,
+                   "server_slots": 0,
                    "logLevel": {
                        "easyhaproxy": Functions.DEBUG,
                        "haproxy": Functions.INFO,
@@ -272,6 +286,8 @@ def test_container_env_certbot_full():
             "customerrors": False,
             "ssl_mode": "default",
             "lookup_label": "easyhaproxy",
+            "host_map": False,
+            "server_slots": 0,
             "logLevel": {
                 "easyhaproxy": Functions.DEBUG,
                 "haproxy": Functions.INFO,
@@ -316,6 +332,8 @@ def test_container_log_level():
            "customerrors": False,
            "ssl_mode": "default",
            "lookup_label": "easyhaproxy",
+           "host_map": False,
+           "server_slots": 0,
            "logLevel": {
                "easyhaproxy": Functions.ERROR,
                "haproxy": Functions.FATAL,
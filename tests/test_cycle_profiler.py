@@ -0,0 +1,54 @@
+from collections import deque
+
+from functions import CycleProfiler
+
+
+def test_cycle_profiler_records_phases():
+    profiler = CycleProfiler()
+
+    profiler.start_cycle()
+    with profiler.phase("inspect_network"):
+        pass
+    with profiler.phase("generate"):
+        pass
+    with profiler.phase("generate"):
+        pass
+    profiler.end_cycle()
+
+    summary = profiler.summary()
+    assert summary["cycles"] == 1
+    assert set(summary["phases"]) == {"inspect_network", "generate", "cycle"}
+    assert summary["phases"]["generate"]["count"] == 1
+    assert summary["phases"]["cycle"]["max"] >= summary["phases"]["generate"]["max"]
+
+
+def test_cycle_profiler_records_phase_on_error():
+    profiler = CycleProfiler()
+
+    profiler.start_cycle()
+    try:
+        with profiler.phase("reload"):
+            raise RuntimeError("failed")
+    except RuntimeError:
+        pass
+    profiler.end_cycle()
+
+    assert profiler.summary()["phases"]["reload"]["count"] == 1
+
+
+def test_cycle_profiler_rolling_window():
+    profiler = CycleProfiler(window=3)
+    for duration in (10, 1, 2, 3):
+        profiler.samples.setdefault("parse", deque(maxlen=3)).append(duration)
+
+    phase = profiler.summary()["phases"]["parse"]
+    assert phase == {"count": 3, "last": 3, "p50": 2, "p95": 3, "max": 3}
+
+
+def test_cycle_profiler_percentile():
+    values = list(range(1, 101))
+
+    assert CycleProfiler.percentile(values, 50) == 50
+    assert CycleProfiler.percentile(values, 95) == 95
+    assert CycleProfiler.percentile(values, 100) == 100
+    assert CycleProfiler.percentile([], 95) == 0
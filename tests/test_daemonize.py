@@ -1,4 +1,6 @@
 import os
+import threading
+
 from functions import Consts
 
 from functions import DaemonizeHAProxy
@@ -41,7 +43,7 @@ def test_daemonize_haproxy_get_haproxy_command_reload_existing_pin():
         with open("/tmp/temp.pid", 'w') as file:
             file.write("1")
         command = daemon.get_haproxy_command(DaemonizeHAProxy.HAPROXY_RELOAD, "/tmp/temp.pid")
-        assert command == f"{BIN} -W -f {Consts.haproxy_config}  -p /tmp/temp.pid -x /var/run/haproxy.sock -sf 1"
+        assert command == f"{BIN} -W -f {Consts.haproxy_config}  -p /tmp/temp.pid -x /var/run/haproxy.sock -S /var/run/haproxy.sock -sf 1"
     finally:
         assert os.path.exists("/tmp/temp.pid")
         os.unlink("/tmp/temp.pid")
@@ -58,3 +60,35 @@ def test_daemonize_haproxy2_get_haproxy_command_start():
     daemon = DaemonizeHAProxy(os.path.abspath(os.path.dirname(__file__))  + '/fixtures')
     command = daemon.get_haproxy_command(DaemonizeHAProxy.HAPROXY_START)
     assert command == f"{BIN} -W -f {Consts.haproxy_config} -f {os.path.dirname(__file__)}/fixtures -p /run/haproxy.pid -S /var/run/haproxy.sock"
+
+
+def test_daemonize_haproxy_sleep_wakes_on_change():
+    daemon = DaemonizeHAProxy()
+    daemon.sleep_secs = 30
+    changes = threading.Event()
+    changes.set()
+
+    assert daemon.sleep(changes)
+    assert not changes.is_set()
+
+    daemon.sleep_secs = 0
+    assert not daemon.sleep(changes)
+
+
+def test_daemonize_haproxy_config_digest():
+    daemon = DaemonizeHAProxy()
+    digest = daemon.get_config_digest("global\n", {"hosts_80.map": "a.local srv_a\n"}, {})
+
+    assert digest == daemon.get_config_digest("global\n", {"hosts_80.map": "a.local srv_a\n"}, {})
+    assert digest != daemon.get_config_digest("global\n  maxconn 10\n", {"hosts_80.map": "a.local srv_a\n"}, {})
+    assert digest != daemon.get_config_digest("global\n", {"hosts_80.map": "b.local srv_b\n"}, {})
+    assert digest != daemon.get_config_digest("global\n", {"hosts_80.map": "a.local srv_a\n"}, {"a.local.pem": "PEM"})
+
+    os.makedirs(Consts.certs_certbot, exist_ok=True)
+    cert = os.path.join(Consts.certs_certbot, "digest.local.pem")
+    try:
+        with open(cert, "w") as file:
+            file.write("PEM")
+        assert digest != daemon.get_config_digest("global\n", {"hosts_80.map": "a.local srv_a\n"}, {})
+    finally:
+        os.remove(cert)
@@ -1,11 +1,18 @@
+import copy
+import json
 import os
+import threading
 import time
+from collections import Counter
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
 
 import docker
 import pytest
 
 from functions import Functions
-from processor import ProcessorInterface
+from processor import Docker, ProcessorInterface, Swarm
+from processor.network_attacher import NetworkAttacher
 
 
 def _get_hydrated_object(parsed_objects, lookup_key):
@@ -105,4 +112,527 @@ def test_processor_docker():
         container2.stop()
 
 
+class FakeContainer:
+    """Container with the attributes of containers.get()"""
+
+    def __init__(self, container_id, name, labels, networks, status="running", health=None):
+        self.id = container_id
+        self.attrs = {
+            "Id": container_id,
+            "Name": f"/{name}",
+            "Config": {"Labels": labels},
+            "State": {"Status": status},
+            "NetworkSettings": {"Networks": {net: {"IPAddress": ip} for net, ip in networks.items()}},
+        }
+        if health:
+            self.attrs["State"]["Health"] = {"Status": health}
+
+    @property
+    def name(self):
+        return self.attrs["Name"].lstrip("/")
+
+    @property
+    def labels(self):
+        return self.attrs["Config"]["Labels"]
+
+    @property
+    def status(self):
+        return self.attrs["State"]["Status"]
+
+    def sparse(self):
+        """The same container as returned by containers.list(sparse=True)"""
+        health = self.attrs["State"].get("Health", {}).get("Status")
+        status = "Up 2 minutes" + {None: "", "starting": " (health: starting)"}.get(health, f" ({health})")
+        return SimpleNamespace(id=self.id, attrs={
+            "Status": status,
+            "Id": self.id,
+            "Names": [self.attrs["Name"]],
+            "Labels": dict(self.labels),
+            "State": self.status,
+            "NetworkSettings": self.attrs["NetworkSettings"],
+        })
+
+
+class FakeNetwork:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+
+    def connect(self, container_id):
+        self.client.calls["networks.connect"] += 1
+        container = self.client.find(container_id)
+        container.attrs["NetworkSettings"]["Networks"][self.name] = {"IPAddress": f"10.1.0.{len(self.client.running)}"}
+
+
+class FakeDockerClient:
+    """Docker client over an in-memory set of containers that records the API calls"""
+
+    def __init__(self, containers=(), events=()):
+        self.running = {container.id: container for container in containers}
+        self.event_stream = list(events)
+        self.calls = Counter()
+        self.containers = SimpleNamespace(list=self.list_containers, get=self.get_container)
+        self.networks = SimpleNamespace(get=self.get_network)
+
+    def find(self, id_or_name):
+        for container in self.running.values():
+            if id_or_name in (container.id, container.name):
+                return container
+        raise docker.errors.NotFound(f"No such container: {id_or_name}")
+
+    def list_containers(self, sparse=False, **kwargs):
+        self.calls["containers.list"] += 1
+        return [container.sparse() if sparse else container for container in self.running.values()]
+
+    def get_container(self, id_or_name):
+        self.calls["containers.get"] += 1
+        # A new object on every call, as the Docker API does
+        return copy.deepcopy(self.find(id_or_name))
+
+    def get_network(self, name):
+        self.calls["networks.get"] += 1
+        return FakeNetwork(self, name)
+
+    def events(self, **kwargs):
+        self.calls["events"] += 1
+        self.events_filters = kwargs.get("filters")
+        return iter(self.event_stream)
+
+
+def fixture_containers(name, network="easyhaproxy"):
+    """FakeContainer per entry of a fixture ({container name: labels})"""
+    path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "fixtures", name)
+    with open(path) as f:
+        labels = json.load(f)
+    return [FakeContainer(f"id-{index}", key, value, {network: f"10.0.0.{index + 1}"})
+            for index, (key, value) in enumerate(labels.items())]
+
+
+def container_event(action, container):
+    return {"Type": "container", "Action": action, "id": container.id,
+            "Actor": {"ID": container.id, "Attributes": {"name": container.name, **container.labels}}}
+
+
+def network_event(action, network, container):
+    return {"Type": "network", "Action": action, "Actor": {"ID": "net-id", "Attributes": {"name": network, "container": container.id}}}
+
+
+def docker_processor(client):
+    # Attachments run when the test calls attacher.run_pending()
+    with patch("docker.from_env", return_value=client), patch.object(NetworkAttacher, "background", False):
+        return Docker()
+
+
+def test_docker_resync_builds_index():
+    containers = fixture_containers("services")
+    client = FakeDockerClient(containers)
+    processor = docker_processor(client)
+    endpoint = processor.endpoints[0]
+
+    assert endpoint.network_name == "easyhaproxy"
+    # Only the containers with easyhaproxy labels
+    assert processor.get_parsed_object() == {f"10.0.0.{index + 1}": c.labels for index, c in enumerate(containers)
+                                             if any(key.startswith("easyhaproxy.") for key in c.labels)}
+    assert len(processor.get_parsed_object()) == 4
+
+
+def test_docker_resync_lists_once_per_cycle():
+    containers = fixture_containers("services")
+    containers.append(FakeContainer("id-other", "other", {"easyhaproxy.http.host": "other.example.org"}, {"other": "10.9.0.1"}))
+    client = FakeDockerClient(containers)
+    processor = docker_processor(client)
+    endpoint = processor.endpoints[0]
+
+    # First cycle: one listing and the HAProxy container lookup
+    assert client.calls == {"containers.list": 1, "containers.get": 1}
+
+    # Next cycles: the network name is cached and nothing else is inspected
+    network_name = endpoint.network_name
+    assert network_name is not None
+    client.calls.clear()
+    processor.refresh()
+    processor.refresh()
+    assert client.calls == {"containers.list": 2}
+    assert endpoint.network_name == network_name
+
+
+def test_docker_attaches_containers_in_background():
+    other = FakeContainer("id-other", "other", {"easyhaproxy.http.host": "other.example.org"}, {"other": "10.9.0.1"})
+    client = FakeDockerClient(fixture_containers("services") + [other])
+    processor = docker_processor(client)
+    endpoint = processor.endpoints[0]
+
+    # The discovery pass only requests the attachment
+    assert client.calls["networks.connect"] == 0
+    assert endpoint.attacher.get_status() == {"id-other": {"state": "pending", "failures": 0, "error": None}}
+    assert "other.example.org" not in str(processor.get_parsed_object())
+
+    # Requested once, however many cycles see the container detached
+    processor.refresh()
+    endpoint.attacher.run_pending()
+    assert client.calls["networks.connect"] == 1
+    assert processor.changes.is_set()
+
+    processor.refresh()
+    ip_address = other.attrs["NetworkSettings"]["Networks"]["easyhaproxy"]["IPAddress"]
+    assert processor.get_parsed_object()[ip_address] == {"easyhaproxy.http.host": "other.example.org"}
+    assert endpoint.attacher.get_status() == {}
+
+
+def test_docker_resync_skips_unlabeled_containers():
+    unlabeled = FakeContainer("id-plain", "plain", {"com.example": "x"}, {"other": "10.9.0.2"})
+    client = FakeDockerClient(fixture_containers("services") + [unlabeled])
+    processor = docker_processor(client)
+    endpoint = processor.endpoints[0]
+
+    assert client.calls["networks.connect"] == 0
+    assert "id-plain" not in endpoint.containers
+    assert "id-0" not in endpoint.containers
+
+
+def test_docker_events_update_index_without_listing():
+    containers = fixture_containers("services")
+    client = FakeDockerClient(containers)
+    processor = docker_processor(client)
+    endpoint = processor.endpoints[0]
+    endpoint.events_active = True
+    client.calls.clear()
+
+    started = FakeContainer("id-new", "new", {"easyhaproxy.http.host": "new.example.org"}, {"easyhaproxy": "10.0.0.50"})
+    client.running[started.id] = started
+    assert endpoint.apply_event(container_event("start", started)) == "container new start"
+
+    died = client.running.pop("id-1")
+    assert endpoint.apply_event(container_event("die", died)) == "container my-stack_agent die"
+
+    client.running["id-2"].labels["easyhaproxy.cadvisor.port"] = "8080"
+    assert endpoint.apply_event(container_event("update", client.running["id-2"])) == "container my-stack_cadvisor update"
+    # Nothing changed
+    assert endpoint.apply_event(container_event("update", client.running["id-2"])) is None
+
+    # Moved to another address on the HAProxy network
+    client.running["id-3"].attrs["NetworkSettings"]["Networks"]["easyhaproxy"]["IPAddress"] = "10.0.0.99"
+    assert endpoint.apply_event(network_event("connect", "easyhaproxy", client.running["id-3"])) is not None
+    # Other networks are ignored
+    assert endpoint.apply_event(network_event("connect", "other", client.running["id-3"])) is None
+
+    processor.refresh()
+    parsed = processor.get_parsed_object()
+    assert parsed["10.0.0.50"] == {"easyhaproxy.http.host": "new.example.org"}
+    assert "10.0.0.2" not in parsed
+    assert parsed["10.0.0.3"]["easyhaproxy.cadvisor.port"] == "8080"
+    assert "10.0.0.4" not in parsed and "10.0.0.99" in parsed
+    assert client.calls == {"containers.get": 4}
+
+
+def test_docker_events_ignore_unlabeled_containers():
+    client = FakeDockerClient(fixture_containers("services"))
+    processor = docker_processor(client)
+    endpoint = processor.endpoints[0]
+
+    unlabeled = FakeContainer("id-plain", "plain", {}, {"easyhaproxy": "10.0.0.60"})
+    client.running[unlabeled.id] = unlabeled
+    assert endpoint.apply_event(container_event("start", unlabeled)) is None
+    assert endpoint.apply_event(container_event("exec_start", client.running["id-1"])) is None
+    assert unlabeled.id not in endpoint.containers
+
+
+def test_docker_resync_is_periodic_with_events():
+    client = FakeDockerClient(fixture_containers("services"))
+    processor = docker_processor(client)
+    endpoint = processor.endpoints[0]
+
+    endpoint.events_active = True
+    client.calls.clear()
+    processor.refresh()
+    assert client.calls["containers.list"] == 0
+
+    endpoint.last_resync -= endpoint.resync_interval
+    processor.refresh()
+    assert client.calls["containers.list"] > 0
+
+    # Without the events stream every refresh lists the containers
+    endpoint.events_active = False
+    client.calls.clear()
+    processor.refresh()
+    assert client.calls["containers.list"] > 0
+
+
+def test_docker_health_sets_server_states():
+    labels = {"easyhaproxy.http.host": "web.example.org", "easyhaproxy.http.localport": "8080"}
+    web = [FakeContainer(f"id-web{index}", f"web{index}", dict(labels), {"easyhaproxy": f"10.0.0.{index + 1}"}, health=health)
+           for index, health in enumerate([None, "healthy", "starting", "unhealthy"])]
+    client = FakeDockerClient(web)
+    processor = docker_processor(client)
+    endpoint = processor.endpoints[0]
+
+    assert processor.get_server_states() == {"10.0.0.3": "maint", "10.0.0.4": "drain"}
+    haproxy_conf = processor.get_haproxy_conf()
+    assert "server srv-0 10.0.0.1:8080 check weight 1\n" in haproxy_conf
+    assert "server srv-2 10.0.0.3:8080 check weight 1 disabled # maint\n" in haproxy_conf
+    assert "server srv-3 10.0.0.4:8080 check weight 0 # drain\n" in haproxy_conf
+
+    # The health event updates the index, the next cycle renders the server ready
+    endpoint.events_active = True
+    web[2].attrs["State"]["Health"]["Status"] = "healthy"
+    event = container_event("health_status: healthy", web[2])
+    assert endpoint.apply_event(event) == "container web2 health_status"
+    processor.refresh()
+    assert processor.get_server_states() == {"10.0.0.4": "drain"}
+    assert client.calls["containers.list"] == 1
+
+
+def test_docker_watch_events_notifies_labeled_containers():
+    containers = fixture_containers("services")
+    client = FakeDockerClient(containers, events=[
+        {"Type": "container", "Action": "exec_start", "Actor": {"ID": "id-1", "Attributes": {"easyhaproxy.http.host": "a"}}},
+    ])
+    processor = docker_processor(client)
+    endpoint = processor.endpoints[0]
+
+    endpoint.watch_events()
+    assert not processor.changes.is_set()
+    assert client.events_filters == {"type": ["container", "network"]}
+    # The stream ended, so the next refresh lists the containers again
+    assert not endpoint.events_active
+
+    died = client.running.pop("id-1")
+    client.event_stream = [container_event("die", died)]
+    endpoint.watch_events()
+    assert processor.changes.is_set()
+    assert "id-1" not in endpoint.containers
+
+
+class InterleavingDockerClient(FakeDockerClient):
+    """Docker client that runs `during_list` after taking a listing and before returning it"""
+
+    def __init__(self, containers=()):
+        super().__init__(containers)
+        self.during_list = None
+
+    def list_containers(self, sparse=False, **kwargs):
+        listing = super().list_containers(sparse, **kwargs)
+        if self.during_list is not None:
+            during_list, self.during_list = self.during_list, None
+            during_list()
+        return listing
+
+
+def test_docker_events_during_resync_are_not_lost():
+    client = InterleavingDockerClient(fixture_containers("services"))
+    processor = docker_processor(client)
+    endpoint = processor.endpoints[0]
+    started = FakeContainer("id-new", "new", {"easyhaproxy.http.host": "new.example.org"}, {"easyhaproxy": "10.0.0.50"})
+
+    def events():
+        client.running[started.id] = started
+        endpoint.apply_event(container_event("start", started))
+        died = client.running.pop("id-1")
+        endpoint.apply_event(container_event("die", died))
+
+    # The listing was taken before the events
+    client.during_list = events
+    processor.refresh()
+
+    parsed = processor.get_parsed_object()
+    assert parsed["10.0.0.50"] == {"easyhaproxy.http.host": "new.example.org"}
+    assert "10.0.0.2" not in parsed
+    assert endpoint.resync_events is None
+
+
+class BlockingDockerClient(FakeDockerClient):
+    """Docker client whose listing waits until `released` is set, as a slow or unreachable endpoint"""
+
+    def __init__(self, containers=()):
+        super().__init__(containers)
+        self.released = threading.Event()
+
+    def list_containers(self, sparse=False, **kwargs):
+        self.released.wait(5)
+        return super().list_containers(sparse, **kwargs)
+
+
+def test_docker_hosts_are_discovered_in_parallel(monkeypatch):
+    web = FakeContainer("id-web", "web", {"easyhaproxy.http.host": "web.example.org"}, {"overlay": "10.0.0.1"})
+    api = FakeContainer("id-api", "api", {"easyhaproxy.http.host": "api.example.org"}, {"overlay": "10.0.0.2"})
+    db = FakeContainer("id-db", "db", {"easyhaproxy.http.host": "db.example.org"}, {"overlay": "10.0.0.3"})
+    failing = FakeDockerClient()
+    failing.containers.list = MagicMock(side_effect=docker.errors.APIError("connection refused"))
+    clients = {"tcp://host1:2375": FakeDockerClient([web]), "tcp://host2:2375": BlockingDockerClient([api]),
+               "tcp://host3:2375": FakeDockerClient([db]), "tcp://host4:2375": failing}
+    monkeypatch.setenv("EASYHAPROXY_DOCKER_HOSTS", ",".join(clients))
+    monkeypatch.setenv("EASYHAPROXY_DOCKER_TIMEOUT", "0.5")
+    monkeypatch.setenv("EASYHAPROXY_DOCKER_WORKERS", "2")
+    monkeypatch.setenv("EASYHAPROXY_DOCKER_NETWORK", "overlay")
+
+    with patch("docker.DockerClient", side_effect=lambda base_url, timeout: clients[base_url]), \
+            patch.object(NetworkAttacher, "background", False):
+        started = time.monotonic()
+        processor = Docker()
+        # The slow endpoint costs one timeout, not one per endpoint behind it
+        assert time.monotonic() - started < 2
+
+    assert processor.pool._max_workers == 2
+    assert processor.get_parsed_object() == {"10.0.0.1": web.labels, "10.0.0.3": db.labels}
+    # The slow endpoint is still listing: not queried again until it answers
+    started = time.monotonic()
+    processor.refresh()
+    assert time.monotonic() - started < 0.5
+    assert list(processor.resyncs) == ["docker-1"]
+
+    clients["tcp://host2:2375"].released.set()
+    processor.resyncs["docker-1"].result(5)
+    assert processor.changes.wait(5)
+    processor.refresh()
+    assert processor.get_parsed_object() == {"10.0.0.1": web.labels, "10.0.0.2": api.labels, "10.0.0.3": db.labels}
+    # The failed endpoint is retried every cycle
+    assert failing.containers.list.call_count == 3
+
+
+def remote_docker_processor(clients):
+    with patch("docker.DockerClient", side_effect=lambda base_url, timeout: clients[base_url]), \
+            patch("processor.docker_endpoint.socket.gethostname", return_value="easyhaproxy"), \
+            patch.object(NetworkAttacher, "background", False):
+        processor = Docker()
+        processor.refresh()
+    return processor
+
+
+def test_docker_remote_hosts_use_the_haproxy_network(monkeypatch):
+    haproxy = FakeContainer("id-haproxy", "easyhaproxy", {}, {"overlay": "10.0.0.100"})
+    web = FakeContainer("id-web", "web", {"easyhaproxy.http.host": "web.example.org"}, {"overlay": "10.0.0.1"})
+    api = FakeContainer("id-api", "api", {"easyhaproxy.http.host": "api.example.org"}, {"bridge": "172.17.0.2"})
+    db = FakeContainer("id-db", "db", {"easyhaproxy.http.host": "db.example.org"}, {"overlay": "10.0.0.3"})
+    clients = {"unix:///var/run/docker.sock": FakeDockerClient([haproxy, web]),
+               "tcp://host1:2375": FakeDockerClient([api, db])}
+    monkeypatch.setenv("EASYHAPROXY_DOCKER_HOSTS", ",".join(clients))
+
+    processor = remote_docker_processor(clients)
+    local, remote = processor.endpoints
+
+    assert local.runs_haproxy and not remote.runs_haproxy
+    # Not the first network listed on the remote host, where HAProxy doesn't run
+    assert remote.network_name == "overlay"
+    assert remote.attacher.get_status() == {"id-api": {"state": "pending", "failures": 0, "error": None}}
+    assert processor.get_parsed_object() == {"10.0.0.1": web.labels, "10.0.0.3": db.labels}
+
+
+def test_docker_remote_hosts_need_a_network(monkeypatch):
+    api = FakeContainer("id-api", "api", {"easyhaproxy.http.host": "api.example.org"}, {"bridge": "172.17.0.2"})
+    clients = {"tcp://host1:2375": FakeDockerClient([api])}
+    monkeypatch.setenv("EASYHAPROXY_DOCKER_HOSTS", ",".join(clients))
+
+    processor = remote_docker_processor(clients)
+    remote = processor.endpoints[0]
+
+    # No guess: nothing is discovered nor connected
+    assert remote.network_name is None
+    assert remote.attacher.get_status() == {}
+    assert processor.get_parsed_object() == {}
+
+    # The configured network applies to every endpoint
+    monkeypatch.setenv("EASYHAPROXY_DOCKER_NETWORK", "overlay")
+    processor = remote_docker_processor(clients)
+    remote = processor.endpoints[0]
+    assert remote.network_name == "overlay"
+    assert remote.attacher.get_status() == {"id-api": {"state": "pending", "failures": 0, "error": None}}
+
+
+def test_swarm_watch_events_notifies_service_changes():
+    client = MagicMock()
+    client.events.return_value = [
+        {"Type": "service", "Action": "update", "Actor": {"Attributes": {"name": "web"}}},
+    ]
+    with patch("docker.from_env", return_value=client), patch.object(Swarm, "inspect_network"):
+        processor = Swarm()
+
+    processor.watch_events()
+    assert processor.changes.is_set()
+    client.events.assert_called_once_with(decode=True, filters={"type": "service"})
+
+
+def test_swarm_attaches_services_in_background():
+    ha_proxy_endpoint = {"NetworkID": "net-haproxy", "Addr": "10.0.1.2/24"}
+    ingress_endpoint = {"NetworkID": "net-ingress", "Addr": "10.255.0.2/16"}
+    service = MagicMock(id="svc-1", attrs={"Spec": {"Labels": {"easyhaproxy.http.host": "a"}},
+                                           "Endpoint": {"VirtualIPs": [ingress_endpoint, {"NetworkID": "net-app", "Addr": "10.0.2.2/24"}]}})
+    client = MagicMock()
+    client.containers.get.return_value.name = "haproxy.1.abc"
+    client.services.get.side_effect = lambda name: service if name == "svc-1" else MagicMock(
+        attrs={"Endpoint": {"VirtualIPs": [ingress_endpoint, ha_proxy_endpoint]}})
+    networks = {"net-ingress": MagicMock(), "net-haproxy": MagicMock()}
+    networks["net-ingress"].name = "ingress"
+    networks["net-haproxy"].name = "haproxy"
+    client.networks.get.side_effect = networks.get
+    client.services.list.return_value = [service]
+
+    with patch("docker.from_env", return_value=client), patch.object(NetworkAttacher, "background", False):
+        processor = Swarm()
+    processor.refresh()
+
+    service.update.assert_not_called()
+    processor.attacher.run_pending()
+    service.update.assert_called_once_with(networks=["net-app", "net-haproxy"])
+
+    # Not updated again while the update rolls out
+    processor.refresh()
+    processor.attacher.run_pending()
+    service.update.assert_called_once()
+    assert processor.get_parsed_object() == {}
+
+
+
+def test_swarm_tasks_backends(monkeypatch):
+    ha_proxy_endpoint = {"NetworkID": "net-haproxy", "Addr": "10.0.1.2/24"}
+    labels = {"easyhaproxy.http.host": "web.example.org", "easyhaproxy.http.localport": "8080"}
+    service = MagicMock(id="svc-web", attrs={"Spec": {"Labels": labels},
+                                             "Endpoint": {"VirtualIPs": [{"NetworkID": "net-haproxy", "Addr": "10.0.1.10/24"}]}})
+    client = MagicMock()
+    client.containers.get.return_value.name = "haproxy.1.abc"
+    client.services.get.return_value = MagicMock(attrs={"Endpoint": {"VirtualIPs": [ha_proxy_endpoint]}})
+    client.networks.get.return_value.name = "haproxy"
+    client.services.list.return_value = [service]
+
+    def task(service_id, state, address):
+        return {"ServiceID": service_id, "Status": {"State": state},
+                "NetworksAttachments": [{"Network": {"ID": "net-ingress"}, "Addresses": ["10.255.0.9/16"]},
+                                        {"Network": {"ID": "net-haproxy"}, "Addresses": [f"{address}/24"]}]}
+    client.api.tasks.return_value = [task("svc-web", "running", "10.0.1.11"), task("svc-web", "running", "10.0.1.12"),
+                                     task("svc-web", "preparing", "10.0.1.13"), task("svc-other", "running", "10.0.1.20")]
+
+    monkeypatch.setenv("EASYHAPROXY_SWARM_BACKENDS", "tasks")
+    with patch("docker.from_env", return_value=client):
+        processor = Swarm()
+
+    # One server per running task instead of the service VIP, from a single tasks call
+    assert processor.get_parsed_object() == {"10.0.1.11": labels, "10.0.1.12": labels}
+    client.api.tasks.assert_called_once_with(filters={"desired-state": "running"})
+    haproxy_conf = processor.get_haproxy_conf()
+    assert "server srv-0 10.0.1.11:8080" in haproxy_conf
+    assert "server srv-1 10.0.1.12:8080" in haproxy_conf
+    assert "10.0.1.10" not in haproxy_conf
+
+
+def test_swarm_dns_backends(monkeypatch):
+    labels = {"easyhaproxy.http.host": "web.example.org", "easyhaproxy.http.localport": "8080"}
+    service = MagicMock(id="svc-web", attrs={"Spec": {"Name": "shop_web", "Labels": labels},
+                                             "Endpoint": {"VirtualIPs": [{"NetworkID": "net-haproxy", "Addr": "10.0.1.10/24"}]}})
+    client = MagicMock()
+    client.containers.get.return_value.name = "haproxy.1.abc"
+    client.services.get.return_value = MagicMock(
+        attrs={"Endpoint": {"VirtualIPs": [{"NetworkID": "net-haproxy", "Addr": "10.0.1.2/24"}]}})
+    client.networks.get.return_value.name = "haproxy"
+    client.services.list.return_value = [service]
+
+    monkeypatch.setenv("EASYHAPROXY_SWARM_BACKENDS", "dns")
+    with patch("docker.from_env", return_value=client):
+        processor = Swarm()
+
+    assert processor.get_parsed_object() == {"tasks.shop_web": labels}
+    assert processor.get_resolvers() == {"tasks.shop_web": "docker"}
+    haproxy_conf = processor.get_haproxy_conf()
+    assert "resolvers docker\n    nameserver dns 127.0.0.11:53\n" in haproxy_conf
+    assert "server-template srv-0- 10 tasks.shop_web:8080 check weight 1 resolvers docker init-addr none" in haproxy_conf
+    client.api.tasks.assert_not_called()
+
 # test_processor_docker()
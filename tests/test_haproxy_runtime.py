@@ -0,0 +1,287 @@
+import json
+import os
+import re
+import tempfile
+from unittest.mock import patch
+
+import easymapping
+from easyhaproxy.main import apply_config_change
+from functions import DaemonizeHAProxy, HAProxyRuntime, ReloadScheduler
+
+
+def load_fixture(file):
+    path = os.path.dirname(os.path.realpath(__file__))
+    with open(path + "/fixtures/" + file) as content_file:
+        return json.loads("".join(content_file.readlines()))
+
+
+def render(container_metadata, server_states=None):
+    cfg = easymapping.HaproxyConfigGenerator({"customerrors": False, "stats": {"port": 0}})
+    return cfg.generate(container_metadata, server_states)
+
+
+def containers(*ips, host="www.example.org", slots=None):
+    labels = {
+        "easyhaproxy.http.host": host,
+        "easyhaproxy.http.port": "80",
+        "easyhaproxy.http.localport": "8080",
+    }
+    if slots is not None:
+        labels["easyhaproxy.http.slots"] = str(slots)
+    return {ip: dict(labels) for ip in ips}
+
+
+class FakeRuntime(HAProxyRuntime):
+    """HAProxyRuntime that records commands instead of talking to a socket"""
+
+    def __init__(self, responses=None):
+        self._socket_file = tempfile.NamedTemporaryFile()
+        super().__init__(socket_path=self._socket_file.name)
+        self.enabled = True
+        self.sent = []
+        self.responses = responses or {}
+
+    def send(self, command):
+        self.sent.append(command)
+        for pattern, response in self.responses.items():
+            if re.match(f"@1 {pattern}", command):
+                return response
+        return ""
+
+
+OK_RESPONSES = {
+    "add server": "New server registered.\n",
+    "del server": "Server deleted.\n",
+    r"set server \S+ addr": "IP changed from '10.0.0.2' to '10.0.0.3', port stays '8080'.\n",
+}
+
+
+def test_split_config_extracts_dynamic_servers():
+    structure, servers, balance = HAProxyRuntime.split_config(render(containers("10.0.0.1", "10.0.0.2")))
+
+    assert servers == {
+        "srv_www_example_org_80": {
+            "srv-0": ("10.0.0.1:8080", "check weight 1", "ready"),
+            "srv-1": ("10.0.0.2:8080", "check weight 1", "ready"),
+        }
+    }
+    assert balance == {"srv_www_example_org_80": "roundrobin"}
+    assert "server srv-" not in structure
+    assert "server certbot 127.0.0.1:2080" in structure
+
+
+def test_apply_adds_and_removes_servers():
+    runtime = FakeRuntime(OK_RESPONSES)
+    runtime.sync(render(containers("10.0.0.1", "10.0.0.2")))
+
+    assert runtime.apply(render(containers("10.0.0.1", "10.0.0.2", "10.0.0.4")))
+    assert runtime.sent == [
+        "@1 add server srv_www_example_org_80/srv-2 10.0.0.4:8080 check weight 1",
+        "@1 enable health srv_www_example_org_80/srv-2",
+        "@1 enable server srv_www_example_org_80/srv-2",
+    ]
+
+    runtime.sent = []
+    assert runtime.apply(render(containers("10.0.0.2", "10.0.0.4")))
+    assert runtime.sent == [
+        "@1 disable server srv_www_example_org_80/srv-0",
+        "@1 shutdown sessions server srv_www_example_org_80/srv-0",
+        "@1 del server srv_www_example_org_80/srv-0",
+    ]
+    assert runtime.servers == {
+        "srv_www_example_org_80": {
+            "srv-1": ("10.0.0.2:8080", "check weight 1", "ready"),
+            "srv-2": ("10.0.0.4:8080", "check weight 1", "ready"),
+        }
+    }
+
+
+def test_apply_changes_address_of_replaced_server():
+    runtime = FakeRuntime(OK_RESPONSES)
+    runtime.sync(render(containers("10.0.0.1", "10.0.0.2")))
+
+    assert runtime.apply(render(containers("10.0.0.1", "10.0.0.3")))
+    assert runtime.sent == ["@1 set server srv_www_example_org_80/srv-1 addr 10.0.0.3 port 8080"]
+
+
+def test_apply_refuses_structural_change():
+    runtime = FakeRuntime(OK_RESPONSES)
+    runtime.sync(render(containers("10.0.0.1")))
+
+    changed = containers("10.0.0.1")
+    changed.update(containers("10.0.0.2", host="api.example.org"))
+
+    assert not runtime.apply(render(changed))
+    assert not runtime.apply(render(load_fixture("services")))
+    assert runtime.sent == []
+
+
+def test_apply_falls_back_when_command_fails():
+    runtime = FakeRuntime({"add server": "No such backend.\n"})
+    runtime.sync(render(containers("10.0.0.1")))
+
+    assert not runtime.apply(render(containers("10.0.0.1", "10.0.0.2")))
+    # Live state is unknown until the next reload
+    assert not runtime.apply(render(containers("10.0.0.1")))
+
+
+def test_apply_reports_nothing_to_apply():
+    runtime = FakeRuntime(OK_RESPONSES)
+    config = render(containers("10.0.0.1", "10.0.0.2"))
+    runtime.sync(config)
+
+    # Not "applied": the caller must not take the change as handled by the runtime API
+    assert runtime.apply(config) is None
+    assert runtime.sent == []
+    assert runtime.apply(render(containers("10.0.0.1", "10.0.0.3")))
+
+
+def test_apply_requires_master_socket():
+    runtime = HAProxyRuntime(socket_path="/tmp/easyhaproxy-no-such.sock")
+    runtime.sync(render(containers("10.0.0.1")))
+
+    assert not runtime.apply(render(containers("10.0.0.1", "10.0.0.2")))
+
+
+def test_split_config_marks_empty_slots():
+    _, servers, _ = HAProxyRuntime.split_config(render(containers("10.0.0.1", slots=3)))
+
+    assert servers == {
+        "srv_www_example_org_80": {
+            "srv-0": ("10.0.0.1:8080", "check weight 1", "ready"),
+            "srv-1": ("127.0.0.1:8080", "check weight 1", "slot"),
+            "srv-2": ("127.0.0.1:8080", "check weight 1", "slot"),
+        }
+    }
+
+
+def test_apply_fills_and_frees_slots():
+    runtime = FakeRuntime(OK_RESPONSES)
+    runtime.sync(render(containers("10.0.0.1", slots=3)))
+
+    assert runtime.apply(render(containers("10.0.0.1", "10.0.0.2", slots=3)))
+    assert runtime.sent == [
+        "@1 set server srv_www_example_org_80/srv-1 addr 10.0.0.2 port 8080",
+        "@1 enable health srv_www_example_org_80/srv-1",
+        "@1 enable server srv_www_example_org_80/srv-1",
+    ]
+
+    runtime.sent = []
+    assert runtime.apply(render(containers("10.0.0.2", slots=3)))
+    assert runtime.sent == [
+        "@1 disable server srv_www_example_org_80/srv-0",
+        "@1 shutdown sessions server srv_www_example_org_80/srv-0",
+    ]
+    assert runtime.servers["srv_www_example_org_80"]["srv-0"] == ("10.0.0.1:8080", "check weight 1", "slot")
+
+    # The freed slot is reused before any new server is added
+    runtime.sent = []
+    assert runtime.apply(render(containers("10.0.0.2", "10.0.0.3", "10.0.0.4", slots=3)))
+    assert runtime.sent == [
+        "@1 set server srv_www_example_org_80/srv-0 addr 10.0.0.3 port 8080",
+        "@1 enable health srv_www_example_org_80/srv-0",
+        "@1 enable server srv_www_example_org_80/srv-0",
+        "@1 set server srv_www_example_org_80/srv-2 addr 10.0.0.4 port 8080",
+        "@1 enable health srv_www_example_org_80/srv-2",
+        "@1 enable server srv_www_example_org_80/srv-2",
+    ]
+
+
+def test_split_config_reads_server_states():
+    config = render(containers("10.0.0.1", "10.0.0.2", "10.0.0.3", slots=4),
+                    {"10.0.0.2": "maint", "10.0.0.3": "drain"})
+    assert "server srv-1 10.0.0.2:8080 check weight 1 disabled # maint" in config
+    # Not `disabled`: HAProxy would start the server in MAINT instead of DRAIN
+    assert "server srv-2 10.0.0.3:8080 check weight 0 # drain" in config
+
+    _, servers, _ = HAProxyRuntime.split_config(config)
+    assert servers["srv_www_example_org_80"] == {
+        "srv-0": ("10.0.0.1:8080", "check weight 1", "ready"),
+        "srv-1": ("10.0.0.2:8080", "check weight 1", "maint"),
+        "srv-2": ("10.0.0.3:8080", "check weight 1", "drain"),
+        "srv-3": ("127.0.0.1:8080", "check weight 1", "slot"),
+    }
+
+
+def test_apply_changes_server_states():
+    runtime = FakeRuntime(OK_RESPONSES)
+    runtime.sync(render(containers("10.0.0.1", "10.0.0.2"), {"10.0.0.2": "maint"}))
+
+    # The healthcheck passes
+    assert runtime.apply(render(containers("10.0.0.1", "10.0.0.2")))
+    assert runtime.sent == ["@1 set server srv_www_example_org_80/srv-1 state ready"]
+
+    runtime.sent = []
+    assert runtime.apply(render(containers("10.0.0.1", "10.0.0.2"), {"10.0.0.1": "drain"}))
+    assert runtime.sent == ["@1 set server srv_www_example_org_80/srv-0 weight 0"]
+
+    runtime.sent = []
+    assert runtime.apply(render(containers("10.0.0.1", "10.0.0.2"), {"10.0.0.1": "maint"}))
+    assert runtime.sent == [
+        "@1 set server srv_www_example_org_80/srv-0 state maint",
+        "@1 set server srv_www_example_org_80/srv-0 weight 1",
+    ]
+
+
+def test_drain_after_reload_matches_runtime():
+    runtime = FakeRuntime(OK_RESPONSES)
+    # HAProxy was reloaded while the server drained
+    runtime.sync(render(containers("10.0.0.1", "10.0.0.2"), {"10.0.0.2": "drain"}))
+    assert runtime.servers["srv_www_example_org_80"]["srv-1"] == ("10.0.0.2:8080", "check weight 1", "drain")
+
+    # Nothing to do while it keeps draining
+    assert runtime.apply(render(containers("10.0.0.1", "10.0.0.2"), {"10.0.0.2": "drain"})) is None
+    assert runtime.sent == []
+
+    # It was started with weight 0: it gets its weight back, `state ready` alone would leave it at 0
+    assert runtime.apply(render(containers("10.0.0.1", "10.0.0.2")))
+    assert runtime.sent == ["@1 set server srv_www_example_org_80/srv-1 weight 1"]
+
+
+def test_apply_adds_servers_in_their_state():
+    runtime = FakeRuntime(OK_RESPONSES)
+    runtime.sync(render(containers("10.0.0.1", slots=2)))
+
+    # A starting container fills the slot but stays in maintenance
+    assert runtime.apply(render(containers("10.0.0.1", "10.0.0.2", slots=2), {"10.0.0.2": "maint"}))
+    assert runtime.sent == [
+        "@1 set server srv_www_example_org_80/srv-1 addr 10.0.0.2 port 8080",
+        "@1 enable health srv_www_example_org_80/srv-1",
+    ]
+
+    runtime.sent = []
+    assert runtime.apply(render(containers("10.0.0.1", "10.0.0.2", "10.0.0.3", slots=2), {"10.0.0.3": "drain"}))
+    assert runtime.sent == [
+        "@1 set server srv_www_example_org_80/srv-1 state ready",
+        "@1 add server srv_www_example_org_80/srv-2 10.0.0.3:8080 check weight 1",
+        "@1 enable health srv_www_example_org_80/srv-2",
+        "@1 set server srv_www_example_org_80/srv-2 weight 0",
+        "@1 enable server srv_www_example_org_80/srv-2",
+    ]
+
+
+def test_maps_and_certificates_changes_reload():
+    daemon = DaemonizeHAProxy()
+    runtime = FakeRuntime(OK_RESPONSES)
+    scheduler = ReloadScheduler(quiet_period=0, min_interval=0, max_delay=30)
+    config = render(containers("10.0.0.1", "10.0.0.2"))
+    maps = {"hosts_80.map": "www.example.org srv_www_example_org_80\n"}
+    runtime.sync(config)
+    applied_digest = daemon.get_config_digest(config, maps, {})
+
+    # haproxy.cfg is the same: the runtime API has nothing to do, HAProxy must load the files
+    for changed_maps, certs in [({"hosts_80.map": ""}, {}), (maps, {"www.example.org.pem": "PEM"})]:
+        digest = daemon.get_config_digest(config, changed_maps, certs)
+        assert apply_config_change(config, digest, applied_digest, runtime, scheduler) == applied_digest
+        assert scheduler.due()
+        assert scheduler.reloaded() == ["maps or certificates changed"]
+    assert runtime.sent == []
+
+    # Only the servers changed
+    config = render(containers("10.0.0.1", "10.0.0.3"))
+    digest = daemon.get_config_digest(config, maps, {})
+    with patch("easyhaproxy.main.Functions.save") as save:
+        assert apply_config_change(config, digest, applied_digest, runtime, scheduler) == digest
+    save.assert_called_once()
+    assert scheduler.pending == 0
+    assert runtime.sent == ["@1 set server srv_www_example_org_80/srv-1 addr 10.0.0.3 port 8080"]
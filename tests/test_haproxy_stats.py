@@ -0,0 +1,213 @@
+import base64
+import http.client
+import json
+import os
+import threading
+from http.server import ThreadingHTTPServer
+from unittest.mock import patch
+
+from easyhaproxy.main import DashboardHandler
+from functions import HAProxyStats
+
+STAT_HEADER = "# pxname,svname,qcur,scur,smax,stot,bin,bout,ereq,econ,eresp,weight,status,check_status,lastchg,rate,hrsp_2xx,hrsp_3xx,hrsp_4xx,hrsp_5xx,req_rate,addr,"
+
+
+def stat_output(sessions=3, www_server_status="UP"):
+    return "\n".join([
+        STAT_HEADER,
+        "http_in_80,FRONTEND,,5,10,100,1000,2000,0,,,,OPEN,,,4,90,5,3,2,4,,",
+        f"srv_www_example_org_80,srv-0,0,{sessions},4,50,500,900,,0,0,1,{www_server_status},L4OK,30,2,,,,1,,10.0.0.1:8080,",
+        "srv_www_example_org_80,srv-1,0,0,0,0,0,0,,0,0,1,MAINT,,30,0,,,,0,,127.0.0.1:8080,",
+        f"srv_www_example_org_80,BACKEND,0,{sessions},4,50,500,900,,0,0,1,UP,,30,2,40,5,3,1,,,",
+        "srv_www_example_org_443,srv-0,0,2,2,20,100,200,,0,0,1,DOWN,L4CON,5,1,,,,0,,10.0.0.1:8443,",
+        "srv_www_example_org_443,BACKEND,0,2,2,20,100,200,,0,0,1,DOWN,,5,1,10,0,0,0,,,",
+        "srv_dashboard,Local,0,0,1,3,10,20,,0,0,1,UP,L4OK,100,0,,,,0,,127.0.0.1:9190,",
+        "srv_dashboard,BACKEND,0,0,1,3,10,20,,0,0,1,UP,,100,0,3,0,0,0,,,",
+        "",
+    ])
+
+
+INFO_OUTPUT = "Name: HAProxy\nVersion: 3.0.5\nUptime_sec: 120\nCurrConns: 7\nNbthread: 4\nPool_alloc_bytes: 1\n"
+
+
+class FakeRuntime:
+    def __init__(self):
+        self.stat = stat_output()
+        self.sent = []
+
+    def send(self, command):
+        self.sent.append(command)
+        if command == "@1 show stat":
+            if isinstance(self.stat, Exception):
+                raise self.stat
+            return self.stat
+        return INFO_OUTPUT
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_stats():
+    runtime = FakeRuntime()
+    clock = FakeClock()
+    return HAProxyStats(runtime=runtime, interval=2, clock=clock), runtime, clock
+
+
+def test_snapshot_parses_and_aggregates_per_host():
+    stats, _, _ = make_stats()
+    snapshot = stats.snapshot()
+
+    assert snapshot["error"] is None
+    assert snapshot["info"] == {"Version": "3.0.5", "Uptime_sec": 120, "Nbthread": 4, "CurrConns": 7}
+    assert snapshot["frontends"]["http_in_80"]["scur"] == 5
+    assert snapshot["frontends"]["http_in_80"]["status"] == "OPEN"
+
+    backend = snapshot["backends"]["srv_www_example_org_80"]
+    assert backend["status"] == "UP"
+    assert backend["servers"]["srv-0"]["addr"] == "10.0.0.1:8080"
+    assert backend["servers"]["srv-1"]["status"] == "MAINT"
+
+    host = snapshot["hosts"]["www.example.org"]
+    assert host["backends"] == ["srv_www_example_org_80", "srv_www_example_org_443"]
+    assert host["ports"] == [80, 443]
+    # The MAINT slot is not a server of the host
+    assert (host["servers_up"], host["servers_total"]) == (1, 2)
+    assert host["scur"] == 5
+    assert host["stot"] == 70
+    assert list(snapshot["hosts"]) == ["www.example.org"]
+
+
+def test_host_of_uses_configured_backends():
+    stats, _, _ = make_stats()
+    assert stats.host_of("srv_my_host_local_8080") == ("my.host.local", 8080)
+    assert stats.host_of("srv_dashboard") is None
+
+    stats.backend_hosts = {"srv_my_host_local_8080": "my_host.local"}
+    assert stats.host_of("srv_my_host_local_8080") == ("my_host.local", 8080)
+
+
+def test_snapshot_is_cached_for_the_interval():
+    stats, runtime, clock = make_stats()
+    first = stats.snapshot()
+    clock.now += 1
+    assert stats.snapshot() is first
+    assert runtime.sent == ["@1 show stat", "@1 show info"]
+
+    # Same statistics after the interval: queried again, same version
+    clock.now += 1
+    assert stats.snapshot()["version"] == first["version"]
+    assert len(runtime.sent) == 4
+
+    runtime.stat = stat_output(sessions=4)
+    clock.now += 2
+    assert stats.snapshot()["version"] != first["version"]
+    assert HAProxyStats.etag(stats.snapshot()) == f'"{stats.version}"'
+
+
+def test_delta_returns_only_changes():
+    stats, runtime, clock = make_stats()
+    first = stats.snapshot()["version"]
+
+    runtime.stat = stat_output(sessions=4, www_server_status="DOWN")
+    clock.now += 2
+    delta = stats.delta(first)
+
+    assert delta["full"] is False
+    assert delta["since"] == first
+    assert delta["info"] == {}
+    assert delta["frontends"] == {}
+    assert list(delta["backends"]) == ["srv_www_example_org_80"]
+    assert delta["hosts"]["www.example.org"]["servers_up"] == 0
+    assert delta["removed"] == {"frontends": [], "backends": [], "hosts": []}
+
+    runtime.stat = STAT_HEADER + "\n"
+    clock.now += 2
+    delta = stats.delta(first)
+    assert delta["removed"]["frontends"] == ["http_in_80"]
+    assert delta["removed"]["hosts"] == ["www.example.org"]
+
+
+def test_delta_unknown_version_returns_full_snapshot():
+    stats, _, _ = make_stats()
+    delta = stats.delta("0-1")
+    assert delta["full"] is True
+    assert "srv_www_example_org_80" in delta["backends"]
+
+
+def test_snapshot_reports_errors():
+    stats, runtime, _ = make_stats()
+    runtime.stat = FileNotFoundError("No such file or directory")
+    snapshot = stats.snapshot()
+    assert snapshot["error"] == "No such file or directory"
+    assert snapshot["backends"] == {}
+
+
+def test_dashboard_stats_endpoint():
+    DashboardHandler.stats, _, _ = make_stats()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), DashboardHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+        connection.request("GET", "/api/stats")
+        response = connection.getresponse()
+        content = json.loads(response.read())
+        assert response.status == 200
+        assert content["full"] is True
+        assert response.getheader("ETag") == f'"{content["version"]}"'
+
+        connection.request("GET", "/api/stats", headers={"If-None-Match": response.getheader("ETag")})
+        response = connection.getresponse()
+        response.read()
+        assert response.status == 304
+
+        connection.request("GET", f"/api/stats?since={content['version']}")
+        response = connection.getresponse()
+        response.read()
+        assert response.status == 304
+        connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+        DashboardHandler.stats = None
+        DashboardHandler.credentials_loaded = False
+
+
+def test_dashboard_stats_endpoints_require_the_stats_credentials():
+    DashboardHandler.credentials_loaded = False
+    with patch.dict(os.environ, {"HAPROXY_USERNAME": "admin", "HAPROXY_PASSWORD": "secret"}):
+        assert DashboardHandler.get_credentials() == ("admin", "secret")
+    DashboardHandler.stats, _, _ = make_stats()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), DashboardHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+        for path in ("/api/stats", "/api/cycle", "/metrics"):
+            connection.request("GET", path)
+            response = connection.getresponse()
+            response.read()
+            assert response.status == 401, path
+            assert response.getheader("WWW-Authenticate") == 'Basic realm="Haproxy Statistics"'
+
+        for credentials, status in (("admin:wrong", 401), ("other:secret", 401), ("admin:secret", 200)):
+            authorization = "Basic " + base64.b64encode(credentials.encode()).decode()
+            connection.request("GET", "/api/stats", headers={"Authorization": authorization})
+            response = connection.getresponse()
+            response.read()
+            assert response.status == status, credentials
+
+        connection.request("GET", "/api/stats", headers={"Authorization": "Basic not-base64!"})
+        response = connection.getresponse()
+        response.read()
+        assert response.status == 401
+        connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+        DashboardHandler.stats = None
+        DashboardHandler.credentials = None
+        DashboardHandler.credentials_loaded = False
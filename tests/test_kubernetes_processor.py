@@ -6,15 +6,20 @@ plugin configuration values from Kubernetes Secrets.
 """
 
 import base64
+import json
 import os
 import sys
-from unittest.mock import MagicMock, Mock
+from unittest.mock import MagicMock, Mock, patch
 from types import SimpleNamespace
 
 # Add src to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from kubernetes import watch
+from kubernetes.client.rest import ApiException
+
 from processor import Kubernetes
+from processor.ingress_status import IngressStatusWriter
 
 
 class TestKubernetesSecretPattern:
@@ -416,4 +421,391 @@ class TestKubernetesSecretPattern:
         assert len(parsed) == 1
         ingress_data = list(parsed.values())[0]
 
-        assert "easyhaproxy.test-example-com_8080.plugin.api_plugin.api_key" in ingress_data
\ No newline at end of file
+        assert "easyhaproxy.test-example-com_8080.plugin.api_plugin.api_key" in ingress_data
+
+class TestKubernetesWatch:
+    """Test cases for the informers that cache the Ingresses, Services and Secrets and wake the discovery loop"""
+
+    def create_ingress(self, name, generation=1, annotations=None, resource_version="1"):
+        return SimpleNamespace(metadata=SimpleNamespace(
+            namespace="default", name=name, generation=generation, annotations=annotations or {},
+            labels=None, resource_version=resource_version))
+
+    def create_list(self, items, resource_version="10", _continue=None):
+        return Mock(items=items, metadata=SimpleNamespace(resource_version=resource_version, _continue=_continue))
+
+    def create_processor(self, ingresses):
+        mock_networking_api = MagicMock()
+        mock_networking_api.list_ingress_for_all_namespaces.return_value = self.create_list(ingresses)
+        self.networking_api = mock_networking_api
+        with patch.object(Kubernetes, "inspect_network"):
+            return Kubernetes(api_instance=MagicMock(), v1=mock_networking_api)
+
+    def test_watch_ignores_status_only_updates(self):
+        processor = self.create_processor([self.create_ingress("web")])
+        events = [{"type": "MODIFIED", "object": self.create_ingress("web", resource_version="11")}]
+
+        with patch("processor.informer.watch.Watch") as mock_watch:
+            mock_watch.return_value.stream.return_value = events
+            processor.ingresses.run()
+        processor.changes.clear()
+
+        stream_kwargs = mock_watch.return_value.stream.call_args.kwargs
+        assert stream_kwargs["resource_version"] == "10"
+        assert stream_kwargs["allow_watch_bookmarks"] is True
+        assert processor.ingresses.resource_version == "11"
+
+        # Only the status changed: the latest object is cached, but nothing is notified
+        with patch("processor.informer.watch.Watch") as mock_watch:
+            mock_watch.return_value.stream.return_value = [
+                {"type": "MODIFIED", "object": self.create_ingress("web", resource_version="12")}]
+            processor.ingresses.run()
+        assert not processor.changes.is_set()
+        assert processor.ingresses.get("default", "web").metadata.resource_version == "12"
+
+    def test_watch_notifies_spec_and_annotation_changes(self):
+        processor = self.create_processor([self.create_ingress("web")])
+        processor.ingresses.relist()
+
+        for event in [
+            {"type": "MODIFIED", "object": self.create_ingress("web", generation=2)},
+            {"type": "MODIFIED", "object": self.create_ingress("web", generation=2, annotations={"easyhaproxy.mode": "tcp"})},
+            {"type": "ADDED", "object": self.create_ingress("api")},
+            {"type": "DELETED", "object": self.create_ingress("api")},
+        ]:
+            processor.changes.clear()
+            with patch("processor.informer.watch.Watch") as mock_watch:
+                mock_watch.return_value.stream.return_value = [event]
+                processor.ingresses.run()
+            assert processor.changes.is_set(), event
+        assert [ingress.metadata.name for ingress in processor.ingresses.list()] == ["web"]
+
+    def test_watch_bookmarks_only_move_the_resource_version(self):
+        processor = self.create_processor([self.create_ingress("web")])
+        processor.ingresses.relist()
+
+        # Unmarshalled by the client, which leaves the object of a bookmark as a dict
+        bookmark = watch.Watch().unmarshal_event(json.dumps({
+            "type": "BOOKMARK",
+            "object": {"kind": "Ingress", "apiVersion": "networking.k8s.io/v1",
+                       "metadata": {"resourceVersion": "42"}},
+        }), "V1Ingress")
+        with patch("processor.informer.watch.Watch") as mock_watch:
+            mock_watch.return_value.stream.return_value = [bookmark]
+            processor.ingresses.run()
+
+        assert processor.ingresses.resource_version == "42"
+        assert not processor.changes.is_set()
+        assert len(processor.ingresses.list()) == 1
+
+    def test_watch_relists_when_resource_version_expired(self):
+        processor = self.create_processor([])
+
+        with patch("processor.informer.watch.Watch") as mock_watch:
+            mock_watch.return_value.stream.side_effect = ApiException(status=410)
+            processor.ingresses.run()
+        assert processor.ingresses.resource_version is None
+
+        # The next run lists again, and notifies what changed meanwhile
+        self.networking_api.list_ingress_for_all_namespaces.return_value = self.create_list([self.create_ingress("web")], "20")
+        with patch("processor.informer.watch.Watch") as mock_watch:
+            mock_watch.return_value.stream.return_value = []
+            processor.ingresses.run()
+        assert processor.ingresses.resource_version == "20"
+        assert processor.changes.is_set()
+
+    def test_relist_is_paginated(self):
+        processor = self.create_processor([])
+        self.networking_api.list_ingress_for_all_namespaces.side_effect = [
+            self.create_list([self.create_ingress("web")], _continue="page-2"),
+            self.create_list([self.create_ingress("api")], resource_version="15"),
+        ]
+
+        assert processor.ingresses.relist()
+        calls = self.networking_api.list_ingress_for_all_namespaces.call_args_list
+        assert calls[0].kwargs == {"limit": 500}
+        assert calls[1].kwargs == {"limit": 500, "_continue": "page-2"}
+        assert processor.ingresses.resource_version == "15"
+        assert sorted(ingress.metadata.name for ingress in processor.ingresses.list()) == ["api", "web"]
+
+    def test_inspect_network_reads_from_synced_informers(self):
+        core_api = MagicMock()
+        networking_api = MagicMock()
+        ingress = TestKubernetesSecretPattern().create_mock_ingress({
+            "easyhaproxy.plugins": "jwt_validator",
+            "easyhaproxy.plugin.jwt_validator.k8s_secret.pubkey": "my-jwt-secret"
+        })
+        ingress.metadata.name = "web"
+        service = SimpleNamespace(metadata=SimpleNamespace(namespace="default", name="test-service"),
+                                  spec=SimpleNamespace(cluster_ip="10.96.0.10"))
+        secret = TestKubernetesSecretPattern().create_mock_secret({"pubkey": "key"})
+        secret.metadata = SimpleNamespace(namespace="default", name="my-jwt-secret")
+        networking_api.list_ingress_for_all_namespaces.return_value = self.create_list([ingress])
+        core_api.list_service_for_all_namespaces.return_value = self.create_list([service])
+        core_api.list_secret_for_all_namespaces.return_value = self.create_list([secret])
+
+        with patch.object(Kubernetes, "inspect_network"):
+            processor = Kubernetes(api_instance=core_api, v1=networking_api)
+        for informer in (processor.ingresses, processor.services, processor.secrets):
+            informer.relist()
+        assert core_api.list_secret_for_all_namespaces.call_args.kwargs["field_selector"] == "type!=helm.sh/release.v1"
+        networking_api.reset_mock()
+        core_api.reset_mock()
+
+        with patch.dict(os.environ, {"EASYHAPROXY_UPDATE_INGRESS_STATUS": "false"}):
+            processor.refresh()
+            processor.refresh()
+        parsed = processor.get_parsed_object()
+        assert list(parsed) == ["10.96.0.10"]
+        assert "easyhaproxy.test-example-com_8080.plugin.jwt_validator.pubkey" in parsed["10.96.0.10"]
+        # Every cycle is served from memory
+        assert networking_api.method_calls == []
+        assert core_api.method_calls == [], core_api.method_calls
+
+
+class TestKubernetesEndpoints:
+    """Test cases for the routing to the pod endpoints of the EndpointSlices"""
+
+    def create_endpoint(self, address, ready=True, serving=True, terminating=False):
+        return SimpleNamespace(addresses=[address],
+                               conditions=SimpleNamespace(ready=ready, serving=serving, terminating=terminating))
+
+    def create_processor(self, annotations, endpoint_slices, synced=False):
+        core_api = MagicMock()
+        networking_api = MagicMock()
+        discovery_api = MagicMock()
+        ingress = TestKubernetesSecretPattern().create_mock_ingress(annotations)
+        ingress.metadata.name = "web"
+        service = SimpleNamespace(metadata=SimpleNamespace(namespace="default", name="test-service"),
+                                  spec=SimpleNamespace(cluster_ip="10.96.0.10",
+                                                       ports=[SimpleNamespace(name="http", port=8080)]))
+        networking_api.list_ingress_for_all_namespaces.return_value = Mock(items=[ingress])
+        core_api.read_namespaced_service.return_value = service
+        discovery_api.list_namespaced_endpoint_slice.return_value = Mock(items=endpoint_slices)
+        discovery_api.list_endpoint_slice_for_all_namespaces.return_value = Mock(
+            items=endpoint_slices, metadata=SimpleNamespace(resource_version="5", _continue=None))
+
+        with patch.dict(os.environ, {"EASYHAPROXY_UPDATE_INGRESS_STATUS": "false"}):
+            processor = Kubernetes(api_instance=core_api, v1=networking_api, discovery=discovery_api)
+            if synced:
+                processor.endpoint_slices.relist()
+                discovery_api.list_namespaced_endpoint_slice.reset_mock()
+                processor.refresh()
+        return processor, discovery_api
+
+    def endpoint_slices(self):
+        return [
+            SimpleNamespace(
+                metadata=SimpleNamespace(namespace="default", name="test-service-abc",
+                                         labels={"kubernetes.io/service-name": "test-service"}, resource_version="1"),
+                address_type="IPv4",
+                ports=[SimpleNamespace(name="http", port=80)],
+                endpoints=[self.create_endpoint("10.244.0.5"),
+                           self.create_endpoint("10.244.0.6", ready=False, serving=False),
+                           self.create_endpoint("10.244.0.7", ready=False, serving=True, terminating=True),
+                           self.create_endpoint("10.244.0.8", ready=False, serving=False, terminating=True)]),
+            SimpleNamespace(
+                metadata=SimpleNamespace(namespace="default", name="test-service-v6",
+                                         labels={"kubernetes.io/service-name": "test-service"}, resource_version="1"),
+                address_type="IPv6",
+                ports=[SimpleNamespace(name="http", port=80)],
+                endpoints=[self.create_endpoint("fd00::5")]),
+            SimpleNamespace(
+                metadata=SimpleNamespace(namespace="other", name="test-service-xyz",
+                                         labels={"kubernetes.io/service-name": "test-service"}, resource_version="1"),
+                address_type="IPv4",
+                ports=[SimpleNamespace(name="http", port=80)],
+                endpoints=[self.create_endpoint("10.244.9.9")]),
+        ]
+
+    def test_service_cluster_ip_by_default(self):
+        processor, discovery_api = self.create_processor({}, self.endpoint_slices())
+        assert list(processor.get_parsed_object()) == ["10.96.0.10"]
+        discovery_api.list_namespaced_endpoint_slice.assert_not_called()
+
+    def test_annotation_routes_to_pod_endpoints(self):
+        processor, discovery_api = self.create_processor({"easyhaproxy.backends": "endpoints"},
+                                                         self.endpoint_slices()[:2])
+
+        discovery_api.list_namespaced_endpoint_slice.assert_called_once_with(
+            "default", label_selector="kubernetes.io/service-name=test-service")
+        parsed = processor.get_parsed_object()
+        assert list(parsed) == ["10.244.0.5", "10.244.0.6", "10.244.0.7", "10.244.0.8"]
+        # The target port of the Service port
+        assert parsed["10.244.0.5"]["easyhaproxy.test-example-com_8080.localport"] == 80
+        # A terminating endpoint that no longer serves gets no traffic at all
+        assert processor.get_server_states() == {"10.244.0.6": "maint", "10.244.0.7": "drain", "10.244.0.8": "maint"}
+        assert processor.skipped_endpoint_slices == {"default/test-service-v6"}
+
+        haproxy_conf = processor.get_haproxy_conf()
+        assert "server srv-0 10.244.0.5:80 check weight 1\n" in haproxy_conf
+        assert "server srv-1 10.244.0.6:80 check weight 1 disabled # maint\n" in haproxy_conf
+        assert "server srv-2 10.244.0.7:80 check weight 0 # drain\n" in haproxy_conf
+        assert "10.96.0.10" not in haproxy_conf
+
+    def test_global_setting_reads_synced_endpoint_slices(self):
+        with patch.dict(os.environ, {"EASYHAPROXY_KUBERNETES_BACKENDS": "endpoints"}):
+            processor, discovery_api = self.create_processor({}, self.endpoint_slices(), synced=True)
+
+        discovery_api.list_namespaced_endpoint_slice.assert_not_called()
+        # Only the slices of the Service in the Ingress namespace
+        assert list(processor.get_parsed_object()) == ["10.244.0.5", "10.244.0.6", "10.244.0.7", "10.244.0.8"]
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestIngressStatusWriter:
+    """Test cases for the Ingress status patches"""
+
+    def create_ingress(self, resource_version="1", ips=()):
+        load_balancer = SimpleNamespace(ingress=[SimpleNamespace(ip=ip, hostname=None) for ip in ips])
+        return SimpleNamespace(metadata=SimpleNamespace(namespace="default", name="web",
+                                                        resource_version=resource_version),
+                               status=SimpleNamespace(load_balancer=load_balancer))
+
+    def create_writer(self, patch_function):
+        clock = FakeClock()
+        writer = IngressStatusWriter(patch_function, backoff=5, max_backoff=20, clock=clock)
+        writer.background = False
+        return writer, clock
+
+    def test_patches_only_changed_status(self):
+        patch_function = MagicMock()
+        writer, _ = self.create_writer(patch_function)
+        addresses = [{"ip": "192.0.2.2"}, {"ip": "192.0.2.1"}]
+
+        # Same addresses, in another order
+        assert not writer.update(self.create_ingress(ips=["192.0.2.1", "192.0.2.2"]), addresses)
+        assert writer.update(self.create_ingress(ips=["192.0.2.1"]), addresses)
+        # Already queued
+        assert not writer.update(self.create_ingress(ips=["192.0.2.1"]), addresses)
+        patch_function.assert_not_called()
+
+        writer.run_pending()
+        patch_function.assert_called_once_with(name="web", namespace="default",
+                                               body={"status": {"loadBalancer": {"ingress": addresses}}},
+                                               field_manager="easyhaproxy")
+        assert writer.get_status() == {}
+        # The cached Ingress doesn't have the new status yet
+        assert not writer.update(self.create_ingress(ips=["192.0.2.1"]), addresses)
+        # Seen again with the patched status
+        assert not writer.update(self.create_ingress(resource_version="2", ips=["192.0.2.1", "192.0.2.2"]),
+                                 addresses)
+        assert writer.update(self.create_ingress(resource_version="2", ips=["192.0.2.1", "192.0.2.2"]),
+                             [{"ip": "192.0.2.3"}])
+
+    def test_failed_patches_back_off_exponentially(self):
+        patch_function = MagicMock(side_effect=[ApiException(status=500), ApiException(status=500), None])
+        writer, clock = self.create_writer(patch_function)
+        writer.update(self.create_ingress(), [{"ip": "192.0.2.1"}])
+
+        writer.run_pending()
+        assert writer.get_status()["default/web"]["state"] == "failed"
+        clock.now += 4
+        writer.run_pending()
+        assert patch_function.call_count == 1
+        clock.now += 1
+        writer.run_pending()
+        assert writer.get_status()["default/web"]["failures"] == 2
+        clock.now += 10
+        writer.run_pending()
+        assert patch_function.call_count == 3
+        assert writer.get_status() == {}
+
+    def test_deleted_ingress_is_not_retried(self):
+        patch_function = MagicMock(side_effect=ApiException(status=404))
+        writer, _ = self.create_writer(patch_function)
+        writer.update(self.create_ingress(), [{"ip": "192.0.2.1"}])
+        writer.run_pending()
+        assert writer.get_status() == {}
+
+    def test_inspect_network_queues_changed_status(self):
+        core_api = MagicMock()
+        networking_api = MagicMock()
+        ingress = TestKubernetesSecretPattern().create_mock_ingress({})
+        ingress.status = SimpleNamespace(load_balancer=SimpleNamespace(ingress=None))
+        networking_api.list_ingress_for_all_namespaces.return_value = Mock(items=[ingress])
+        core_api.read_namespaced_service.return_value.spec.cluster_ip = "10.96.0.10"
+
+        # A single replica: no leader election
+        env = {"EASYHAPROXY_DEPLOYMENT_MODE": "clusterip", "EASYHAPROXY_EXTERNAL_HOSTNAME": "lb.example.com",
+               "EASYHAPROXY_LEADER_ELECTION": "false"}
+        with patch.dict(os.environ, env), patch.object(IngressStatusWriter, "background", False):
+            processor = Kubernetes(api_instance=core_api, v1=networking_api)
+            # Queued by the discovery pass, patched by the writer
+            networking_api.patch_namespaced_ingress_status.assert_not_called()
+            processor.status_writer.run_pending()
+            assert networking_api.patch_namespaced_ingress_status.call_count == 1
+
+            ingress.metadata.resource_version = "12346"
+            ingress.status = SimpleNamespace(load_balancer=SimpleNamespace(
+                ingress=[SimpleNamespace(ip=None, hostname="lb.example.com")]))
+            processor.refresh()
+            processor.status_writer.run_pending()
+        assert networking_api.patch_namespaced_ingress_status.call_count == 1
+
+
+class TestKubernetesNodeAddresses:
+    """Test cases for the node addresses reported in the Ingress status"""
+
+    def create_node(self, name, external_ip=None, internal_ip=None, resource_version="1"):
+        addresses = []
+        if internal_ip:
+            addresses.append(SimpleNamespace(type="InternalIP", address=internal_ip))
+        if external_ip:
+            addresses.append(SimpleNamespace(type="ExternalIP", address=external_ip))
+        return SimpleNamespace(metadata=SimpleNamespace(namespace=None, name=name, resource_version=resource_version),
+                               status=SimpleNamespace(addresses=addresses))
+
+    def create_processor(self, pod_nodes):
+        core_api = MagicMock()
+        core_api.list_namespaced_pod.return_value = Mock(items=[SimpleNamespace(spec=SimpleNamespace(node_name=name))
+                                                                for name in pod_nodes])
+        with patch.object(Kubernetes, "inspect_network"):
+            processor = Kubernetes(api_instance=core_api, v1=MagicMock())
+        return processor, core_api
+
+    def test_daemonset_nodes_are_listed_at_once(self):
+        processor, core_api = self.create_processor(["node-b", "node-a", "node-a", "node-c"])
+        core_api.list_node.return_value = Mock(items=[
+            self.create_node("node-a", external_ip="203.0.113.1", internal_ip="10.0.0.1"),
+            self.create_node("node-b", internal_ip="10.0.0.2"),
+        ])
+        # Its hostname label is not its name
+        core_api.read_node.return_value = self.create_node("node-c", internal_ip="10.0.0.3")
+
+        addresses = processor._get_ingress_addresses("daemonset", None)
+
+        assert addresses == [{"ip": "203.0.113.1"}, {"ip": "10.0.0.2"}, {"ip": "10.0.0.3"}]
+        core_api.list_node.assert_called_once_with(label_selector="kubernetes.io/hostname in (node-a,node-b,node-c)")
+        core_api.read_node.assert_called_once_with("node-c")
+
+    def test_synced_nodes_are_read_from_memory(self):
+        processor, core_api = self.create_processor(["node-a"])
+        core_api.list_node.return_value = Mock(
+            items=[self.create_node("node-a", internal_ip="10.0.0.1"), self.create_node("node-b", internal_ip="10.0.0.2")],
+            metadata=SimpleNamespace(resource_version="5", _continue=None))
+        processor.nodes.relist()
+        core_api.list_node.reset_mock()
+
+        assert processor._get_ingress_addresses("daemonset", None) == [{"ip": "10.0.0.1"}]
+        assert processor._get_ingress_addresses("nodeport", None) == [{"ip": "10.0.0.1"}]
+        core_api.list_node.assert_not_called()
+        core_api.read_node.assert_not_called()
+
+        # A status update that keeps the addresses doesn't expire the cache
+        processor.nodes.apply({"type": "MODIFIED",
+                               "object": self.create_node("node-a", internal_ip="10.0.0.1", resource_version="6")})
+        assert processor.ingress_addresses_cache == [{"ip": "10.0.0.1"}]
+        assert not processor.changes.is_set()
+
+        processor.nodes.apply({"type": "MODIFIED",
+                               "object": self.create_node("node-a", external_ip="203.0.113.1", resource_version="7")})
+        assert processor.changes.is_set()
+        assert processor._get_ingress_addresses("nodeport", None) == [{"ip": "203.0.113.1"}, {"ip": "10.0.0.2"}]
@@ -0,0 +1,214 @@
+"""
+Tests for the Lease-based leader election of the Ingress status writer.
+
+FakeCoordinationApi keeps the Leases in memory with the semantics of the API server that the
+election relies on (404 on missing, 409 on existing or outdated resourceVersion), so several
+replicas can be elected against it without a cluster.
+"""
+
+import copy
+import os
+import sys
+from types import SimpleNamespace
+from unittest.mock import MagicMock, Mock, patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kubernetes.client.rest import ApiException
+
+from processor import Kubernetes
+from processor.ingress_status import IngressStatusWriter
+from processor.leader_election import LeaderElector
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeCoordinationApi:
+    """In-memory stand-in for CoordinationV1Api."""
+
+    def __init__(self):
+        self.leases = {}
+        self.version = 0
+        self.down = False
+        # Called once before the next replace, to interleave another replica
+        self.before_replace = None
+
+    def _check(self):
+        if self.down:
+            raise ApiException(status=503, reason="Service Unavailable")
+
+    def _store(self, namespace, body):
+        self.version += 1
+        lease = copy.deepcopy(body)
+        lease.metadata.resource_version = str(self.version)
+        self.leases[(namespace, lease.metadata.name)] = lease
+
+    def read_namespaced_lease(self, name, namespace):
+        self._check()
+        if (namespace, name) not in self.leases:
+            raise ApiException(status=404, reason="Not Found")
+        return copy.deepcopy(self.leases[(namespace, name)])
+
+    def create_namespaced_lease(self, namespace, body):
+        self._check()
+        if (namespace, body.metadata.name) in self.leases:
+            raise ApiException(status=409, reason="AlreadyExists")
+        self._store(namespace, body)
+
+    def replace_namespaced_lease(self, name, namespace, body):
+        self._check()
+        if self.before_replace is not None:
+            before_replace, self.before_replace = self.before_replace, None
+            before_replace()
+        if (namespace, name) not in self.leases:
+            raise ApiException(status=404, reason="Not Found")
+        if body.metadata.resource_version != self.leases[(namespace, name)].metadata.resource_version:
+            raise ApiException(status=409, reason="Conflict")
+        self._store(namespace, body)
+
+    def holder(self, name="status", namespace="default"):
+        return self.leases[(namespace, name)].spec.holder_identity
+
+
+def create_elector(api, identity):
+    clock = FakeClock()
+    changes = []
+    elector = LeaderElector(api, "status", "default", identity, changes.append, lease_duration=15,
+                            renew_deadline=10, retry_period=2, clock=clock)
+    elector.background = False
+    return elector, clock, changes
+
+
+def test_first_replica_creates_the_lease():
+    api = FakeCoordinationApi()
+    elector, clock, changes = create_elector(api, "pod-a")
+
+    assert not elector.is_leader()
+    assert elector.check()
+    assert elector.is_leader()
+    assert api.holder() == "pod-a"
+    assert changes == ["leader of the lease status"]
+
+    clock.now += 2
+    assert elector.check()
+    lease = api.leases[("default", "status")]
+    assert lease.spec.lease_transitions == 0
+    assert lease.metadata.resource_version == "2"
+    # Only notified when the leadership changes
+    assert len(changes) == 1
+
+
+def test_expired_lease_is_taken_over():
+    api = FakeCoordinationApi()
+    leader, leader_clock, leader_changes = create_elector(api, "pod-a")
+    follower, follower_clock, _ = create_elector(api, "pod-b")
+
+    assert leader.check()
+    assert not follower.check()
+    follower_clock.now += 10
+    leader_clock.now += 10
+    assert leader.check()
+    # Renewed: the expiry starts again from the change the follower saw
+    follower_clock.now += 10
+    assert not follower.check()
+
+    # The leader stops renewing
+    follower_clock.now += 15
+    assert follower.check()
+    assert api.holder() == "pod-b"
+    assert api.leases[("default", "status")].spec.lease_transitions == 1
+
+    leader_clock.now += 2
+    assert not leader.check()
+    assert not leader.is_leader()
+    assert leader_changes[-1] == "lost the lease status"
+
+
+def test_concurrent_takeover_has_one_winner():
+    api = FakeCoordinationApi()
+    old, _, _ = create_elector(api, "pod-old")
+    old.check()
+    first, first_clock, _ = create_elector(api, "pod-a")
+    second, second_clock, _ = create_elector(api, "pod-b")
+    first.check()
+    second.check()
+    first_clock.now += 15
+    second_clock.now += 15
+
+    # pod-a takes the expired Lease between the read and the update of pod-b
+    api.before_replace = first.check
+    assert not second.check()
+    assert first.is_leader()
+    assert api.holder() == "pod-a"
+
+
+def test_leader_steps_down_when_it_cannot_renew():
+    api = FakeCoordinationApi()
+    elector, clock, changes = create_elector(api, "pod-a")
+    elector.check()
+
+    api.down = True
+    clock.now += 5
+    assert elector.check()
+    clock.now += 5
+    assert not elector.check()
+    assert changes == ["leader of the lease status", "lost the lease status"]
+
+    api.down = False
+    assert elector.check()
+    assert api.leases[("default", "status")].spec.lease_transitions == 0
+
+
+def test_only_the_leader_writes_ingress_status():
+    api = FakeCoordinationApi()
+    ingress = Mock()
+    ingress.metadata.namespace = "default"
+    ingress.metadata.name = "web"
+    ingress.metadata.annotations = {}
+    ingress.metadata.resource_version = "1"
+    ingress.spec.tls = None
+    ingress.spec.ingress_class_name = "easyhaproxy"
+    ingress.spec.rules = []
+    ingress.status = SimpleNamespace(load_balancer=SimpleNamespace(ingress=None))
+
+    replicas = []
+    env = {"EASYHAPROXY_DEPLOYMENT_MODE": "clusterip", "EASYHAPROXY_EXTERNAL_HOSTNAME": "lb.example.com",
+           "POD_NAMESPACE": "default", "EASYHAPROXY_LEADER_ELECTION": "true"}
+    with patch.dict(os.environ, env), patch.object(IngressStatusWriter, "background", False), \
+            patch.object(LeaderElector, "background", False):
+        for identity in ("pod-a", "pod-b"):
+            core_api = MagicMock()
+            networking_api = MagicMock()
+            networking_api.list_ingress_for_all_namespaces.return_value = Mock(items=[ingress])
+            with patch("socket.gethostname", return_value=identity):
+                processor = Kubernetes(api_instance=core_api, v1=networking_api, coordination=api)
+            replicas.append((processor, core_api, networking_api))
+
+        for processor, _, _ in replicas:
+            processor.leader.check()
+            processor.refresh()
+            processor.status_writer.run_pending()
+
+    (leader, leader_core, leader_networking), (follower, follower_core, follower_networking) = replicas
+    assert leader.leader.is_leader()
+    assert not follower.leader.is_leader()
+    assert leader_networking.patch_namespaced_ingress_status.call_count == 1
+    follower_networking.patch_namespaced_ingress_status.assert_not_called()
+    # The follower doesn't look up the addresses either
+    follower_core.read_namespaced_service.assert_not_called()
+    # Both replicas discover
+    assert follower_networking.list_ingress_for_all_namespaces.called
+
+
+def test_election_is_off_by_default():
+    # Installs whose RBAC doesn't grant the leases keep writing the status
+    with patch.object(Kubernetes, "inspect_network"):
+        processor = Kubernetes(api_instance=MagicMock(), v1=MagicMock(), coordination=FakeCoordinationApi())
+    assert processor.leader is None
+    assert processor._leads_ingress_status()
@@ -0,0 +1,103 @@
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from functions import ApiCallCounter
+from functions.metrics import API_CALLS, MetricsRegistry
+
+
+def test_metrics_registry_render():
+    registry = MetricsRegistry()
+    reloads = registry.counter("test_reloads_total", "Reloads.")
+    reasons = registry.counter("test_reasons_total", "Reasons.", ["reason"])
+    hosts = registry.gauge("test_hosts", "Hosts.")
+    duration = registry.histogram("test_duration_seconds", "Duration.", ["phase"], buckets=(0.1, 1))
+
+    reloads.inc()
+    reasons.inc(reason='config "changed"')
+    reasons.inc(2, reason='config "changed"')
+    hosts.set(3)
+    duration.observe(0.05, phase="parse")
+    duration.observe(0.5, phase="parse")
+
+    assert registry.render() == "\n".join([
+        "# HELP test_reloads_total Reloads.",
+        "# TYPE test_reloads_total counter",
+        "test_reloads_total 1",
+        "# HELP test_reasons_total Reasons.",
+        "# TYPE test_reasons_total counter",
+        'test_reasons_total{reason="config \\"changed\\""} 3',
+        "# HELP test_hosts Hosts.",
+        "# TYPE test_hosts gauge",
+        "test_hosts 3",
+        "# HELP test_duration_seconds Duration.",
+        "# TYPE test_duration_seconds histogram",
+        'test_duration_seconds_bucket{phase="parse",le="0.1"} 1',
+        'test_duration_seconds_bucket{phase="parse",le="1"} 2',
+        'test_duration_seconds_bucket{phase="parse",le="+Inf"} 2',
+        'test_duration_seconds_sum{phase="parse"} 0.55',
+        'test_duration_seconds_count{phase="parse"} 2',
+    ]) + "\n"
+
+
+def test_metrics_registry_collectors_and_labels():
+    registry = MetricsRegistry()
+    gauge = registry.gauge("test_expiry", "Expiry.", ["certificate"])
+    registry.add_collector(lambda: gauge.set(10, certificate="a"))
+
+    assert 'test_expiry{certificate="a"} 10' in registry.render()
+    with pytest.raises(ValueError):
+        gauge.set(1, host="a")
+    with pytest.raises(ValueError):
+        registry.gauge("test_expiry", "Again.")
+
+
+def test_metrics_gauge_replace():
+    registry = MetricsRegistry()
+    gauge = registry.gauge("test_expiry", "Expiry.", ["certificate"])
+    gauge.set(10, certificate="a")
+    gauge.set(20, certificate="b")
+
+    gauge.replace([(30, {"certificate": "b"}), (40, {"certificate": "c"})])
+    assert gauge.get(certificate="a") is None
+    assert gauge.get(certificate="b") == 30
+    assert gauge.get(certificate="c") == 40
+    with pytest.raises(ValueError):
+        gauge.replace([(1, {"host": "a"})])
+    # A rejected replace keeps the previous values
+    assert gauge.get(certificate="c") == 40
+
+
+def test_metrics_concurrent_collectors_never_render_partial_gauges():
+    registry = MetricsRegistry()
+    gauge = registry.gauge("test_expiry", "Expiry.", ["certificate"])
+    registry.add_collector(lambda: gauge.replace([(index, {"certificate": f"c{index}"}) for index in range(50)]))
+    partial = []
+
+    def scrape():
+        for _ in range(50):
+            if registry.render().count("test_expiry{") != 50:
+                partial.append(True)
+
+    threads = [threading.Thread(target=scrape) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert partial == []
+
+
+def test_api_call_counter():
+    client = MagicMock()
+    client.containers.list.return_value = ["container"]
+    counted = ApiCallCounter(client, "test")
+
+    before_list = API_CALLS.get(processor="test", call="containers.list")
+    before_events = API_CALLS.get(processor="test", call="events")
+    assert counted.containers.list(all=True) == ["container"]
+    counted.events(decode=True)
+
+    client.containers.list.assert_called_once_with(all=True)
+    assert API_CALLS.get(processor="test", call="containers.list") == before_list + 1
+    assert API_CALLS.get(processor="test", call="events") == before_events + 1
@@ -0,0 +1,93 @@
+import threading
+
+from processor.network_attacher import NetworkAttacher
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FlakyAttach:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+
+    def __call__(self, key):
+        self.calls.append(key)
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError("network is busy")
+
+
+def make_attacher(attach, on_attached=None):
+    clock = FakeClock()
+    attacher = NetworkAttacher("test", attach, on_attached, backoff=5, max_backoff=20, settle_time=60, clock=clock)
+    attacher.background = False
+    return attacher, clock
+
+
+def test_request_is_idempotent():
+    attach = FlakyAttach()
+    attached = []
+    attacher, clock = make_attacher(attach, attached.append)
+
+    assert attacher.request("c1", "c1")
+    assert not attacher.request("c1", "c1")
+    attacher.run_pending()
+    assert attach.calls == ["c1"]
+    assert attached == ["c1"]
+
+    # Just attached: the discovery may not see it yet
+    clock.now += 30
+    assert not attacher.request("c1", "c1")
+    clock.now += 30
+    assert attacher.request("c1", "c1")
+
+
+def test_failed_attempts_back_off_exponentially():
+    attach = FlakyAttach(failures=4)
+    attacher, clock = make_attacher(attach)
+
+    attacher.request("c1", "c1")
+    delays = []
+    for _ in range(4):
+        attacher.run_pending()
+        status = attacher.get_status()["c1"]
+        assert status["state"] == "failed"
+        assert status["error"] == "network is busy"
+        # Retried by the worker, not by new requests
+        assert not attacher.request("c1", "c1")
+        delays.append(attacher.attempts["c1"]["next_attempt"] - clock.now)
+        clock.now += delays[-1] - 1
+        attacher.run_pending()
+        assert len(attach.calls) == len(delays)
+        clock.now += 1
+
+    assert delays == [5, 10, 20, 20]
+    attacher.run_pending()
+    assert attacher.get_status() == {}
+    assert len(attach.calls) == 5
+
+
+def test_retain_and_discard_forget_keys():
+    attacher, _ = make_attacher(FlakyAttach(failures=1))
+    attacher.request("c1", "c1")
+    attacher.request("c2", "c2")
+    attacher.retain({"c2"})
+    assert list(attacher.get_status()) == ["c2"]
+
+    attacher.discard("c2")
+    assert attacher.get_status() == {}
+
+
+def test_background_worker_runs_requests():
+    done = threading.Event()
+    attacher = NetworkAttacher("test", lambda key: None, lambda key: done.set())
+
+    assert attacher.request("c1", "c1")
+    assert done.wait(5)
+    assert attacher.attempts["c1"]["state"] == "attached"
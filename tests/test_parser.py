@@ -302,6 +302,45 @@ def test_parser_static_raw():
     assert expected == parsed
 
 
+def test_parser_reset_reuses_generator():
+    line_list = load_fixture("services")
+
+    def mapping():
+        return {
+            "customerrors": False,
+            "certbot": {
+                "email": CERTBOT_EMAIL
+            },
+            "stats": {
+                "port": 0
+            }
+        }
+
+    cfg = easymapping.HaproxyConfigGenerator(mapping())
+    plugin_manager = cfg.plugin_manager
+    first_config = cfg.generate(line_list)
+
+    cfg.reset(mapping())
+    assert cfg.plugin_manager is plugin_manager
+    assert [] == cfg.certbot_hosts
+    assert [] == cfg.serving_hosts
+    assert {} == cfg.certs
+
+    assert first_config == cfg.generate(line_list)
+    assert {"www.somehost.com.br.pem": "Some PEM Certificate"} == cfg.certs
+    assert ['node-exporter.quantum.example.org'] == cfg.certbot_hosts
+
+
+def test_parser_template_environment_is_shared():
+    from easymapping.config_generator import get_template_environment
+
+    env = get_template_environment()
+    assert env is get_template_environment()
+    assert env.auto_reload is True
+    assert env.bytecode_cache is not None
+    assert env.get_template('haproxy.cfg.j2') is env.get_template('haproxy.cfg.j2')
+
+
 def test_parser_tcp():
     line_list = load_fixture("services-tcp")
 
@@ -343,6 +382,26 @@ def test_parser_multi_containers():
     assert [] == cfg.certbot_hosts
 
 
+def test_parser_swarm_dns():
+    line_list = load_fixture("services-swarm-dns")
+
+    result = {
+        "customerrors": False,
+        "stats": {
+            "port": 0
+        }
+    }
+
+    cfg = easymapping.HaproxyConfigGenerator(result)
+    haproxy_config = cfg.generate(line_list, resolvers={key: "docker" for key in line_list})
+
+    assert len(haproxy_config) > 0
+    path = os.path.dirname(os.path.realpath(__file__))
+    with open(path + "/expected/services-swarm-dns.txt") as expected_file:
+        assert expected_file.read() == haproxy_config
+    assert [] == cfg.certbot_hosts
+
+
 def test_parser_multiple_hosts():
     line_list = load_fixture("services-multiple-hosts")
 
@@ -448,6 +507,43 @@ def test_parser_ssl_letsencrypt():
     assert ["test.example.org"] == cfg.certbot_hosts
 
 
+def test_parser_host_map_routing():
+    from functions import Consts
+
+    line_list = load_fixture("services-letsencrypt")
+
+    result = {
+        "customerrors": False,
+        "host_map": True,
+        "stats": {
+            "port": 0
+        },
+        "certbot": {
+            "email": CERTBOT_EMAIL
+        }
+    }
+
+    cfg = easymapping.HaproxyConfigGenerator(result)
+    haproxy_config = cfg.generate(line_list)
+
+    assert "acl is_rule_" not in haproxy_config
+    assert (f"    acl is_certbot_host req.hdr(host),lower -m str -f {Consts.maps_haproxy}/certbot_80.lst\n"
+            f"    acl is_redirect_ssl_host req.hdr(host),lower -m str -f {Consts.maps_haproxy}/redirect_ssl_80.lst\n"
+            "    http-request redirect scheme https code 301 if is_redirect_ssl_host !is_certbot OR is_redirect_ssl_host !is_certbot_host\n"
+            "    use_backend certbot_backend if is_certbot is_certbot_host\n"
+            f"    use_backend %[req.hdr(host),lower,map({Consts.maps_haproxy}/hosts_80.map)]\n") in haproxy_config
+    assert f"    use_backend %[req.hdr(host),lower,map({Consts.maps_haproxy}/hosts_443.map)]\n" in haproxy_config
+    assert "backend srv_test_example_org_443" in haproxy_config
+
+    assert {
+        "hosts_80.map": "test2.example.org srv_test2_example_org_80\ntest2.example.org:80 srv_test2_example_org_80\n",
+        "certbot_80.lst": "test.example.org\ntest.example.org:80\n",
+        "redirect_ssl_80.lst": "test.example.org\ntest.example.org:80\n",
+        "hosts_443.map": "test.example.org srv_test_example_org_443\ntest.example.org:443 srv_test_example_org_443\n",
+    } == cfg.maps
+    assert ["test.example.org"] == cfg.certbot_hosts
+
+
 def test_parser_finds_services_clone_to_ssl_raw():
     line_list = load_fixture("services-clone-to-ssl")
 
@@ -1271,6 +1271,57 @@ class TestPluginManager:
         results = manager.execute_global_plugins(context, enabled_list=[])
         assert len(results) == 0
 
+    def test_plugin_manager_reload_if_changed(self):
+        """Test plugins are reloaded only when a plugin file is added or modified"""
+        plugin_source = (
+            "from plugins import PluginInterface, PluginResult, PluginType\n"
+            "class ReloadTestPlugin(PluginInterface):\n"
+            "    name = 'reload_test'\n"
+            "    plugin_type = PluginType.GLOBAL\n"
+            "    def configure(self, config):\n"
+            "        pass\n"
+            "    def process(self, context):\n"
+            "        return PluginResult(haproxy_config='# {marker}')\n"
+        )
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            manager = PluginManager(plugins_dir=tmpdir)
+            manager.load_plugins()
+            assert "reload_test" not in manager.plugins
+            assert manager.reload_if_changed() is False
+
+            plugin_file = os.path.join(tmpdir, "reload_test.py")
+            with open(plugin_file, "w") as f:
+                f.write(plugin_source.format(marker="v1"))
+            assert manager.reload_if_changed() is True
+            assert "reload_test" in manager.plugins
+            assert manager.reload_if_changed() is False
+
+            with open(plugin_file, "w") as f:
+                f.write(plugin_source.format(marker="v2"))
+            mtime = os.path.getmtime(plugin_file) + 10
+            os.utime(plugin_file, (mtime, mtime))
+            assert manager.reload_if_changed() is True
+
+            context = PluginContext(parsed_object={}, easymapping=[], container_env={})
+            results = manager.execute_global_plugins(context, enabled_list=["reload_test"])
+            assert results[0].haproxy_config == "# v2"
+
+    def test_plugin_manager_reset_plugins(self):
+        """Test reset_plugins drops instance configuration without reloading modules"""
+        manager = PluginManager()
+        manager.load_plugins()
+        manager.plugins["ip_whitelist"].configure({"allowed_ips": "10.0.0.1"})
+        old_instance = manager.plugins["ip_whitelist"]
+
+        manager.reset_plugins()
+
+        assert manager.plugins["ip_whitelist"] is not old_instance
+        assert type(manager.plugins["ip_whitelist"]) is type(old_instance)
+        assert manager.plugins["ip_whitelist"].allowed_ips == []
+        assert len(manager.global_plugins) == 1
+        assert len(manager.domain_plugins) == 5
+
 
 class TestMultiplePluginsCombined:
     """Test cases for multiple plugins working together"""
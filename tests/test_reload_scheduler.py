@@ -0,0 +1,102 @@
+from functions import ReloadScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def create_scheduler(clock):
+    return ReloadScheduler(quiet_period=2, min_interval=5, max_delay=30, clock=clock)
+
+
+def test_reload_scheduler_nothing_pending():
+    scheduler = create_scheduler(FakeClock())
+
+    assert scheduler.wait_time() is None
+    assert not scheduler.due()
+    assert scheduler.pending == 0
+
+
+def test_reload_scheduler_waits_quiet_period():
+    clock = FakeClock()
+    scheduler = create_scheduler(clock)
+
+    scheduler.request("configuration changed")
+    assert scheduler.wait_time() == 2
+    clock.now += 1
+    scheduler.request("certificates changed")
+    assert scheduler.wait_time() == 2
+    clock.now += 2
+    assert scheduler.due()
+
+    assert scheduler.reloaded() == ["configuration changed", "certificates changed"]
+    assert scheduler.pending == 0
+
+
+def test_reload_scheduler_min_interval_between_reloads():
+    clock = FakeClock()
+    scheduler = create_scheduler(clock)
+    scheduler.request("configuration changed", urgent=True)
+    scheduler.reloaded()
+
+    scheduler.request("configuration changed")
+    clock.now += 2
+    assert scheduler.wait_time() == 3
+    clock.now += 3
+    assert scheduler.due()
+
+
+def test_reload_scheduler_max_delay():
+    clock = FakeClock()
+    scheduler = create_scheduler(clock)
+
+    for _ in range(29):
+        scheduler.request("configuration changed")
+        clock.now += 1
+        assert not scheduler.due()
+
+    scheduler.request("configuration changed")
+    assert scheduler.wait_time() == 1
+    clock.now += 1
+    assert scheduler.due()
+    assert len(scheduler.reloaded()) == 30
+
+
+def test_reload_scheduler_urgent():
+    clock = FakeClock()
+    scheduler = create_scheduler(clock)
+    scheduler.request("configuration changed")
+    scheduler.reloaded()
+
+    scheduler.request("HAProxy is not running", urgent=True)
+    assert scheduler.due()
+    scheduler.reloaded()
+
+    scheduler.request("configuration changed")
+    assert not scheduler.due()
+
+
+def test_reload_scheduler_settings_from_environment(monkeypatch):
+    monkeypatch.setenv("EASYHAPROXY_RELOAD_QUIET_PERIOD", "0")
+    monkeypatch.setenv("EASYHAPROXY_RELOAD_MIN_INTERVAL", "invalid")
+    scheduler = ReloadScheduler()
+
+    assert scheduler.quiet_period == 0
+    assert scheduler.min_interval == 5
+    assert scheduler.max_delay == 30
+
+
+def test_reload_scheduler_cancel_keeps_last_reload():
+    clock = FakeClock()
+    scheduler = create_scheduler(clock)
+    scheduler.request("configuration changed", urgent=True)
+    scheduler.reloaded()
+
+    scheduler.request("configuration changed")
+    scheduler.cancel()
+    assert scheduler.wait_time() is None
+    assert scheduler.last_reload == 100.0
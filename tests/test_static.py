@@ -1,4 +1,5 @@
 import os
+from unittest.mock import patch
 
 from functions import Functions
 from processor import ProcessorInterface
@@ -91,6 +92,121 @@ def test_processor_static_multiple_domains_same_container():
     assert haproxy_cfg.count('server srv-0 webapp:8080') == 2
 
 
+def test_processor_static_refresh_keeps_generator():
+    """Test that refresh() reuses the config generator and its plugin manager"""
+    ProcessorInterface.static_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), "./fixtures/static.yml")
+    static = ProcessorInterface.factory(ProcessorInterface.STATIC)
+
+    cfg = static.cfg
+    plugin_manager = cfg.plugin_manager
+    first_cfg = static.get_haproxy_conf()
+
+    static.refresh()
+
+    assert static.cfg is cfg
+    assert static.cfg.plugin_manager is plugin_manager
+    assert static.get_hosts() is None
+    assert static.get_haproxy_conf() == first_cfg
+    assert static.get_certbot_hosts() == ['host1.com.br']
+
+
+def test_processor_static_save_maps_removes_stale_maps(tmp_path):
+    """Test that the maps not generated anymore are removed, and the other files are kept"""
+    ProcessorInterface.static_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), "./fixtures/static.yml")
+    static = ProcessorInterface.factory(ProcessorInterface.STATIC)
+
+    static.cfg.maps = {"hosts_80.map": "a.com srv_a_com_80\n", "certbot_80.lst": "a.com\n",
+                       "hosts_8080.map": "b.com srv_b_com_8080\n"}
+    static.save_maps(str(tmp_path))
+    (tmp_path / "notes.txt").write_text("kept")
+
+    # Port 8080 and the certbot list are gone
+    static.cfg.maps = {"hosts_80.map": "a.com srv_a_com_80\nc.com srv_c_com_80\n"}
+    static.save_maps(str(tmp_path))
+
+    assert sorted(entry.name for entry in tmp_path.iterdir()) == ["hosts_80.map", "notes.txt"]
+    assert (tmp_path / "hosts_80.map").read_text() == "a.com srv_a_com_80\nc.com srv_c_com_80\n"
+
+
+class StopWatcher(BaseException):
+    """Ends the watcher loop, which only catches Exception"""
+
+
+def run_watcher(stream_durations, sleeps_before_stop):
+    """
+    Run a watcher in the calling thread. Each run of the stream lasts the next duration (None
+    raises an error instead). Returns the delays it slept, with "resync" for the changes notified.
+    """
+    ProcessorInterface.static_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), "./fixtures/static.yml")
+    static = ProcessorInterface.factory(ProcessorInterface.STATIC)
+    clock = [1000.0]
+    durations = iter(stream_durations)
+    calls = []
+    static.notify_change = lambda reason: calls.append("resync")
+
+    def stream():
+        duration = next(durations)
+        if duration is None:
+            raise ConnectionError("connection refused")
+        clock[0] += duration
+
+    def sleep(delay):
+        calls.append(delay)
+        if sum(1 for call in calls if call != "resync") == sleeps_before_stop:
+            raise StopWatcher()
+
+    class InlineThread:
+        def __init__(self, target, **kwargs):
+            self.target = target
+
+        def start(self):
+            try:
+                self.target()
+            except StopWatcher:
+                pass
+
+    with patch("processor.interface.threading.Thread", InlineThread), \
+            patch("processor.interface.time.sleep", sleep), \
+            patch("processor.interface.time.monotonic", lambda: clock[0]):
+        static._start_watcher("test", stream)
+    return calls
+
+
+def test_processor_watcher_backs_off_when_the_stream_ends_right_away():
+    """Test that a stream closed right after it connects is not reconnected in a tight loop"""
+    assert run_watcher([0, 0, 0, 0], 4) == [1, 2, 4, 8]
+
+
+def test_processor_watcher_backoff_starts_over_after_a_long_stream():
+    """Test that a stream that timed out after a while reconnects at once and resets the backoff"""
+    # Failures request a resync; the stream that ran for 300s reconnects without sleeping
+    assert run_watcher([None, None, 300, 0, None], 4) == [1, "resync", 2, "resync", 1, 2]
+
+
+def test_processor_static_fingerprints():
+    """Test that the per-container fingerprints detect the containers that changed"""
+    ProcessorInterface.static_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), "./fixtures/static.yml")
+    static = ProcessorInterface.factory(ProcessorInterface.STATIC)
+
+    fingerprints = static.get_fingerprints()
+    assert set(fingerprints) == set(static.get_parsed_object())
+    assert static.get_changed_keys(fingerprints) == ([], [], [])
+
+    static.refresh()
+    assert static.get_fingerprints() == fingerprints
+
+    # Key order doesn't change the fingerprint
+    assert ProcessorInterface.fingerprint({"a": "1", "b": "2"}) == ProcessorInterface.fingerprint({"b": "2", "a": "1"})
+    assert ProcessorInterface.fingerprint({"a": "1"}) != ProcessorInterface.fingerprint({"a": "2"})
+
+    old_fingerprints = dict(fingerprints, removed="x", container="y")
+    del old_fingerprints[next(key for key in fingerprints if key != "container")]
+    added, removed, modified = static.get_changed_keys(old_fingerprints)
+    assert len(added) == 1
+    assert removed == ["removed"]
+    assert modified == ["container"]
+
+
 def test_processor_static_with_cors():
     """Test that CORS configuration is properly generated when cors_origin is set"""
     ProcessorInterface.static_file = os.path.join(
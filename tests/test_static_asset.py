@@ -0,0 +1,109 @@
+import gzip
+import http.client
+import os
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from functions import Consts, StaticAsset
+
+
+@pytest.fixture
+def dashboard_file():
+    os.makedirs(Consts.www_path, exist_ok=True)
+    path = os.path.join(Consts.www_path, "dashboard.html")
+    with open(path, "w") as f:
+        f.write("<html>version 1</html>")
+    yield path
+    os.remove(path)
+
+
+def rewrite(path, content):
+    stat = os.stat(path)
+    with open(path, "w") as f:
+        f.write(content)
+    # Make sure the mtime changes even on filesystems with coarse timestamps
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_select_negotiates_encoding(dashboard_file):
+    asset = StaticAsset(dashboard_file, "text/html")
+
+    body, etag, encoding = asset.select(None)
+    assert (body, encoding) == (b"<html>version 1</html>", None)
+
+    gzip_body, gzip_etag, encoding = asset.select("gzip;q=1.0, deflate")
+    assert encoding == "gzip"
+    assert gzip.decompress(gzip_body) == body
+    assert gzip_etag != etag
+
+    assert asset.select("gzip;q=0, identity")[2] is None
+
+
+def test_select_reloads_on_mtime_change(dashboard_file):
+    asset = StaticAsset(dashboard_file, "text/html")
+    _, etag, _ = asset.select(None)
+    assert asset.select(None)[1] == etag
+
+    rewrite(dashboard_file, "<html>version 2</html>")
+
+    body, new_etag, _ = asset.select(None)
+    assert body == b"<html>version 2</html>"
+    assert new_etag != etag
+
+
+def test_select_missing_file():
+    asset = StaticAsset("/tmp/easyhaproxy-no-such-file.html", "text/html")
+    assert asset.select(None) == (b"", '"e3b0c44298fc1c149afbf4c8996fb924"', None)
+
+
+def test_etag_matches():
+    assert StaticAsset.etag_matches('"abc"', '"abc"')
+    assert StaticAsset.etag_matches('"xyz", W/"abc"', '"abc"')
+    assert StaticAsset.etag_matches("*", '"abc"')
+    assert not StaticAsset.etag_matches('"abc-gzip"', '"abc"')
+    assert not StaticAsset.etag_matches(None, '"abc"')
+
+
+def test_dashboard_handler_conditional_requests(dashboard_file):
+    from easyhaproxy.main import DashboardHandler
+
+    DashboardHandler.dashboard = None
+    server = ThreadingHTTPServer(("127.0.0.1", 0), DashboardHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+
+        connection.request("GET", "/dashboard.html", headers={"Accept-Encoding": "gzip"})
+        response = connection.getresponse()
+        body = response.read()
+        assert response.status == 200
+        assert response.getheader("Content-Encoding") == "gzip"
+        assert response.getheader("Cache-Control") == "no-cache"
+        assert response.getheader("Vary") == "Accept-Encoding"
+        assert gzip.decompress(body) == b"<html>version 1</html>"
+        etag = response.getheader("ETag")
+
+        # Same connection (keep-alive), conditional request
+        connection.request("GET", "/", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+        response = connection.getresponse()
+        assert response.read() == b""
+        assert response.status == 304
+        assert response.getheader("ETag") == etag
+
+        rewrite(dashboard_file, "<html>version 2</html>")
+        connection.request("GET", "/", headers={"If-None-Match": etag})
+        response = connection.getresponse()
+        assert response.status == 200
+        assert response.read() == b"<html>version 2</html>"
+
+        connection.request("GET", "/unknown")
+        response = connection.getresponse()
+        response.read()
+        assert response.status == 404
+        connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+        DashboardHandler.dashboard = None